@@ -0,0 +1,213 @@
+'''
+Load test: the WSGI app under gunicorn against the ASGI app under uvicorn.
+
+Run from the backend directory (needs gunicorn and uvicorn installed):
+
+    python -m benchmarks.bench_asgi_load
+    python -m benchmarks.bench_asgi_load --clients 100 500 1000 --seconds 20 \
+        --database-url postgres://cc:cc@localhost:5432/trivia
+
+Each server runs one worker process with the same concurrency limit
+(gunicorn gthread threads, ASGI_MAX_CONCURRENCY) against the same
+database. Every client keeps one HTTP/1.1 connection open and sends the
+request mix back to back; requests/sec and latency percentiles are
+reported per server and client count. The default mix is a paginated
+question list (usually answered from the response cache) and a quiz
+question (always queries the database). Without --database-url a
+temporary SQLite file is bootstrapped with the sample data.
+'''
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_REQUESTS = [
+    'GET /questions?page=1',
+    'POST /quizzes {"previous_questions": [], "quiz_category": {"id": 0}}',
+]
+SERVERS = ('wsgi', 'asgi')
+
+
+def serve(kind, database_url, port, concurrency):
+    config = {'SQLALCHEMY_DATABASE_URI': database_url, 'LEADERBOARD_FLUSH_INTERVAL': None}
+    if kind == 'asgi':
+        import uvicorn
+        from flaskr.asgi import create_asgi_app
+        config['ASGI_MAX_CONCURRENCY'] = concurrency
+        uvicorn.run(create_asgi_app(config), host='127.0.0.1', port=port, log_level='warning',
+                    backlog=4096, timeout_keep_alive=60)
+        return
+
+    from gunicorn.app.base import BaseApplication
+    from flaskr import create_app
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {'bind': '127.0.0.1:{}'.format(port), 'workers': 1,
+                               'worker_class': 'gthread', 'threads': concurrency,
+                               'worker_connections': 10000, 'backlog': 4096,
+                               'keepalive': 60, 'loglevel': 'warning'}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app(config)
+
+    Server().run()
+
+
+def parse_request(spec):
+    method, rest = spec.split(' ', 1)
+    path, _, body = rest.partition(' ')
+    body = body.encode('utf-8')
+    head = '{} {} HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: identity\r\n'.format(method, path)
+    if body:
+        head += 'Content-Type: application/json\r\nContent-Length: {}\r\n'.format(len(body))
+    return (head + '\r\n').encode('latin-1') + body
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length, chunked = None, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def client(port, requests, deadline, latencies, errors):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        errors.append('connect')
+        return
+    index = 0
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(requests[index % len(requests)])
+            index += 1
+            status = await read_response(reader)
+            if status >= 400:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - started)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+        errors.append('connection')
+    finally:
+        writer.close()
+
+
+async def load(port, requests, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*[client(port, requests, deadline, latencies, errors) for _ in range(clients)])
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] if samples else float('nan')
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server on port {} did not start'.format(port))
+
+
+def run(args, database_url):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    requests = [parse_request(spec) for spec in args.request or DEFAULT_REQUESTS]
+    print('{:>5} {:>8} {:>10} {:>9} {:>9} {:>9} {:>8}'.format(
+        'mode', 'clients', 'req/s', 'p50 ms', 'p99 ms', 'max ms', 'errors'))
+    for kind in args.servers:
+        port = free_port()
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_asgi_load', '--serve', kind,
+                                   '--port', str(port), '--concurrency', str(args.concurrency),
+                                   '--database-url', database_url], cwd=backend)
+        try:
+            wait_for(port)
+            asyncio.run(load(port, requests, 10, 1.0))  # warm up
+            for clients in args.clients:
+                latencies, errors, elapsed = asyncio.run(load(port, requests, clients, args.seconds))
+                ms = [latency * 1000 for latency in latencies]
+                print('{:>5} {:>8} {:>10.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8}'.format(
+                    kind, clients, len(latencies) / elapsed,
+                    statistics.median(ms) if ms else float('nan'), percentile(ms, 99),
+                    max(ms) if ms else float('nan'), len(errors)))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of every measurement')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='gunicorn threads / ASGI_MAX_CONCURRENCY (and pool_size)')
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--request', action='append',
+                        help='"METHOD /path [json body]", repeat for a mix (default: {})'.format(
+                            ' and '.join(DEFAULT_REQUESTS)))
+    parser.add_argument('--database-url', default=None,
+                        help='an already bootstrapped database, defaults to a temporary SQLite file')
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.database_url, args.port, args.concurrency)
+        return
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'load.db')
+        from flaskr import create_app
+        from flaskr.bootstrap import bootstrap
+        app = create_app({'SQLALCHEMY_DATABASE_URI': url})
+        with app.app_context():
+            bootstrap(seed=True)
+        run(args, url)
+
+
+if __name__ == '__main__':
+    main()
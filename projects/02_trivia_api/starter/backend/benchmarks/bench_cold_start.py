@@ -0,0 +1,100 @@
+'''
+Cold start of the trivia app: imports, create_app and the first request.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --runs 20 --database-url postgres://cc:cc@localhost:5432/trivia
+
+Every run is a fresh interpreter. Besides the current startup path it
+times the two steps every boot used to pay for, db.create_all() and the
+eager import of Flask-Migrate/alembic, so the saving is visible on the
+database at hand. Without --database-url a temporary SQLite file is
+bootstrapped once and reused.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STEPS = ('import flaskr', 'create_app', 'first request', 'total')
+LEGACY_STEPS = ('db.create_all', 'import flask_migrate')
+
+
+def child(database_url):
+    started = time.perf_counter()
+    from flaskr import create_app
+    imported = time.perf_counter()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    created = time.perf_counter()
+    res = app.test_client().get('/categories')
+    assert res.status_code == 200, res.data
+    served = time.perf_counter()
+
+    from models import db
+    with app.app_context():
+        db.create_all()
+    created_all = time.perf_counter()
+    import flask_migrate  # noqa: F401
+    migrate_imported = time.perf_counter()
+
+    print(json.dumps({
+        'import flaskr': imported - started,
+        'create_app': created - imported,
+        'first request': served - created,
+        'total': served - started,
+        'db.create_all': created_all - served,
+        'import flask_migrate': migrate_imported - created_all,
+    }))
+
+
+def prepare(database_url):
+    from flaskr import create_app
+    from flaskr.bootstrap import bootstrap
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        bootstrap(seed=True)
+
+
+def run(database_url, runs):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_cold_start',
+                                       '--child', '--database-url', database_url], cwd=backend)
+        samples.append(json.loads(out.decode('utf-8').strip().splitlines()[-1]))
+
+    print('{:>22} {:>10} {:>10}'.format('step', 'median ms', 'max ms'))
+    for step in STEPS + LEGACY_STEPS:
+        values = [s[step] * 1000 for s in samples]
+        print('{:>22} {:>10.1f} {:>10.1f}'.format(step, statistics.median(values), max(values)))
+    saved = statistics.median([sum(s[step] for step in LEGACY_STEPS) * 1000 for s in samples])
+    print('no longer paid per boot: {:.1f} ms (median)'.format(saved))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', default=None,
+                        help='an already bootstrapped database, defaults to a temporary SQLite file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.database_url)
+        return
+    if args.database_url:
+        run(args.database_url, args.runs)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'cold_start.db')
+        prepare(url)
+        run(url, args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Leaderboard operations per second as the number of players grows.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_leaderboard
+    python -m benchmarks.bench_leaderboard --players 1000 100000 1000000
+
+Times score submissions, rank lookups and top-10 reads on the in-memory
+board, and for comparison submissions on a plain sorted list kept with
+bisect.insort (what a naive implementation would do). No database is
+involved.
+'''
+import argparse
+import bisect
+import random
+import time
+
+from flaskr.leaderboard import Leaderboard
+
+
+def rate(fn, ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--ops', type=int, default=20000, help='operations timed per measurement')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print('{:>9} {:>12} {:>12} {:>12} {:>14}'.format('players', 'submit/s', 'rank/s', 'top10/s', 'sorted list/s'))
+    for size in args.players:
+        players = ['player{}'.format(i) for i in range(size)]
+        board = Leaderboard()
+        board.load((player, rng.randrange(1000)) for player in players)
+        naive = sorted((-score, player) for _, player, score in board.top(size))
+
+        def submit():
+            board.submit(rng.choice(players), rng.randrange(1, 4))
+
+        def rank():
+            board.rank(rng.choice(players))
+
+        def top():
+            board.top(10)
+
+        def naive_submit():
+            index = rng.randrange(len(naive))
+            score, player = naive.pop(index)
+            bisect.insort(naive, (score - rng.randrange(1, 4), player))
+
+        print('{:>9} {:>12.0f} {:>12.0f} {:>12.0f} {:>14.0f}'.format(
+            size, rate(submit, args.ops), rate(rank, args.ops), rate(top, args.ops),
+            rate(naive_submit, args.ops)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''
+POST /questions latency as the questions table grows.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_post_questions
+    python -m benchmarks.bench_post_questions --sizes 1000 100000 --database-url postgres://cc:cc@localhost:5432/trivia_bench
+
+For every table size it times a batch of inserts through the endpoint and,
+for comparison, the full-table reload the endpoint used to do after each
+insert (order_by(id).all() + format() + len(all())).
+Every insert has its own question text, so each one goes through the
+near-duplicate lookup and is accepted; that lookup is part of the timing.
+The duplicate index is reloaded for every table size by an untimed first
+insert, so the one-off load is not.
+The database is dropped and recreated, never point it at real data.
+'''
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from flaskr import create_app
+from flaskr.duplicates import question_index
+from models import db, Question, Category
+
+
+def fill(size):
+    missing = size - db.session.query(db.func.count()).select_from(Question).scalar()
+    batch = []
+    for i in range(missing):
+        batch.append({'question': 'Benchmark question {}?'.format(i), 'answer': 'answer',
+                      'category': i % 6 + 1, 'difficulty': i % 5 + 1})
+        if len(batch) == 5000:
+            db.session.bulk_insert_mappings(Question, batch)
+            batch = []
+    db.session.bulk_insert_mappings(Question, batch)
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(database_url, sizes, inserts):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    client = app.test_client()
+
+    def post():
+        # a random tail keeps every text clear of the duplicate threshold
+        payload = {'question': 'What is being measured? {}'.format(os.urandom(8).hex()),
+                   'answer': 'Latency', 'difficulty': 1, 'category': 1}
+        res = client.post('/questions', json=payload)
+        assert res.status_code == 200, res.data
+
+    print('{:>10} {:>12} {:>12} {:>16}'.format('rows', 'median ms', 'p95 ms', 'full reload ms'))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([Category(t) for t in
+                            ('Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports')])
+        db.session.commit()
+
+        for size in sizes:
+            fill(size)
+            question_index.reset()
+            post()
+            samples = []
+            for _ in range(inserts):
+                start = time.perf_counter()
+                post()
+                samples.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            [q.format() for q in Question.query.order_by(Question.id).all()]
+            len(Question.query.all())
+            reload_ms = (time.perf_counter() - start) * 1000
+            db.session.remove()
+
+            print('{:>10} {:>12.2f} {:>12.2f} {:>16.2f}'.format(
+                size, statistics.median(samples), percentile(samples, 95), reload_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--inserts', type=int, default=200)
+    parser.add_argument('--database-url', default=None,
+                        help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        run(args.database_url, args.sizes, args.inserts)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        run('sqlite:///' + os.path.join(tmp, 'bench.db'), args.sizes, args.inserts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+Question serialization throughput: format() + jsonify against the cached
+fragment path in flaskr.serializers.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --page-sizes 10 1000 --seconds 2
+
+No database is needed; rows are generated in memory. "fragments cold"
+encodes every row (cache cleared before each response), "fragments warm"
+is the steady state where pages are served from the cache.
+'''
+import argparse
+import time
+
+from flask import jsonify
+
+from flaskr import create_app
+from flaskr.serializers import orjson, question_fragments, questions_response
+from models import Question
+
+
+def make_rows(count):
+    return [(i, 'What is question number {} about?'.format(i), 'Answer {}'.format(i), i % 6 + 1, i % 5 + 1)
+            for i in range(1, count + 1)]
+
+
+def make_questions(rows):
+    questions = []
+    for id, question, answer, category, difficulty in rows:
+        q = Question(question=question, answer=answer, category=category, difficulty=difficulty)
+        q.id = id
+        questions.append(q)
+    return questions
+
+
+def throughput(fn, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return count / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--seconds', type=float, default=1.0, help='time spent per measurement')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    print('encoder: {}'.format('orjson' if orjson is not None else 'json'))
+    print('{:>6} {:>18} {:>18} {:>18}'.format('rows', 'format+jsonify/s', 'fragments cold/s', 'fragments warm/s'))
+    with app.app_context():
+        for size in args.page_sizes:
+            rows = make_rows(size)
+            questions = make_questions(rows)
+
+            def legacy():
+                return jsonify({'questions': [q.format() for q in questions], 'total_questions': size}).get_data()
+
+            def cold():
+                question_fragments.clear()
+                return questions_response(rows, total_questions=size).get_data()
+
+            def warm():
+                return questions_response(rows, total_questions=size).get_data()
+
+            warm()
+            print('{:>6} {:>18.0f} {:>18.0f} {:>18.0f}'.format(
+                size, throughput(legacy, args.seconds), throughput(cold, args.seconds),
+                throughput(warm, args.seconds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+import testing
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not testing.timings:
+        return
+    lines, over_budget = testing.timing_report()
+    reporter = session.config.pluginmanager.get_plugin('terminalreporter')
+    if reporter is not None:
+        reporter.write_line('')
+        for line in lines:
+            reporter.write_line(line)
+    if over_budget and session.exitstatus == 0:
+        session.exitstatus = 1
@@ -1,39 +1,56 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 from sqlalchemy import func
-from models import setup_db, Question, Category
+from models import setup_db, db, database_path, Question, Category
+from .bootstrap import setup_migrations
+from .duplicates import find_duplicates, duplicate_report, index_questions, unindex_questions
+from .bulk import guess_format, import_questions, export_questions, delete_questions, update_questions
+from .cli import trivia_cli
+from .serializers import question_rows, questions_response, question_response
+from .http_cache import setup_http_cache
+from .leaderboard import setup_leaderboard
+from .packs import setup_packs
+from .metrics import setup_metrics
 
 QUESTIONS_PER_PAGE = 10
 
 
-def paginate(request, selections):
+def paginate(request, query):
     '''
-    Simple pagination.
+    Simple pagination over a Question query.
     Returns a tuple with elements:
-    - current page number
     - total items count (before pagination)
-    - the current page items
+    - the current page rows, as plain question tuples
+    Only the requested page is fetched from the database.
     '''
     page = request.args.get('page', 1, type=int)
     page_size = QUESTIONS_PER_PAGE
     start = (page - 1) * page_size
-    end = start + page_size
-    items = [s.format() for s in selections]
-    return len(items), items[start:end]
+    rows = question_rows(query).order_by(Question.id).offset(start).limit(page_size).all()
+    return query.count(), rows
 
 
 def create_app(test_config=None):
-    # create and configure the app
+    # create and configure the app; no database access happens here, the
+    # schema is managed by `flask trivia bootstrap` / `flask db upgrade`
     app = Flask(__name__)
-    setup_db(app)
+    if test_config:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+    setup_migrations(app)
+    setup_metrics(app)
+    setup_http_cache(app)
+    setup_leaderboard(app)
+    setup_packs(app)
 
     '''
     @done: Set up CORS. Allow '*' for origins. Delete the sample route after completing the dones
     '''
     cors = CORS(app, resources={r"*": {"origins": "*"}})
+    app.cli.add_command(trivia_cli)
 
     '''
     @done: Use the after_request decorator to set Access-Control-Allow
@@ -58,6 +75,27 @@ def create_app(test_config=None):
             print(err)
             abort(400)
 
+    @app.route('/categories/stats', methods=['GET'])
+    def get_category_stats():
+        '''
+        Question counts per category from one grouped query.
+        Categories without questions are reported with a count of 0.
+        '''
+        try:
+            rows = db.session.query(Category.id, Category.type, func.count(Question.id)) \
+                .outerjoin(Question, Question.category == Category.id) \
+                .group_by(Category.id, Category.type) \
+                .order_by(Category.id).all()
+            stats = [{'id': id, 'type': type.lower(), 'total_questions': count}
+                     for id, type, count in rows]
+            return jsonify({
+                            'categories': stats,
+                            'total_questions': sum(s['total_questions'] for s in stats)
+            })
+        except Exception as err:
+            print(err)
+            abort(400)
+
     @app.route('/questions', methods=['GET'])
     def get_questions():
         '''
@@ -74,15 +112,13 @@ def create_app(test_config=None):
         '''
         try:
             query = Question.query
-            total_questions, questions = paginate(request, query.all())
+            total_questions, questions = paginate(request, query)
             if not questions:
                 abort(404)
             categories = dict([(str(category.id), category.type.lower()) for category in Category.query.all()])
-            return jsonify({
-                            'total_questions': total_questions,
-                            'questions': questions,
-                            'categories': categories
-            })
+            return questions_response(questions,
+                                      total_questions=total_questions,
+                                      categories=categories)
         except Exception as err:
             print(err)
             abort(400)
@@ -101,6 +137,7 @@ def create_app(test_config=None):
             if not question:
                 abort(404)
             question.delete()
+            unindex_questions([question_id])
             return jsonify({
                             'success': True,
                             'deleted_question': question_id
@@ -109,6 +146,46 @@ def create_app(test_config=None):
             print(err)
             abort(400)
 
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions_batch():
+        '''
+        Deletes every question listed in `ids` and/or matching `filter`
+        ({"category": .., "difficulty": ..}) in one transaction.
+        '''
+        try:
+            body = request.get_json()
+            if not body:
+                abort(400)
+            results = delete_questions(ids=body.get('ids'), filters=body.get('filter'))
+            return jsonify({
+                            'success': True,
+                            'deleted': sum(1 for r in results if r['status'] == 'deleted'),
+                            'results': results
+            })
+        except Exception as err:
+            print(err)
+            abort(400)
+
+    @app.route('/questions', methods=['PATCH'])
+    def patch_questions_batch():
+        '''
+        Applies `changes` (category and/or difficulty) to every question
+        listed in `ids` and/or matching `filter` in one transaction.
+        '''
+        try:
+            body = request.get_json()
+            if not body:
+                abort(400)
+            results = update_questions(body.get('changes'), ids=body.get('ids'), filters=body.get('filter'))
+            return jsonify({
+                            'success': True,
+                            'updated': sum(1 for r in results if r['status'] == 'updated'),
+                            'results': results
+            })
+        except Exception as err:
+            print(err)
+            abort(400)
+
     '''
     @done:
     Create an endpoint to POST a new question,
@@ -121,30 +198,103 @@ def create_app(test_config=None):
     '''
     @app.route('/questions', methods=['POST'])
     def post_questions():
+        '''
+        Only touches the new row: the total is a COUNT(*) in the database
+        and the optional `neighbors` window (default one page, 0 to skip)
+        is the preceding questions by id, fetched with LIMIT.
+        Near duplicates of existing questions are refused with 409 and
+        listed, unless `force` is true.
+        '''
         try:
             body = request.get_json()
-            if body: 
-                new_question = body.get('question', None)
-                new_answer = body.get('answer', None)
-                new_difficulty = body.get('difficulty', None)
-                new_category = body.get('category', None)
-                questions = Question(
-                                    question=new_question, answer=new_answer,
-                                    difficulty=new_difficulty, category=new_category)
-                questions.insert()
-                selections = Question.query.order_by(Question.id).all()
-                current_question = paginate(request, selections)
+            if not body:
+                abort(400)
+            new_question = body.get('question', None)
+            new_answer = body.get('answer', None)
+            new_difficulty = body.get('difficulty', None)
+            new_category = body.get('category', None)
+            if isinstance(new_question, str) and not body.get('force', False):
+                matches = find_duplicates(new_question)
+                if matches:
+                    texts = dict(Question.query.with_entities(Question.id, Question.question)
+                                 .filter(Question.id.in_([id for id, _ in matches])))
+                    return jsonify({
+                                    'success': False,
+                                    'message': 'Near duplicate question',
+                                    'duplicates': [{'id': id, 'question': texts.get(id),
+                                                    'similarity': round(similarity, 3)}
+                                                   for id, similarity in matches]
+                    }), 409
+            question = Question(
+                                question=new_question, answer=new_answer,
+                                difficulty=new_difficulty, category=new_category)
+            question.insert()
+            index_questions([(question.id, question.question)])
+            total = db.session.query(func.count()).select_from(Question).scalar()
 
+            result = {
+                        'success': True,
+                        'created': question.id,
+                        'question': question.format(),
+                        'total_questions': total
+            }
+            neighbors = request.args.get('neighbors', QUESTIONS_PER_PAGE, type=int)
+            if neighbors > 0:
+                preceding = Question.query.filter(Question.id < question.id) \
+                    .order_by(Question.id.desc()).limit(neighbors - 1).all()
+                result['questions'] = [q.format() for q in reversed(preceding)] + [result['question']]
+            return jsonify(result)
+        except Exception as err:
+            print(err)
+            abort(400)
+
+    @app.route('/questions/import', methods=['POST'])
+    def import_questions_bulk():
+        '''
+        Streams NDJSON or CSV questions from the request body into the
+        database in batched transactions. The format comes from the
+        `format` query argument or the Content-Type. Near duplicates are
+        rejected line by line unless `force` is true.
+        '''
+        try:
+            fmt = request.args.get('format') or guess_format(request.mimetype)
+            force = request.args.get('force', 'false').lower() in ('1', 'true', 'yes')
+            summary = import_questions(request.stream, fmt, force=force)
+            summary['success'] = True
+            return jsonify(summary)
+        except Exception as err:
+            print(err)
+            abort(400)
+
+    @app.route('/questions/duplicates', methods=['GET'])
+    def get_duplicate_questions():
+        '''
+        Groups of near-duplicate questions over the whole table.
+        '''
+        try:
+            groups = duplicate_report()
             return jsonify({
-                            'success': True,
-                            'created': questions.id,
-                            'questions': current_question,
-                            'total_questions': len(Question.query.all())
+                            'groups': groups,
+                            'total_groups': len(groups)
             })
         except Exception as err:
             print(err)
             abort(400)
 
+    @app.route('/questions/export', methods=['GET'])
+    def export_questions_bulk():
+        '''
+        Streams every question as NDJSON (default) or CSV.
+        '''
+        fmt = request.args.get('format', 'ndjson')
+        if fmt == 'csv':
+            mimetype = 'text/csv'
+        elif fmt == 'ndjson':
+            mimetype = 'application/x-ndjson'
+        else:
+            abort(400)
+        return Response(stream_with_context(export_questions(fmt)), mimetype=mimetype)
+
     @app.route('/questions/search', methods=['POST'])
     def search_questions():
         '''
@@ -161,15 +311,13 @@ def create_app(test_config=None):
 
         if search_term:
             selection = Question.query.filter(Question.question.ilike('%{}%'.format(search_term)))
-            total_questions, questions = paginate(request, selection.all())
+            total_questions, questions = paginate(request, selection)
             if total_questions == 0:
                 abort(404)
 
-            return jsonify({
-                'success': True,
-                'questions': questions,
-                'total_questions': total_questions
-            })
+            return questions_response(questions,
+                                      success=True,
+                                      total_questions=total_questions)
 
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def get_questions_by_cagetories(category_id):
@@ -182,13 +330,11 @@ def create_app(test_config=None):
         '''
 
         try:
-            questions = Question.query.filter(Question.category == category_id).all()
-            questions = [q.format() for q in questions]
+            selection = Question.query.filter(Question.category == category_id).order_by(Question.id)
+            questions = question_rows(selection).all()
             if not questions:
                 abort(404)
-            return jsonify({
-                            'questions': questions
-            })
+            return questions_response(questions)
         except Exception as err:
             print(err)
             abort(400)
@@ -220,17 +366,14 @@ def create_app(test_config=None):
                 selection = Question.query.filter(Question.category == category_id)
             if previous_questions:
                 selection = selection.filter(Question.id.notin_(previous_questions))
-            all = [s.format() for s in selection.all()]
-            if len(all) == 0:
+            # pick among ids and only load the chosen row
+            ids = [id for id, in selection.with_entities(Question.id)]
+            if len(ids) == 0:
                 return jsonify({
                                 'success': True
                 })
-            questions = random.choice(all)
-            if questions is not None:
-                return jsonify({
-                                'success': True,
-                                'question': questions
-                })
+            question = question_rows(Question.query.filter(Question.id == random.choice(ids))).one()
+            return question_response(question, success=True)
         except Exception as err:
             print(err)
             abort(400)
@@ -0,0 +1,160 @@
+'''
+ASGI serving mode.
+
+create_asgi_app() wraps the regular Flask app, so routes, hooks and the
+JSON contract are exactly the same as under WSGI:
+
+    uvicorn --factory flaskr.asgi:create_asgi_app --workers 1
+
+The event loop accepts and parks any number of connections; at most
+ASGI_MAX_CONCURRENCY requests run the (blocking) views at once, on a
+thread pool of that size, and the SQLAlchemy connection pool is sized to
+match, so a request never waits on the pool while holding a thread.
+Flask 1.x and SQLAlchemy 1.3 have no async database API, so this bounded
+thread pool is where the database work happens.
+
+Request bodies are read before the view runs (spooled to disk past
+ASGI_SPOOL_SIZE); response bodies, including streamed exports, are sent
+chunk by chunk from the worker thread with back-pressure from the client.
+'''
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from models import database_path
+from . import create_app
+
+ASGI_MAX_CONCURRENCY = 10
+ASGI_SPOOL_SIZE = 1024 * 1024
+
+
+def build_environ(scope, body):
+    '''
+    Translates an ASGI http scope and a file-like body into a WSGI environ.
+    '''
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsgiAdapter(object):
+    '''
+    ASGI application running a WSGI app on a bounded thread pool.
+    '''
+
+    def __init__(self, wsgi_app, max_concurrency=ASGI_MAX_CONCURRENCY, spool_size=ASGI_SPOOL_SIZE):
+        self.wsgi_app = wsgi_app
+        self.spool_size = spool_size
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='trivia-asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError('unsupported scope type {}'.format(scope['type']))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, body)
+        try:
+            await loop.run_in_executor(self.executor, self._respond, environ, send, loop)
+        finally:
+            body.close()
+
+    def _respond(self, environ, send, loop):
+        # runs on a pool thread: the whole request, streaming included,
+        # stays on one thread so Flask's contexts and the session do too
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def send_start():
+            if not response.get('started'):
+                response['started'] = True
+                send_sync({'type': 'http.response.start', 'status': response['status'],
+                           'headers': response['headers']})
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    send_start()
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_start()
+            send_sync({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def create_asgi_app(test_config=None):
+    '''
+    ASGI counterpart of create_app(test_config). ASGI_MAX_CONCURRENCY
+    (default 10) bounds both the worker threads and, for servers with a
+    connection pool, pool_size (max_overflow 0).
+    '''
+    config = dict(test_config or {})
+    concurrency = config.setdefault('ASGI_MAX_CONCURRENCY', ASGI_MAX_CONCURRENCY)
+    if not config.get('SQLALCHEMY_DATABASE_URI', database_path).startswith('sqlite'):
+        options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        options.setdefault('pool_size', concurrency)
+        options.setdefault('max_overflow', 0)
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app = create_app(config)
+    return AsgiAdapter(app, concurrency, config.get('ASGI_SPOOL_SIZE', ASGI_SPOOL_SIZE))
@@ -0,0 +1,102 @@
+'''
+Everything that touches the database schema or seed data before the app
+can serve: migrations and the trivia.psql sample data.
+
+create_app() itself never talks to the database. Run `flask trivia
+bootstrap` (or `flask db upgrade`) once per deploy instead of on every
+worker boot.
+'''
+import os
+
+from models import db, Category
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(BACKEND_DIR, 'migrations')
+FIXTURES = os.path.join(BACKEND_DIR, 'trivia.psql')
+
+
+class LazyMigrate(object):
+    '''
+    Stands in for app.extensions['migrate'] so that Flask-Migrate, and
+    alembic with it, are only imported when a `flask db` command (or
+    upgrade_schema) first looks at the extension.
+    '''
+
+    def __init__(self, app, db, directory):
+        self.app = app
+        self.db = db
+        self.directory = directory
+
+    def __getattr__(self, name):
+        from flask_migrate import Migrate
+        Migrate(self.app, self.db, directory=self.directory)
+        return getattr(self.app.extensions['migrate'], name)
+
+
+def setup_migrations(app, directory=MIGRATIONS_DIR):
+    '''
+    setup_migrations(app)
+        registers Flask-Migrate on a flask application without importing it
+    '''
+    app.extensions['migrate'] = LazyMigrate(app, db, directory)
+
+
+def upgrade_schema(revision='head'):
+    '''
+    Runs the migrations up to revision. Needs an app context.
+    '''
+    from flask_migrate import upgrade
+    upgrade(revision=revision)
+
+
+def read_copy_blocks(path=FIXTURES):
+    '''
+    Yields (table, columns, rows) for every COPY ... FROM stdin block of a
+    pg_dump file, with \\N mapped to None.
+    '''
+    with open(path, encoding='utf-8') as dump:
+        lines = iter(dump)
+        for line in lines:
+            if not line.startswith('COPY '):
+                continue
+            head, columns = line[len('COPY '):].split(' (', 1)
+            table = head.split('.')[-1]
+            columns = [c.strip() for c in columns.split(')', 1)[0].split(',')]
+            rows = []
+            for row in lines:
+                row = row.rstrip('\n')
+                if row == '\\.':
+                    break
+                rows.append([None if value == '\\N' else value for value in row.split('\t')])
+            yield table, columns, rows
+
+
+def load_fixtures(connection, path=FIXTURES):
+    '''
+    Bulk loads the trivia.psql data with one executemany per table.
+    '''
+    tables = db.metadata.tables
+    for table_name, columns, rows in read_copy_blocks(path):
+        table = tables[table_name]
+        casts = [table.c[name].type.python_type for name in columns]
+        records = [dict((name, cast(value) if value is not None else None)
+                        for name, cast, value in zip(columns, casts, row))
+                   for row in rows]
+        connection.execute(table.insert(), records)
+        if connection.dialect.name == 'postgresql':
+            connection.execute("SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                               "(SELECT max(id) FROM {0}))".format(table_name))
+
+
+def bootstrap(seed=False):
+    '''
+    Brings the schema up to date and, with seed=True, loads the sample
+    data into an empty database. Safe to run on every deploy.
+    Returns True when the sample data was loaded.
+    '''
+    upgrade_schema()
+    if not seed or db.session.query(Category.id).first() is not None:
+        return False
+    with db.engine.begin() as connection:
+        load_fixtures(connection)
+    return True
@@ -0,0 +1,278 @@
+import csv
+import io
+import json
+
+from models import db, Question, Category
+from .duplicates import DuplicateIndex, find_duplicates, index_questions, unindex_questions
+from .serializers import question_fragments
+from .http_cache import mark_changed
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_FETCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ('ndjson', 'csv')
+EXPORT_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+IMPORT_FIELDS = ('question', 'answer', 'category', 'difficulty')
+BATCH_FIELDS = ('category', 'difficulty')
+IN_CLAUSE_SIZE = 500
+
+
+def guess_format(name, default='ndjson'):
+    '''
+    Picks a bulk format from a file name or a mimetype.
+    '''
+    name = (name or '').lower()
+    if name.endswith('.csv') or name == 'text/csv':
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or name == 'application/x-ndjson':
+        return 'ndjson'
+    return default
+
+
+def _text_lines(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        yield line
+
+
+def read_records(lines, fmt):
+    '''
+    Lazily parses an iterable of NDJSON or CSV lines (str or bytes).
+    Yields (line_number, record, error) tuples; exactly one of
+    record and error is None, so one bad line never aborts an import.
+    '''
+    lines = _text_lines(lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            yield line_number, None, 'invalid json: {}'.format(err)
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, 'expected a json object'
+            continue
+        yield line_number, record, None
+
+
+def validate_record(record, category_ids):
+    '''
+    Turns a raw record into an insert mapping.
+    Raises ValueError naming the first problem found.
+    '''
+    mapping = {}
+    for field in ('question', 'answer'):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError('{} is required'.format(field))
+        mapping[field] = value.strip()
+
+    for field in ('category', 'difficulty'):
+        try:
+            mapping[field] = int(record.get(field))
+        except (TypeError, ValueError):
+            raise ValueError('{} must be an integer'.format(field))
+
+    if mapping['category'] not in category_ids:
+        raise ValueError('unknown category {}'.format(mapping['category']))
+    return mapping
+
+
+def _check_duplicate(mapping, line_number, batch_index):
+    matches = find_duplicates(mapping['question'])
+    if matches:
+        raise ValueError('near duplicate of question {}'.format(matches[0][0]))
+    matches = batch_index.find(mapping['question'])
+    if matches:
+        raise ValueError('near duplicate of line {}'.format(matches[0][0]))
+    batch_index.add(line_number, mapping['question'])
+
+
+def import_questions(lines, fmt, batch_size=IMPORT_BATCH_SIZE, force=False):
+    '''
+    Streams records into the questions table.
+    Valid rows are inserted with bulk_insert_mappings and committed every
+    batch_size rows, so a large import is a handful of transactions rather
+    than one commit per question. Ids in the input are ignored.
+    Near duplicates of existing questions or of earlier lines are
+    rejected unless force is set.
+    Returns a summary dict with inserted/rejected counts and the first
+    MAX_REPORTED_ERRORS errors.
+    '''
+    if fmt not in FORMATS:
+        raise ValueError('unsupported format {}'.format(fmt))
+
+    category_ids = set(id for id, in db.session.query(Category.id))
+    summary = {'inserted': 0, 'rejected': 0, 'errors': []}
+    batch = []
+    batch_index = DuplicateIndex()
+
+    def flush():
+        # return_defaults fills in each mapping's id, so only this batch's
+        # rows are indexed, whatever other requests insert meanwhile
+        db.session.bulk_insert_mappings(Question, batch, return_defaults=True)
+        mark_changed(db.session)
+        db.session.commit()
+        summary['inserted'] += len(batch)
+        index_questions([(mapping['id'], mapping['question']) for mapping in batch])
+        del batch[:]
+        batch_index.reset()
+
+    try:
+        for line_number, record, error in read_records(lines, fmt):
+            if error is None:
+                try:
+                    mapping = validate_record(record, category_ids)
+                    if not force:
+                        _check_duplicate(mapping, line_number, batch_index)
+                    batch.append(mapping)
+                except ValueError as err:
+                    error = str(err)
+            if error is not None:
+                summary['rejected'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'line': line_number, 'error': error})
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except Exception:
+        db.session.rollback()
+        raise
+    return summary
+
+
+def export_questions(fmt, fetch_size=EXPORT_FETCH_SIZE):
+    '''
+    Yields the questions table as NDJSON or CSV text chunks.
+    Rows are fetched fetch_size at a time through a server-side cursor
+    (stream_results) so memory use does not depend on the table size.
+    '''
+    if fmt not in FORMATS:
+        raise ValueError('unsupported format {}'.format(fmt))
+
+    columns = [getattr(Question, field) for field in EXPORT_FIELDS]
+    rows = db.session.query(*columns) \
+        .order_by(Question.id) \
+        .execution_options(stream_results=True) \
+        .yield_per(fetch_size)
+
+    if fmt == 'ndjson':
+        chunk = []
+        for row in rows:
+            chunk.append(json.dumps(dict(zip(EXPORT_FIELDS, row))))
+            if len(chunk) >= fetch_size:
+                yield '\n'.join(chunk) + '\n'
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % fetch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _chunks(ids, size=IN_CLAUSE_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _int_fields(values, name):
+    if not isinstance(values, dict) or set(values) - set(BATCH_FIELDS):
+        raise ValueError('{} may only contain {}'.format(name, ', '.join(BATCH_FIELDS)))
+    try:
+        return dict((field, int(value)) for field, value in values.items())
+    except (TypeError, ValueError):
+        raise ValueError('{} values must be integers'.format(name))
+
+
+def _locked_targets(ids, filters):
+    '''
+    Resolves an id list and/or a field filter to the ids that exist,
+    locking those rows (SELECT ... FOR UPDATE) until the batch commits.
+    '''
+    if ids is None and not filters:
+        raise ValueError('ids or filter is required')
+
+    query = Question.query.with_entities(Question.id).with_for_update()
+    for field, value in _int_fields(filters or {}, 'filter').items():
+        query = query.filter(getattr(Question, field) == value)
+    if ids is None:
+        return [id for id, in query.order_by(Question.id)]
+
+    # bool is an int subclass and int() would accept "12" or 1.5: only
+    # real integers are ids
+    if not isinstance(ids, list) or any(type(id) is not int for id in ids):
+        raise ValueError('ids must be a list of integers')
+    found = set()
+    for chunk in _chunks(ids):
+        found.update(id for id, in query.filter(Question.id.in_(chunk)))
+    return [id for id in ids if id in found]
+
+
+def _outcomes(ids, affected, status):
+    if ids is None:
+        return [{'id': id, 'status': status} for id in affected]
+    affected = set(affected)
+    return [{'id': id, 'status': status if id in affected else 'not_found'} for id in ids]
+
+
+def delete_questions(ids=None, filters=None):
+    '''
+    Deletes questions by id list and/or filter with set-based DELETEs in a
+    single transaction. Caches are invalidated once for the whole batch.
+    Returns one {'id', 'status'} outcome per requested id (or per matched
+    row when only a filter is given).
+    '''
+    try:
+        targets = _locked_targets(ids, filters)
+        for chunk in _chunks(targets):
+            Question.query.filter(Question.id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    question_fragments.discard(targets)
+    unindex_questions(targets)
+    return _outcomes(ids, targets, 'deleted')
+
+
+def update_questions(changes, ids=None, filters=None):
+    '''
+    Applies the same category/difficulty changes to questions selected by
+    id list and/or filter, with set-based UPDATEs in a single transaction.
+    Returns outcomes like delete_questions.
+    '''
+    changes = _int_fields(changes, 'changes')
+    if not changes:
+        raise ValueError('changes is required')
+    if 'category' in changes and Category.query.get(changes['category']) is None:
+        raise ValueError('unknown category {}'.format(changes['category']))
+
+    try:
+        targets = _locked_targets(ids, filters)
+        for chunk in _chunks(targets):
+            Question.query.filter(Question.id.in_(chunk)).update(changes, synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    question_fragments.discard(targets)
+    return _outcomes(ids, targets, 'updated')
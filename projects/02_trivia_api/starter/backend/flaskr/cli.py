@@ -0,0 +1,84 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .bootstrap import bootstrap
+from .bulk import FORMATS, IMPORT_BATCH_SIZE, guess_format, import_questions, export_questions
+from .packs import build_packs
+
+trivia_cli = AppGroup('trivia', help='Trivia maintenance commands.')
+
+
+@trivia_cli.command('import')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Input format, guessed from the file name by default.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True,
+              help='Rows inserted per transaction.')
+@click.option('--force', is_flag=True, help='Also insert near duplicates of existing questions.')
+def import_command(source, fmt, batch_size, force):
+    '''
+    Import questions from an NDJSON or CSV file ("-" for stdin).
+    '''
+    fmt = fmt or guess_format(source.name)
+    summary = import_questions(source, fmt, batch_size=batch_size, force=force)
+    click.echo('inserted {inserted}, rejected {rejected}'.format(**summary))
+    for error in summary['errors']:
+        click.echo('line {line}: {error}'.format(**error), err=True)
+
+
+@trivia_cli.command('export')
+@click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Output format, guessed from the file name by default.')
+def export_command(target, fmt):
+    '''
+    Export all questions as NDJSON or CSV (stdout by default).
+    '''
+    fmt = fmt or guess_format(target.name)
+    for chunk in export_questions(fmt):
+        target.write(chunk)
+
+
+@trivia_cli.command('bootstrap')
+@click.option('--seed/--no-seed', default=False, show_default=True,
+              help='Load the trivia.psql sample data into an empty database.')
+def bootstrap_command(seed):
+    '''
+    Run the migrations and optionally seed the database. Run once per
+    deploy; the app itself never creates tables.
+    '''
+    if bootstrap(seed=seed):
+        click.echo('schema up to date, sample data loaded')
+    else:
+        click.echo('schema up to date')
+
+
+@trivia_cli.command('build-packs')
+@click.option('--out', 'directory', type=click.Path(file_okay=False), default=None,
+              help='Output directory, QUIZ_PACKS_DIR by default.')
+@click.option('--name', default=None,
+              help='Also build a pack of the questions matching --category/--difficulty under this name.')
+@click.option('--category', type=int, multiple=True, help='Category id for --name, repeatable.')
+@click.option('--difficulty', type=int, multiple=True, help='Difficulty for --name, repeatable.')
+@click.option('--force', is_flag=True, help='Rebuild packs whose content did not change.')
+def build_packs_command(directory, name, category, difficulty, force):
+    '''
+    Compile the offline quiz packs: one per category, "all", and any
+    named filters. Only packs whose questions changed are rebuilt.
+    '''
+    custom = {}
+    if name:
+        filters = {}
+        if category:
+            filters['category'] = list(category)
+        if difficulty:
+            filters['difficulty'] = list(difficulty)
+        custom[name] = filters
+    elif category or difficulty:
+        raise click.UsageError('--category and --difficulty need --name')
+    summary = build_packs(directory or current_app.config['QUIZ_PACKS_DIR'], custom=custom, force=force)
+    click.echo('built {}, unchanged {}, removed {} old files'.format(
+        len(summary['built']), len(summary['unchanged']), len(summary['removed'])))
+    for built in summary['built']:
+        click.echo('  {}'.format(built))
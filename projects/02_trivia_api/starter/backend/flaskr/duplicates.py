@@ -0,0 +1,236 @@
+'''
+Near-duplicate question detection.
+
+Question texts are normalized (lower case, punctuation dropped, spaces
+collapsed) and cut into overlapping character shingles. Every question
+gets a MinHash signature whose bands are indexed in memory (LSH), so a
+lookup only compares the text with the few questions that share a band
+and confirms them with the exact Jaccard similarity of the shingle sets.
+With BANDS x ROWS = 16 x 4 questions at the default threshold of 0.8 are
+found with near certainty.
+
+The signature is a one-permutation MinHash: every shingle hash is mixed
+once and lands in one of BANDS * ROWS bins that keep their minimum,
+empty bins borrowing from the next filled one. That is one pass over the
+shingles instead of one per hash function, which keeps a lookup well
+under a millisecond in pure Python.
+
+The index is per process, loaded from the questions table on first use
+and kept up to date by the endpoints that insert or delete questions.
+Writes made by other processes are only picked up after a restart.
+'''
+import re
+import threading
+import zlib
+
+from models import db, Question
+
+SHINGLE_SIZE = 4
+BANDS = 16
+ROWS = 4
+DUPLICATE_THRESHOLD = 0.8
+LOAD_FETCH_SIZE = 1000
+
+BINS = BANDS * ROWS
+BIN_BITS = 6  # log2(BINS)
+MIX = 0x9E3779B97F4A7C15
+MASK = (1 << 64) - 1
+VALUE_MASK = (1 << (64 - BIN_BITS)) - 1
+
+_punctuation = re.compile(r'[^\w\s]+', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join(_punctuation.sub(' ', text.lower()).split())
+
+
+def shingles(text):
+    '''
+    Hashed character shingles of the normalized text.
+    '''
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset([zlib.crc32(text.encode('utf-8'))])
+    return frozenset(zlib.crc32(text[i:i + SHINGLE_SIZE].encode('utf-8'))
+                     for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def band_keys(hashes):
+    bins = [None] * BINS
+    for x in hashes:
+        h = (x * MIX) & MASK
+        slot, value = h >> (64 - BIN_BITS), h & VALUE_MASK
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    signature = []
+    for slot in range(BINS):
+        # densification: an empty bin takes the next filled bin's minimum,
+        # tagged with the distance so different gaps do not collide
+        distance = 0
+        while bins[(slot + distance) % BINS] is None:
+            distance += 1
+        signature.append((bins[(slot + distance) % BINS], distance))
+    return [(band,) + tuple(signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / float(len(a | b))
+
+
+class DuplicateIndex(object):
+    '''
+    MinHash LSH index of question texts keyed by question id.
+    '''
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._shingles = {}
+            self._keys = {}
+            self._buckets = {}
+            self.loaded = False
+
+    def __len__(self):
+        return len(self._shingles)
+
+    def add(self, id, text):
+        hashes = shingles(text or '')
+        keys = band_keys(hashes)
+        with self._lock:
+            self._remove(id)
+            self._shingles[id] = hashes
+            self._keys[id] = keys
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(id)
+
+    def _remove(self, id):
+        keys = self._keys.pop(id, None)
+        if keys is None:
+            return
+        del self._shingles[id]
+        for key in keys:
+            bucket = self._buckets[key]
+            bucket.discard(id)
+            if not bucket:
+                del self._buckets[key]
+
+    def remove(self, ids):
+        with self._lock:
+            for id in ids:
+                self._remove(id)
+
+    def find(self, text, exclude=None):
+        '''
+        Returns [(id, similarity)] of the indexed questions at or above the
+        threshold, most similar first.
+        '''
+        hashes = shingles(text or '')
+        keys = band_keys(hashes)
+        with self._lock:
+            candidates = set()
+            for key in keys:
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude)
+            matches = [(id, jaccard(hashes, self._shingles[id])) for id in candidates]
+        matches = [(id, similarity) for id, similarity in matches if similarity >= self.threshold]
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def groups(self):
+        '''
+        Clusters every indexed question with its near duplicates. Returns
+        a list of (ids, lowest similarity between linked questions) for
+        clusters of two or more, largest first.
+        '''
+        links = []
+        with self._lock:
+            checked = set()
+            for bucket in self._buckets.values():
+                members = sorted(bucket)
+                for i, a in enumerate(members):
+                    for b in members[i + 1:]:
+                        if (a, b) in checked:
+                            continue
+                        checked.add((a, b))
+                        similarity = jaccard(self._shingles[a], self._shingles[b])
+                        if similarity >= self.threshold:
+                            links.append((a, b, similarity))
+
+        parent = {}
+
+        def root(id):
+            parent.setdefault(id, id)
+            while parent[id] != id:
+                parent[id] = parent[parent[id]]
+                id = parent[id]
+            return id
+
+        for a, b, _ in links:
+            parent[root(b)] = root(a)
+        members, lowest = {}, {}
+        for a, b, similarity in links:
+            group = root(a)
+            members.setdefault(group, set()).update((a, b))
+            lowest[group] = min(lowest.get(group, 1.0), similarity)
+        result = [(sorted(ids), lowest[group]) for group, ids in members.items()]
+        return sorted(result, key=lambda item: (-len(item[0]), item[0][0]))
+
+
+question_index = DuplicateIndex()
+_load_lock = threading.Lock()
+
+
+def ensure_loaded(index=question_index):
+    '''
+    Fills the index from the questions table on first use.
+    '''
+    if index.loaded:
+        return
+    with _load_lock:
+        if index.loaded:
+            return
+        rows = db.session.query(Question.id, Question.question).yield_per(LOAD_FETCH_SIZE)
+        for id, text in rows:
+            index.add(id, text)
+        index.loaded = True
+
+
+def find_duplicates(text, exclude=None):
+    ensure_loaded()
+    return question_index.find(text, exclude=exclude)
+
+
+def duplicate_report():
+    '''
+    Groups of near-duplicate questions over the whole table, each with
+    its questions' id and text.
+    '''
+    ensure_loaded()
+    groups = question_index.groups()
+    ids = [id for group, _ in groups for id in group]
+    texts = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        texts.update(db.session.query(Question.id, Question.question).filter(Question.id.in_(chunk)))
+    return [{'similarity': round(similarity, 3),
+             'questions': [{'id': id, 'question': texts.get(id)} for id in group]}
+            for group, similarity in groups]
+
+
+def index_questions(rows):
+    '''
+    Adds (id, text) rows written after the index was loaded. A no-op
+    before the first load, which reads them from the table anyway.
+    '''
+    if question_index.loaded:
+        for id, text in rows:
+            question_index.add(id, text)
+
+
+def unindex_questions(ids):
+    question_index.remove(ids)
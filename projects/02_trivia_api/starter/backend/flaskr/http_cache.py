@@ -0,0 +1,190 @@
+'''
+Conditional GET and response compression.
+
+Questions and categories share one data version, the single row of the
+data_version table. Every flush that writes either table, and every bulk
+update, delete or import, increments it inside the same transaction, so
+all gunicorn workers see a write on their next request and a rolled back
+write leaves it alone. GET endpoints listed in CONDITIONAL_ENDPOINTS get a
+strong ETag derived from that version, the request path and the chosen
+content encoding: an unchanged resource is answered with 304 (or from
+this worker's small cache of finished bodies) for one primary-key lookup,
+without querying or serializing again, whichever worker answers.
+'''
+import gzip
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, DataVersion, Question, Category
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+RESPONSE_CACHE_SIZE = 256
+CONDITIONAL_ENDPOINTS = ('get_categories', 'get_category_stats', 'get_questions', 'get_questions_by_cagetories')
+TRACKED_MODELS = (Question, Category)
+DATA_VERSION_ID = 1
+
+
+def current_version():
+    '''
+    The data version, "<epoch>.<counter>"; "0" before the first write to
+    a database created without the migrations.
+    '''
+    row = db.session.query(DataVersion.epoch, DataVersion.value).filter(
+        DataVersion.id == DATA_VERSION_ID).first()
+    return '{}.{}'.format(*row) if row is not None else '0'
+
+
+def bump_version(connection):
+    '''
+    Increments the data version in the transaction of connection. The row
+    is created on first use; its random epoch keeps a recreated database
+    from reusing the ETags of the old one.
+    '''
+    table = DataVersion.__table__
+    result = connection.execute(table.update().where(table.c.id == DATA_VERSION_ID)
+                                .values(value=table.c.value + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=DATA_VERSION_ID,
+                                                 epoch=os.urandom(4).hex(), value=1))
+
+
+def mark_changed(session):
+    '''
+    Bumps the data version in the session's transaction. Needed for writes
+    that skip flush events, such as bulk_insert_mappings.
+    '''
+    bump_version(session.connection())
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, TRACKED_MODELS):
+            mark_changed(session)
+            return
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _track_bulk(context):
+    if context.mapper.class_ in TRACKED_MODELS:
+        mark_changed(context.session)
+
+
+def negotiate_encoding():
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+class ResponseCache(object):
+    '''
+    LRU of finished (possibly compressed) bodies keyed by ETag. Entries are
+    never invalidated: a write changes the version and with it every ETag.
+    '''
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag):
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return entry
+
+    def put(self, etag, entry):
+        with self._lock:
+            self._entries[etag] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+response_cache = ResponseCache()
+
+
+def _etag(encoding):
+    key = '{}|{}|{}'.format(current_version(), request.full_path, encoding or 'identity')
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _finish(response, etag, encoding):
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def setup_http_cache(app):
+    '''
+    setup_http_cache(app)
+        registers the ETag/304 and compression hooks on a flask application
+    '''
+    app.config.setdefault('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE)
+
+    @app.before_request
+    def answer_unchanged():
+        if request.method != 'GET' or request.endpoint not in CONDITIONAL_ENDPOINTS:
+            return None
+        encoding = negotiate_encoding()
+        etag = _etag(encoding)
+        g.http_cache = {'etag': etag, 'encoding': encoding, 'hit': True}
+
+        if request.if_none_match.contains(etag):
+            return _finish(app.response_class(status=304), etag, None)
+        cached = response_cache.get(etag)
+        if cached is not None:
+            body, mimetype, applied = cached
+            return _finish(app.response_class(body, mimetype=mimetype), etag, applied)
+        g.http_cache['hit'] = False
+        return None
+
+    @app.after_request
+    def compress_response(response):
+        state = g.pop('http_cache', None) or {'etag': None, 'encoding': negotiate_encoding(), 'hit': False}
+        if state['hit'] or response.status_code != 200 or response.is_streamed \
+                or response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+
+        data = response.get_data()
+        applied = None
+        if state['encoding'] and len(data) >= app.config['COMPRESS_MIN_SIZE']:
+            applied = state['encoding']
+            data = compress(data, applied)
+            response.set_data(data)
+        if state['etag']:
+            response_cache.put(state['etag'], (data, response.mimetype, applied))
+        return _finish(response, state['etag'], applied)
@@ -0,0 +1,393 @@
+'''
+Live quiz leaderboard.
+
+Scores are ranked in memory by an indexable skip list, so a submission,
+a rank lookup and locating the start of a top-N page are all O(log n).
+Submissions only touch memory; the per-player point deltas pile up and a
+background thread writes them to the scores table every
+LEADERBOARD_FLUSH_INTERVAL seconds, one transaction for everything that
+changed since the previous flush.
+
+Like the HTTP cache, the board lives in process memory: the database
+totals are right with several workers (deltas are added, never
+overwritten) but each worker only ranks the scores it loaded at start
+plus its own submissions. Run live events on a single worker.
+'''
+import atexit
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import request, abort, jsonify
+from sqlalchemy import bindparam
+
+from models import db, Score
+
+MAX_LEVEL = 32
+LEVEL_PROBABILITY = 0.25
+FLUSH_INTERVAL = 1.0
+TOP_DEFAULT = 10
+TOP_MAX = 100
+MAX_POINTS = 100
+MAX_PLAYER_LENGTH = 80
+IN_CLAUSE_SIZE = 500
+
+
+class _Node(object):
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # width[i]: how many level-0 steps next[i] is ahead of this node
+        self.width = [0] * level
+
+
+class SkipList(object):
+    '''
+    Sorted set of comparable keys with positional access: insert, remove,
+    rank and nth are O(log n) expected.
+    '''
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < LEVEL_PROBABILITY:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = rank[i + 1] if i + 1 < self._level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.width[i]
+                node = node.next[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                self._head.width[i] = self._size
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.width[i] = update[i].width[i] - (rank[0] - rank[i])
+            update[i].width[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        update = [None] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for i in range(self._level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        '''
+        1-based position of key. Raises KeyError when it is missing.
+        '''
+        rank = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                rank += node.width[i]
+                node = node.next[i]
+            if node is not self._head and node.key == key:
+                return rank
+        raise KeyError(key)
+
+    def _node_at(self, rank):
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and traversed + node.width[i] <= rank:
+                traversed += node.width[i]
+                node = node.next[i]
+            if traversed == rank:
+                return node
+        return None
+
+    def slice(self, start, count):
+        '''
+        Yields up to count keys starting at the 0-based position start.
+        '''
+        if start >= self._size or count <= 0:
+            return
+        node = self._node_at(start + 1)
+        while node is not None and count > 0:
+            yield node.key
+            node = node.next[0]
+            count -= 1
+
+
+class Leaderboard(object):
+    '''
+    Player totals ranked by score (highest first, ties by player name),
+    plus the point deltas not yet written to the database.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._scores = {}
+            self._order = SkipList()
+            self._pending = Counter()
+            self.loaded = False
+
+    def __len__(self):
+        return len(self._scores)
+
+    def _set(self, player, score):
+        old = self._scores.get(player)
+        if old is not None:
+            self._order.remove((-old, player))
+        self._scores[player] = score
+        self._order.insert((-score, player))
+
+    def load(self, rows):
+        '''
+        Replaces the board with (player, score) rows, keeping any deltas
+        submitted meanwhile on top.
+        '''
+        with self._lock:
+            self._scores = {}
+            self._order = SkipList()
+            for player, score in rows:
+                self._set(player, score)
+            for player, points in self._pending.items():
+                self._set(player, self._scores.get(player, 0) + points)
+            self.loaded = True
+
+    def submit(self, player, points):
+        '''
+        Adds points to a player's total. Returns (score, rank).
+        '''
+        with self._lock:
+            score = self._scores.get(player, 0) + points
+            self._set(player, score)
+            self._pending[player] += points
+            return score, self._order.rank((-score, player))
+
+    def rank(self, player):
+        '''
+        Returns (score, rank) or None for an unknown player.
+        '''
+        with self._lock:
+            score = self._scores.get(player)
+            if score is None:
+                return None
+            return score, self._order.rank((-score, player))
+
+    def top(self, limit, offset=0):
+        '''
+        Returns [(rank, player, score)] for ranks offset+1..offset+limit.
+        '''
+        with self._lock:
+            return [(rank, player, -score) for rank, (score, player)
+                    in enumerate(self._order.slice(offset, limit), start=offset + 1)]
+
+    def take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            return pending
+
+    def restore_pending(self, pending):
+        with self._lock:
+            self._pending.update(pending)
+
+
+leaderboard = Leaderboard()
+
+
+def write_scores(deltas):
+    '''
+    Adds {player: points} to the scores table in one transaction: a single
+    executemany UPDATE for known players and one INSERT for new ones.
+    '''
+    players = list(deltas)
+    existing = set()
+    for start in range(0, len(players), IN_CLAUSE_SIZE):
+        chunk = players[start:start + IN_CLAUSE_SIZE]
+        existing.update(player for player, in db.session.query(Score.player).filter(Score.player.in_(chunk)))
+
+    table = Score.__table__
+    updates = [{'p': player, 'points': deltas[player]} for player in players
+               if player in existing and deltas[player]]
+    inserts = [{'player': player, 'score': deltas[player]} for player in players if player not in existing]
+    if updates:
+        db.session.execute(table.update()
+                           .where(table.c.player == bindparam('p'))
+                           .values(score=table.c.score + bindparam('points')), updates)
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    db.session.commit()
+
+
+def flush(board=leaderboard):
+    '''
+    Writes the pending deltas. They are put back if the write fails, so
+    the next flush retries them. Returns the number of players written.
+    '''
+    pending = board.take_pending()
+    if not pending:
+        return 0
+    try:
+        write_scores(pending)
+    except Exception:
+        db.session.rollback()
+        board.restore_pending(pending)
+        raise
+    return len(pending)
+
+
+_load_lock = threading.Lock()
+
+
+def ensure_loaded(board=leaderboard):
+    '''
+    Fills the board from the scores table on first use.
+    '''
+    if board.loaded:
+        return
+    with _load_lock:
+        if not board.loaded:
+            board.load(db.session.query(Score.player, Score.score))
+
+
+class SnapshotWriter(object):
+    '''
+    Daemon thread flushing the board every interval seconds, started on
+    the first submission. A last flush runs at interpreter exit.
+    '''
+
+    def __init__(self, app, board, interval):
+        self.app = app
+        self.board = board
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trivia-leaderboard', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        with self.app.app_context():
+            try:
+                flush(self.board)
+            except Exception as err:
+                print(err)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+def _player(value):
+    if not isinstance(value, str) or not value.strip() or len(value.strip()) > MAX_PLAYER_LENGTH:
+        abort(400)
+    return value.strip()
+
+
+def setup_leaderboard(app):
+    '''
+    setup_leaderboard(app)
+        registers the score and leaderboard endpoints. Set
+        LEADERBOARD_FLUSH_INTERVAL to None to disable the background
+        writer (scores are then only written by calling flush()).
+    '''
+    app.config.setdefault('LEADERBOARD_FLUSH_INTERVAL', FLUSH_INTERVAL)
+    writer = SnapshotWriter(app, leaderboard, app.config['LEADERBOARD_FLUSH_INTERVAL'])
+
+    @app.route('/scores', methods=['POST'])
+    def post_score():
+        '''
+        Adds `points` (default 1, 0 for a wrong answer) to `player`'s total.
+        '''
+        body = request.get_json()
+        if not body:
+            abort(400)
+        player = _player(body.get('player'))
+        points = body.get('points', 1)
+        if not isinstance(points, int) or isinstance(points, bool) or not 0 <= points <= MAX_POINTS:
+            abort(400)
+
+        ensure_loaded()
+        score, rank = leaderboard.submit(player, points)
+        if app.config['LEADERBOARD_FLUSH_INTERVAL'] is not None:
+            writer.ensure_started()
+        return jsonify({
+                        'success': True,
+                        'player': player,
+                        'score': score,
+                        'rank': rank
+        })
+
+    @app.route('/leaderboard', methods=['GET'])
+    def get_leaderboard():
+        limit = request.args.get('limit', TOP_DEFAULT, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if not 0 < limit <= TOP_MAX or offset < 0:
+            abort(400)
+        ensure_loaded()
+        return jsonify({
+                        'leaderboard': [{'rank': rank, 'player': player, 'score': score}
+                                        for rank, player, score in leaderboard.top(limit, offset)],
+                        'total_players': len(leaderboard)
+        })
+
+    @app.route('/leaderboard/<player>', methods=['GET'])
+    def get_player_rank(player):
+        ensure_loaded()
+        found = leaderboard.rank(player)
+        if found is None:
+            abort(404)
+        score, rank = found
+        return jsonify({
+                        'player': player,
+                        'score': score,
+                        'rank': rank
+        })
@@ -0,0 +1,248 @@
+'''
+Request, database and cache metrics in the Prometheus text format, served
+at /metrics, plus an opt-in sampling profiler for slow requests.
+
+Everything is kept in process memory, so each worker reports its own
+numbers; Prometheus sums them across scrape targets.
+
+Set PROFILE_SLOW_REQUESTS (seconds) to sample the stack of every request
+thread every PROFILE_INTERVAL seconds and write requests slower than the
+threshold to PROFILE_DIR as collapsed stacks ("frame;frame;frame count"),
+the input format of flamegraph.pl and speedscope.
+'''
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .serializers import question_fragments
+from .http_cache import response_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for key, value in sorted(labels.items()))
+
+
+class Registry(object):
+    '''
+    The handful of metric families the app exports, behind one lock.
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.latency_buckets = defaultdict(lambda: [0] * len(self.buckets))
+            self.latency_sum = Counter()
+            self.latency_count = Counter()
+            self.db_queries = Counter()
+            self.db_seconds = Counter()
+
+    def observe_request(self, route, method, status, seconds):
+        with self._lock:
+            self.requests[(route, method, status)] += 1
+            key = (route, method)
+            counts = self.latency_buckets[key]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            self.latency_sum[key] += seconds
+            self.latency_count[key] += 1
+
+    def observe_query(self, route, seconds):
+        with self._lock:
+            self.db_queries[route] += 1
+            self.db_seconds[route] += seconds
+
+    def render(self, caches):
+        lines = []
+        with self._lock:
+            lines.append('# HELP trivia_requests_total Requests by route, method and status code.')
+            lines.append('# TYPE trivia_requests_total counter')
+            for (route, method, status), value in sorted(self.requests.items()):
+                lines.append('trivia_requests_total{{{}}} {}'.format(
+                    _labels(route=route, method=method, status=status), value))
+
+            lines.append('# HELP trivia_request_duration_seconds Request latency by route and method.')
+            lines.append('# TYPE trivia_request_duration_seconds histogram')
+            for (route, method), counts in sorted(self.latency_buckets.items()):
+                for bound, value in zip(self.buckets, counts):
+                    lines.append('trivia_request_duration_seconds_bucket{{{}}} {}'.format(
+                        _labels(route=route, method=method, le=bound), value))
+                total = self.latency_count[(route, method)]
+                lines.append('trivia_request_duration_seconds_bucket{{{}}} {}'.format(
+                    _labels(route=route, method=method, le='+Inf'), total))
+                lines.append('trivia_request_duration_seconds_sum{{{}}} {}'.format(
+                    _labels(route=route, method=method), self.latency_sum[(route, method)]))
+                lines.append('trivia_request_duration_seconds_count{{{}}} {}'.format(
+                    _labels(route=route, method=method), total))
+
+            lines.append('# HELP trivia_db_queries_total SQL statements executed, by route.')
+            lines.append('# TYPE trivia_db_queries_total counter')
+            for route, value in sorted(self.db_queries.items()):
+                lines.append('trivia_db_queries_total{{{}}} {}'.format(_labels(route=route), value))
+            lines.append('# HELP trivia_db_query_seconds_total Time spent executing SQL, by route.')
+            lines.append('# TYPE trivia_db_query_seconds_total counter')
+            for route, value in sorted(self.db_seconds.items()):
+                lines.append('trivia_db_query_seconds_total{{{}}} {}'.format(_labels(route=route), value))
+
+        stats = {}
+        for cache_name, cache in caches.items():
+            hits, misses = cache.hits, cache.misses
+            stats[cache_name] = {'trivia_cache_hits_total': hits,
+                                 'trivia_cache_misses_total': misses,
+                                 'trivia_cache_hit_ratio': hits / float(hits + misses) if hits + misses else 0.0}
+        for name, kind, help in (('trivia_cache_hits_total', 'counter', 'Cache hits.'),
+                                 ('trivia_cache_misses_total', 'counter', 'Cache misses.'),
+                                 ('trivia_cache_hit_ratio', 'gauge', 'Hits over lookups since start.')):
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for cache_name in sorted(stats):
+                lines.append('{}{{{}}} {}'.format(name, _labels(cache=cache_name), stats[cache_name][name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('trivia_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['trivia_query_start'].pop()
+    route = _route() if has_request_context() else 'none'
+    registry.observe_query(route, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _failed_query(context):
+    # after_cursor_execute never runs for a failed statement: drop its
+    # start time, or later queries would be timed from it; without an
+    # execution context the statement failed before it was started
+    if context.connection is None or context.execution_context is None:
+        return
+    starts = context.connection.info.get('trivia_query_start')
+    if starts:
+        starts.pop()
+
+
+class SlowRequestProfiler(object):
+    '''
+    Samples the stacks of threads that are serving a request. A single
+    daemon thread does the sampling and is started on first use.
+    '''
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trivia-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+def write_folded(directory, route, seconds, samples):
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    name = '{}-{}-{}ms.folded'.format(time.strftime('%Y%m%dT%H%M%S'), slug, int(seconds * 1000))
+    with open(os.path.join(directory, name), 'w') as out:
+        for stack, count in samples.most_common():
+            out.write('{} {}\n'.format(stack, count))
+
+
+def setup_metrics(app):
+    '''
+    setup_metrics(app)
+        times every request, registers /metrics and, when
+        PROFILE_SLOW_REQUESTS is set, the slow-request profiler.
+        Must run before any other before_request hook that can answer
+        a request early (such as the ETag check) so those are timed too.
+    '''
+    app.config.setdefault('PROFILE_SLOW_REQUESTS', None)
+    app.config.setdefault('PROFILE_INTERVAL', PROFILE_INTERVAL)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    profiler = SlowRequestProfiler(app.config['PROFILE_INTERVAL'])
+    caches = {'question_fragments': question_fragments, 'responses': response_cache}
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        if app.config['PROFILE_SLOW_REQUESTS'] is not None:
+            profiler.start()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_start', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        route = _route()
+        registry.observe_request(route, request.method, response.status_code, seconds)
+
+        threshold = app.config['PROFILE_SLOW_REQUESTS']
+        if threshold is not None:
+            samples = profiler.stop()
+            if seconds >= threshold and samples:
+                write_folded(app.config['PROFILE_DIR'], route, seconds, samples)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request is skipped for unhandled errors
+        if app.config['PROFILE_SLOW_REQUESTS'] is not None:
+            profiler.stop()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(caches), content_type=PROMETHEUS_CONTENT_TYPE)
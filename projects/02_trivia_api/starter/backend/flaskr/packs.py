@@ -0,0 +1,268 @@
+'''
+Offline quiz packs.
+
+A pack is a gzipped JSON file holding every question of a category (or
+of a named filter) in shuffled order, with the answers replaced by
+salted SHA-256 hashes, so a kiosk can play whole quizzes after a single
+download. A client checks a guess by hashing
+salt + normalize_answer(guess) and comparing it with answer_hash.
+
+Pack files are named after a fingerprint of their content
+(category-3.1f2e...json.gz), so they never change once written and are
+served as immutable. manifest.json lists the current file of every pack
+and is the only thing clients revalidate.
+
+Builds are incremental: all questions are read with one query and only
+packs whose fingerprint changed are compiled and written again. Files
+from the previous manifest are kept for one more build so clients in the
+middle of a download are not cut off. A build holds a file lock in the
+packs directory, so workers and the CLI never build the same directory
+at the same time.
+'''
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+
+from flask import request, abort, jsonify, send_from_directory
+
+from models import db, Question, Category
+from .http_cache import current_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across processes
+    fcntl = None
+
+PACK_FORMAT = 1
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+FILTER_FIELDS = ('category', 'difficulty')
+BUILD_LOCK = '.build.lock'
+
+
+def normalize_answer(answer):
+    return ' '.join(answer.lower().split())
+
+
+def hash_answer(salt, answer):
+    return hashlib.sha256((salt + normalize_answer(answer)).encode('utf-8')).hexdigest()
+
+
+def _matches(row, filters):
+    return all(row[field] in values for field, values in filters.items())
+
+
+def _fingerprint(name, filters, rows, categories):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([PACK_FORMAT, name, filters, categories], sort_keys=True).encode('utf-8'))
+    for row in rows:
+        digest.update(json.dumps([row['id'], row['question'], row['answer'],
+                                  row['category'], row['difficulty']]).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def compile_pack(name, filters, rows, categories, version):
+    '''
+    Returns the gzipped pack. Output only depends on the arguments: the
+    salt and the shuffle are derived from the version.
+    '''
+    salt = hashlib.sha256('{}:{}'.format(name, version).encode('utf-8')).hexdigest()[:16]
+    questions = [{'id': row['id'],
+                  'question': row['question'],
+                  'category': row['category'],
+                  'difficulty': row['difficulty'],
+                  'answer_hash': hash_answer(salt, row['answer'] or '')}
+                 for row in rows]
+    random.Random(version).shuffle(questions)
+    pack = {'format': PACK_FORMAT,
+            'name': name,
+            'version': version,
+            'filter': filters,
+            'categories': categories,
+            'hash': 'sha256(salt + normalized answer)',
+            'salt': salt,
+            'questions': questions}
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as out:
+        out.write(json.dumps(pack, separators=(',', ':')).encode('utf-8'))
+    return buffer.getvalue()
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as manifest:
+            return json.load(manifest)
+    except (IOError, ValueError):
+        return {'format': PACK_FORMAT, 'packs': []}
+
+
+def _write_atomic(path, data):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as out:
+        out.write(data)
+    os.replace(tmp, path)
+
+
+def parse_filters(filters):
+    '''
+    Validates {"category": [..], "difficulty": [..]} (single values are
+    allowed) and returns it with sorted integer lists.
+    Raises ValueError for anything else.
+    '''
+    if not isinstance(filters, dict) or set(filters) - set(FILTER_FIELDS):
+        raise ValueError('filter may only contain {}'.format(', '.join(FILTER_FIELDS)))
+    parsed = {}
+    for field, values in filters.items():
+        if not isinstance(values, list):
+            values = [values]
+        try:
+            parsed[field] = sorted(set(int(value) for value in values))
+        except (TypeError, ValueError):
+            raise ValueError('filter values must be integers')
+    return parsed
+
+
+@contextlib.contextmanager
+def build_lock(directory, wait=True):
+    '''
+    Holds the build lock of a packs directory and yields True, or yields
+    False at once when wait is off and another process holds it.
+    '''
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(directory, BUILD_LOCK), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_packs(directory, custom=None, force=False, wait=True):
+    '''
+    Brings the packs in directory up to date: one pack per category, an
+    "all" pack, and the named filters from custom ({name: filters}) plus
+    those already in the manifest. Returns {'built', 'unchanged',
+    'removed'} lists of pack names / file names, or None without building
+    when wait is off and another process is building the directory.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    with build_lock(directory, wait) as locked:
+        if not locked:
+            return None
+        return _build_packs(directory, custom, force)
+
+
+def _build_packs(directory, custom, force):
+    previous = read_manifest(directory)
+    known = dict((pack['name'], pack) for pack in previous['packs'])
+
+    category_types = dict((id, type) for id, type in db.session.query(Category.id, Category.type))
+    specs = [('all', {})] + [('category-{}'.format(id), {'category': [id]}) for id in sorted(category_types)]
+    filters_by_name = dict((pack['name'], pack['filter']) for pack in previous['packs'] if pack.get('custom'))
+    for name, filters in (custom or {}).items():
+        filters_by_name[name] = parse_filters(filters)
+    custom_names = set(filters_by_name)
+    specs += sorted(filters_by_name.items())
+
+    columns = [Question.id, Question.question, Question.answer, Question.category, Question.difficulty]
+    rows = [dict(zip(('id', 'question', 'answer', 'category', 'difficulty'), row))
+            for row in db.session.query(*columns).order_by(Question.id)]
+
+    summary = {'built': [], 'unchanged': [], 'removed': []}
+    packs = []
+    for name, filters in specs:
+        selected = [row for row in rows if _matches(row, filters)]
+        categories = dict((str(id), category_types[id].lower())
+                          for id in sorted(set(row['category'] for row in selected))
+                          if id in category_types)
+        version = _fingerprint(name, filters, selected, categories)
+        filename = '{}.{}.json.gz'.format(name, version)
+        old = known.get(name)
+        if force or old is None or old['version'] != version \
+                or not os.path.exists(os.path.join(directory, filename)):
+            data = compile_pack(name, filters, selected, categories, version)
+            _write_atomic(os.path.join(directory, filename), data)
+            size = len(data)
+            summary['built'].append(name)
+        else:
+            size = old['bytes']
+            summary['unchanged'].append(name)
+        packs.append({'name': name, 'version': version, 'file': filename, 'filter': filters,
+                      'custom': name in custom_names, 'questions': len(selected), 'bytes': size})
+
+    manifest = {'format': PACK_FORMAT, 'packs': packs}
+    _write_atomic(os.path.join(directory, MANIFEST),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    keep = set(pack['file'] for pack in packs) | set(pack['file'] for pack in previous['packs'])
+    for filename in os.listdir(directory):
+        if filename.endswith('.json.gz') and filename not in keep:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                continue
+            summary['removed'].append(filename)
+    return summary
+
+
+def setup_packs(app):
+    '''
+    setup_packs(app)
+        serves the packs in QUIZ_PACKS_DIR (default instance/packs). With
+        QUIZ_PACKS_AUTO_BUILD (default True) the manifest request rebuilds
+        the changed packs first whenever the data version moved; while
+        another process is building, the current manifest is served.
+        Packs are sent gzipped, or decompressed to clients that do not
+        accept gzip.
+    '''
+    app.config.setdefault('QUIZ_PACKS_DIR', os.path.join(app.instance_path, 'packs'))
+    app.config.setdefault('QUIZ_PACKS_AUTO_BUILD', True)
+    lock = threading.Lock()
+    built = {'version': None}
+
+    def refresh():
+        with lock:
+            version = current_version()
+            if built['version'] != version \
+                    and build_packs(app.config['QUIZ_PACKS_DIR'], wait=False) is not None:
+                built['version'] = version
+
+    @app.route('/packs/manifest.json', methods=['GET'])
+    def get_pack_manifest():
+        if app.config['QUIZ_PACKS_AUTO_BUILD']:
+            refresh()
+        response = jsonify(read_manifest(app.config['QUIZ_PACKS_DIR']))
+        response.headers['Cache-Control'] = 'no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
+
+    @app.route('/packs/<filename>', methods=['GET'])
+    def get_pack(filename):
+        if not filename.endswith('.json.gz'):
+            abort(404)
+        if request.accept_encodings['gzip']:
+            response = send_from_directory(app.config['QUIZ_PACKS_DIR'], filename,
+                                           mimetype='application/json', conditional=True)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            path = os.path.join(app.config['QUIZ_PACKS_DIR'], os.path.basename(filename))
+            try:
+                with gzip.open(path) as pack:
+                    data = pack.read()
+            except FileNotFoundError:
+                abort(404)
+            response = app.response_class(data, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
@@ -0,0 +1,113 @@
+import json
+import threading
+from collections import OrderedDict
+
+from flask import Response
+from sqlalchemy import event
+
+from models import Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = tuple(getattr(Question, field) for field in QUESTION_FIELDS)
+FRAGMENT_CACHE_SIZE = 10000
+
+
+def dumps(obj):
+    '''
+    Encodes obj to compact JSON bytes, with orjson when it is installed.
+    '''
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class FragmentCache(object):
+    '''
+    LRU of encoded question objects keyed by question id.
+
+    Each entry remembers the row it was encoded from and is only reused
+    for an identical row, so an entry can never serve stale data, even
+    if another process changed the question. Dropping entries on
+    update/delete just keeps dead rows from taking up slots.
+    '''
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fragment(self, row):
+        row = tuple(row)
+        with self._lock:
+            entry = self._entries.get(row[0])
+            if entry is not None and entry[0] == row:
+                self._entries.move_to_end(row[0])
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        fragment = dumps(dict(zip(QUESTION_FIELDS, row)))
+        with self._lock:
+            self._entries[row[0]] = (row, fragment)
+            self._entries.move_to_end(row[0])
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def discard(self, ids):
+        with self._lock:
+            for id in ids:
+                self._entries.pop(id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+question_fragments = FragmentCache()
+
+
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+def _discard_question_fragment(mapper, connection, target):
+    question_fragments.discard([target.id])
+
+
+def question_rows(query):
+    '''
+    Narrows a Question query to plain (id, question, answer, category,
+    difficulty) tuples so no ORM objects are built.
+    '''
+    return query.with_entities(*QUESTION_COLUMNS)
+
+
+def questions_response(rows, **fields):
+    '''
+    Builds a JSON response whose "questions" array is spliced together from
+    cached fragments; the remaining fields are encoded as usual.
+    '''
+    body = [b'{"questions":[', b','.join(question_fragments.fragment(row) for row in rows), b']']
+    for key, value in sorted(fields.items()):
+        body.append(b',' + dumps(key) + b':' + dumps(value))
+    body.append(b'}')
+    return Response(b''.join(body), mimetype='application/json')
+
+
+def question_response(row, **fields):
+    '''
+    Same as questions_response for a single "question" object.
+    '''
+    body = [b'{"question":', question_fragments.fragment(row)]
+    for key, value in sorted(fields.items()):
+        body.append(b',' + dumps(key) + b':' + dumps(value))
+    body.append(b'}')
+    return Response(b''.join(body), mimetype='application/json')
@@ -0,0 +1,62 @@
+"""questions.category as an indexed integer foreign key
+
+Revision ID: 4c7e2d91ab35
+Revises: 9a1f3c2b7d10
+Create Date: 2026-10-19 09:40:03.552917
+
+Each step checks the live schema first: trivia.psql already declares the
+column as integer with an FK named "category", while databases created
+from the old model have a varchar column and no constraint.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7e2d91ab35'
+down_revision = '9a1f3c2b7d10'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ix_questions_category_difficulty'
+FK_NAME = 'fk_questions_category_categories'
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    column = next(c for c in inspector.get_columns('questions') if c['name'] == 'category')
+    has_fk = any(fk['referred_table'] == 'categories'
+                 for fk in inspector.get_foreign_keys('questions'))
+    has_index = any(ix['name'] == INDEX_NAME for ix in inspector.get_indexes('questions'))
+
+    if not isinstance(column['type'], sa.Integer):
+        # values that are not a category id would make the cast or the FK fail
+        op.execute(
+            "UPDATE questions SET category = NULL "
+            "WHERE category NOT IN (SELECT CAST(id AS VARCHAR) FROM categories)"
+        )
+    with op.batch_alter_table('questions') as batch_op:
+        if not isinstance(column['type'], sa.Integer):
+            batch_op.alter_column('category', type_=sa.Integer(),
+                                  postgresql_using='category::integer')
+        if not has_fk:
+            batch_op.create_foreign_key(FK_NAME, 'categories', ['category'], ['id'],
+                                        onupdate='CASCADE', ondelete='SET NULL')
+    if not has_index:
+        op.create_index(INDEX_NAME, 'questions', ['category', 'difficulty'])
+
+
+def downgrade():
+    # only undo what upgrade() changed: FK_NAME and the integer column were
+    # added to databases of the old model; the "category" constraint and
+    # integer column of databases restored from trivia.psql stay as they were
+    inspector = sa.inspect(op.get_bind())
+    created_fk = any(fk['name'] == FK_NAME for fk in inspector.get_foreign_keys('questions'))
+
+    op.drop_index(INDEX_NAME, table_name='questions')
+    if not created_fk:
+        return
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_constraint(FK_NAME, type_='foreignkey')
+        batch_op.alter_column('category', type_=sa.String(),
+                              postgresql_using='category::varchar')
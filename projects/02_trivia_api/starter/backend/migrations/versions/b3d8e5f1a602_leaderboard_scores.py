@@ -0,0 +1,32 @@
+"""leaderboard scores
+
+Revision ID: b3d8e5f1a602
+Revises: 4c7e2d91ab35
+Create Date: 2026-10-19 11:05:27.604511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d8e5f1a602'
+down_revision = '4c7e2d91ab35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'scores' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('scores',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('player', sa.String(length=80), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('player')
+    )
+
+
+def downgrade():
+    op.drop_table('scores')
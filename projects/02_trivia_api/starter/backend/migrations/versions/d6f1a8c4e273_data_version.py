@@ -0,0 +1,34 @@
+"""data version shared by the workers
+
+Revision ID: d6f1a8c4e273
+Revises: b3d8e5f1a602
+Create Date: 2026-10-19 22:41:09.527316
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6f1a8c4e273'
+down_revision = 'b3d8e5f1a602'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'data_version' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    data_version = op.create_table('data_version',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('epoch', sa.String(length=16), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(data_version, [{'id': 1, 'epoch': os.urandom(4).hex(), 'value': 0}])
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -11,13 +11,13 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    tables are not created here, see flaskr/bootstrap.py
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
 
 '''
 Question
@@ -29,9 +29,14 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  # leading column also serves plain category lookups and the FK
+  __table_args__ = (
+    Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+  )
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -75,4 +80,36 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Score
+    a player's total on the quiz leaderboard, written in batches by
+    flaskr/leaderboard.py
+'''
+class Score(db.Model):
+  __tablename__ = 'scores'
+
+  id = Column(Integer, primary_key=True)
+  player = Column(String(80), nullable=False, unique=True)
+  score = Column(Integer, nullable=False, default=0)
+
+  def format(self):
+    return {
+      'player': self.player,
+      'score': self.score
+    }
+
+'''
+DataVersion
+    the version of the questions and categories, one row (id 1) shared by
+    every worker: the counter goes up in the transaction of every write to
+    either table (see flaskr/http_cache.py); the epoch is random per
+    database
+'''
+class DataVersion(db.Model):
+  __tablename__ = 'data_version'
+
+  id = Column(Integer, primary_key=True, autoincrement=False)
+  epoch = Column(String(16), nullable=False)
+  value = Column(Integer, nullable=False)
@@ -1,33 +1,30 @@
 import os
+import asyncio
+import gzip
+import tempfile
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+import random
 
+import testing
+from models import db, Question, Category, Score
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.asgi import AsgiAdapter
+from flaskr.bootstrap import bootstrap
+from flaskr.duplicates import find_duplicates
+from flaskr.http_cache import response_cache
+from flaskr.leaderboard import SkipList, leaderboard, flush
+from flaskr.packs import build_lock, build_packs, hash_answer
+from flaskr.serializers import question_fragments
 
 
-class TriviaTestCase(unittest.TestCase):
-    """This class represents the trivia test case"""
+class TriviaTestCase(testing.TransactionalTestCase):
+    """This class represents the trivia test case
 
-    def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}".format('cc', 'cc', 'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-
-    def tearDown(self):
-        """Executed after each test"""
-        pass
+    The app, the schema and the trivia.psql data are shared by all tests;
+    see testing.py for how every test is rolled back and which database
+    is used.
+    """
 
     """
     TODO
@@ -40,10 +37,68 @@ class TriviaTestCase(unittest.TestCase):
         data = json.loads(res.data)
         self.assertGreater(len(data['categories']), 0)
 
+    def test_metrics(self):
+        self.client().get('/categories')
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        body = res.data.decode()
+        self.assertIn('trivia_requests_total{method="GET",route="/categories",status="200"}', body)
+        self.assertIn('trivia_request_duration_seconds_bucket{le="+Inf",method="GET",route="/categories"}', body)
+        self.assertIn('trivia_db_queries_total{route="/categories"}', body)
+        self.assertIn('trivia_cache_hit_ratio{cache="question_fragments"}', body)
+
+    def test_failed_query_does_not_skew_timings(self):
+        with db.engine.connect() as connection:
+            with self.assertRaises(Exception):
+                connection.execute('SELECT * FROM no_such_table')
+            self.assertEqual(connection.info.get('trivia_query_start'), [])
+
     def test_get_categories_wrong_request(self):
         res = self.client().get('/categorie')
         self.assertEqual(res.status_code, 404)
         
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_get_questions_etag_changes_after_write(self):
+        etag = self.client().get('/questions').headers['ETag']
+        self.client().post('/questions', json={'question': 'Etag?', 'answer': 'A', 'difficulty': 1, 'category': 1})
+        res = self.client().get('/questions', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_etag_is_shared_and_transactional(self):
+        etag = self.client().get('/questions').headers['ETag']
+        db.session.add(Category('Rolled back'))
+        db.session.flush()
+        db.session.rollback()
+        # a worker that never served the page still knows the ETag
+        response_cache.clear()
+        res = self.client().get('/questions', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+    def test_get_questions_gzip(self):
+        self.app.config['COMPRESS_MIN_SIZE'] = 0
+        res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(res.data))
+        self.assertTrue(data['questions'])
+
+    def test_get_category_stats(self):
+        res = self.client().get('/categories/stats')
+        self.assertEqual(res.status_code, 200)
+        data = res.get_json()
+        self.assertGreater(len(data['categories']), 0)
+        self.assertEqual(data['total_questions'],
+                         sum(c['total_questions'] for c in data['categories']))
+        self.assertEqual(data['total_questions'], Question.query.count())
+
     def test_get_questions(self):
         res = self.client().get('/questions')
         self.assertEqual(res.status_code, 200)
@@ -62,19 +117,67 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 405)
 
     def test_delete_questions(self):
-        res = self.client().delete('/questions/7')
+        res = self.client().delete('/questions/9')
         data = json.loads(res.data)
 
-        questions = Question.query.filter(Question.id ==48).one_or_none()
-        
+        questions = Question.query.filter(Question.id == 9).one_or_none()
+
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertEqual(questions, None)
 
+    def test_deleted_question_leaves_fragment_cache(self):
+        question = Question(question='Cached?', answer='Yes', category=1, difficulty=1)
+        question.insert()
+        res = self.client().get('/categories/1/questions')
+        self.assertIn(question.id, [q['id'] for q in res.get_json()['questions']])
+        self.assertIn(question.id, question_fragments._entries)
+
+        self.client().delete('/questions/{}'.format(question.id))
+        self.assertNotIn(question.id, question_fragments._entries)
+
     def test_delete_questions_empty(self):
             res = self.client().delete('/questions/')
             self.assertEqual(res.status_code, 404)
 
+    def test_batch_delete_questions(self):
+        ids = []
+        for i in range(3):
+            question = Question(question='Batch delete {}?'.format(i), answer='A', category=1, difficulty=1)
+            question.insert()
+            ids.append(question.id)
+        res = self.client().delete('/questions', json={'ids': ids + [999999]})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 3)
+        self.assertEqual(data['results'][-1], {'id': 999999, 'status': 'not_found'})
+        self.assertEqual(Question.query.filter(Question.id.in_(ids)).count(), 0)
+
+    def test_batch_delete_questions_requires_selection(self):
+        res = self.client().delete('/questions', json={'filter': {}})
+        self.assertEqual(res.status_code, 400)
+
+    def test_batch_delete_questions_rejects_non_integer_ids(self):
+        count = Question.query.count()
+        for ids in ['12', 12, [1.0], [True], ['1']]:
+            res = self.client().delete('/questions', json={'ids': ids})
+            self.assertEqual(res.status_code, 400)
+        self.assertEqual(Question.query.count(), count)
+
+    def test_batch_patch_questions(self):
+        question = Question(question='Batch patch?', answer='A', category=1, difficulty=1)
+        question.insert()
+        res = self.client().patch('/questions', json={'ids': [question.id], 'changes': {'category': 2, 'difficulty': 5}})
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['results'], [{'id': question.id, 'status': 'updated'}])
+        updated = Question.query.get(question.id)
+        self.assertEqual((updated.category, updated.difficulty), (2, 5))
+
+    def test_batch_patch_questions_unknown_category(self):
+        res = self.client().patch('/questions', json={'filter': {'category': 1}, 'changes': {'category': 999}})
+        self.assertEqual(res.status_code, 400)
+
     def test_search_questions(self):
         '''Test if search term in questions returned. '''
         response = self.client().post('/questions/search', json={'searchTerm':'title'})
@@ -116,6 +219,19 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertGreater(data['total_questions'], 0)
 
+    def test_post_questions_without_neighbors(self):
+        new_question = {
+            "question": "Which planet is closest to the sun?",
+            "answer": "Mercury",
+            "difficulty": 1,
+            "category": 1
+        }
+        res = self.client().post('/questions?neighbors=0', json=new_question)
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], data['created'])
+        self.assertNotIn('questions', data)
+
     def test_post_questions_bad_request(self):
         res = self.client().post('/questions', json={})
         self.assertEqual(res.status_code, 400)
@@ -133,6 +249,242 @@ class TriviaTestCase(unittest.TestCase):
         res = self.client().post('/quizzes', json={})
         self.assertEqual(res.status_code, 400)
 
+    def test_import_questions_ndjson(self):
+        body = '\n'.join([
+            json.dumps({'question': 'Imported question?', 'answer': 'A', 'category': 1, 'difficulty': 1}),
+            json.dumps({'question': 'Bad category?', 'answer': 'A', 'category': 999, 'difficulty': 1}),
+            'not json',
+        ])
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['rejected'], 2)
+        self.assertEqual([e['line'] for e in data['errors']], [2, 3])
+
+    def test_import_questions_csv(self):
+        body = 'question,answer,category,difficulty\n"Imported, with comma?",B,2,3\n'
+        res = self.client().post('/questions/import?format=csv', data=body)
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+
+    def test_import_questions_bad_format(self):
+        res = self.client().post('/questions/import?format=xml', data='<q/>')
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        self.assertEqual(res.status_code, 200)
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertGreater(len(rows), 0)
+        self.assertEqual(set(rows[0].keys()), {'id', 'question', 'answer', 'category', 'difficulty'})
+
+        res = self.client().get('/questions/export?format=csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.data.decode().startswith('id,question,answer,category,difficulty'))
+
+    def test_leaderboard(self):
+        for player, points in (('ann', 3), ('bob', 5), ('cid', 1), ('ann', 4)):
+            res = self.client().post('/scores', json={'player': player, 'points': points})
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual((res.get_json()['score'], res.get_json()['rank']), (7, 1))
+
+        data = self.client().get('/leaderboard?limit=2').get_json()
+        self.assertEqual(data['total_players'], 3)
+        self.assertEqual([(r['rank'], r['player'], r['score']) for r in data['leaderboard']],
+                         [(1, 'ann', 7), (2, 'bob', 5)])
+        data = self.client().get('/leaderboard/cid').get_json()
+        self.assertEqual((data['score'], data['rank']), (1, 3))
+        self.assertEqual(self.client().get('/leaderboard/nobody').status_code, 404)
+        self.assertEqual(self.client().post('/scores', json={'player': 'ann', 'points': -1}).status_code, 400)
+
+    def test_leaderboard_flush_coalesces_and_reloads(self):
+        for points in (1, 2, 3):
+            self.client().post('/scores', json={'player': 'ann', 'points': points})
+        self.client().post('/scores', json={'player': 'bob', 'points': 0})
+        with self.app.app_context():
+            self.assertEqual(flush(), 2)
+            self.assertEqual(flush(), 0)
+        self.assertEqual(dict(db.session.query(Score.player, Score.score)), {'ann': 6, 'bob': 0})
+
+        self.client().post('/scores', json={'player': 'bob', 'points': 2})
+        with self.app.app_context():
+            flush()
+        leaderboard.reset()
+        data = self.client().get('/leaderboard').get_json()
+        self.assertEqual([(r['player'], r['score']) for r in data['leaderboard']], [('ann', 6), ('bob', 2)])
+
+    def test_skip_list_matches_sorted_list(self):
+        rng = random.Random(7)
+        skip, expected = SkipList(seed=7), []
+        for _ in range(2000):
+            key = rng.randrange(300)
+            if key in expected:
+                skip.remove(key)
+                expected.remove(key)
+            else:
+                skip.insert(key)
+                expected.append(key)
+                expected.sort()
+        self.assertEqual(list(skip.slice(0, len(expected))), expected)
+        for position, key in enumerate(expected, start=1):
+            self.assertEqual(skip.rank(key), position)
+        self.assertEqual(list(skip.slice(10, 5)), expected[10:15])
+
+    def asgi_request(self, method, path, body=b'', query_string=b''):
+        adapter = AsgiAdapter(self.app, max_concurrency=2)
+        scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path,
+                 'query_string': query_string, 'root_path': '', 'scheme': 'http',
+                 'headers': [(b'content-type', b'application/json'),
+                             (b'content-length', str(len(body)).encode())]}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(adapter(scope, receive, send))
+        adapter.executor.shutdown()
+        return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+    def test_asgi_matches_wsgi(self):
+        status, body = self.asgi_request('GET', '/questions', query_string=b'page=2')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.client().get('/questions?page=2').get_json())
+
+        payload = json.dumps({'searchTerm': 'title'}).encode()
+        status, body = self.asgi_request('POST', '/questions/search', body=payload)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.client().post('/questions/search', data=payload,
+                                                              content_type='application/json').get_json())
+        self.assertEqual(self.asgi_request('GET', '/questions', query_string=b'page=99')[0],
+                         self.client().get('/questions?page=99').status_code)
+
+    def test_quiz_packs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.app.config['QUIZ_PACKS_DIR'] = tmp
+            res = self.client().get('/packs/manifest.json')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(self.client().get('/packs/manifest.json',
+                                               headers={'If-None-Match': res.headers['ETag']}).status_code, 304)
+            packs = dict((pack['name'], pack) for pack in res.get_json()['packs'])
+            self.assertEqual(set(packs), set(['all'] + ['category-{}'.format(i) for i in range(1, 7)]))
+
+            url = '/packs/' + packs['category-1']['file']
+            res = self.client().get(url, headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('immutable', res.headers['Cache-Control'])
+            self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+            pack = json.loads(gzip.decompress(res.data))
+            res.close()
+
+            # clients that do not accept gzip get the plain JSON
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('Content-Encoding', res.headers)
+            self.assertIn('Accept-Encoding', res.headers['Vary'])
+            self.assertEqual(json.loads(res.data), pack)
+            self.assertEqual(self.client().get('/packs/missing.json.gz').status_code, 404)
+            expected = Question.query.filter(Question.category == 1).all()
+            self.assertEqual(sorted(q['id'] for q in pack['questions']), sorted(q.id for q in expected))
+            answers = dict((q.id, q.answer) for q in expected)
+            for q in pack['questions']:
+                self.assertEqual(q['answer_hash'], hash_answer(pack['salt'], '  ' + answers[q['id']].upper()))
+
+    def test_quiz_packs_rebuild_incrementally(self):
+        with tempfile.TemporaryDirectory() as tmp, self.app.app_context():
+            build_packs(tmp)
+            self.assertEqual(build_packs(tmp)['built'], [])
+
+            Question(question='Pack?', answer='Yes', category=1, difficulty=1).insert()
+            summary = build_packs(tmp, custom={'easy': {'difficulty': 1}})
+            self.assertEqual(sorted(summary['built']), ['all', 'category-1', 'easy'])
+            # the replaced files stay for one more build (next to the
+            # manifest and the build lock)
+            self.assertEqual(len(os.listdir(tmp)), 2 + 8 + 2)
+            self.assertEqual(build_packs(tmp)['built'], [])
+            self.assertEqual(len(os.listdir(tmp)), 2 + 8)
+
+            # another process building the directory: skip, or wait for it
+            with build_lock(tmp):
+                self.assertIsNone(build_packs(tmp, wait=False))
+
+            result = self.app.test_cli_runner().invoke(args=['trivia', 'build-packs', '--out', tmp, '--force'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('built 8', result.output)
+
+    def test_post_near_duplicate_question(self):
+        payload = {'question': 'what is the heaviest organ in the human body', 'answer': 'Liver',
+                   'difficulty': 4, 'category': 1}
+        res = self.client().post('/questions', json=payload)
+        data = res.get_json()
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(data['duplicates'][0]['id'], 20)
+
+        payload['force'] = True
+        res = self.client().post('/questions', json=payload)
+        self.assertEqual(res.status_code, 200)
+        created = res.get_json()['created']
+
+        data = self.client().get('/questions/duplicates').get_json()
+        self.assertEqual(data['total_groups'], 1)
+        self.assertEqual([q['id'] for q in data['groups'][0]['questions']], [20, created])
+
+    def test_duplicate_index_follows_deletes(self):
+        payload = {'question': 'Who discovered penicillin?', 'answer': 'Fleming', 'difficulty': 3, 'category': 1}
+        self.assertEqual(self.client().post('/questions', json=payload).status_code, 409)
+        self.client().delete('/questions/21')
+        self.assertEqual(self.client().post('/questions', json=payload).status_code, 200)
+
+        payload['question'] = 'Hematology is a branch of medicine involving the study of what?'
+        self.assertEqual(self.client().post('/questions', json=payload).status_code, 409)
+        self.client().delete('/questions', json={'ids': [22]})
+        self.assertEqual(self.client().post('/questions', json=payload).status_code, 200)
+
+    def test_import_rejects_near_duplicates(self):
+        body = '\n'.join([
+            json.dumps({'question': 'Who discovered penicillin', 'answer': 'A', 'category': 1, 'difficulty': 1}),
+            json.dumps({'question': 'A brand new question?', 'answer': 'A', 'category': 1, 'difficulty': 1}),
+            json.dumps({'question': 'A brand-new question', 'answer': 'A', 'category': 1, 'difficulty': 1}),
+        ])
+        data = self.client().post('/questions/import', data=body).get_json()
+        self.assertEqual((data['inserted'], data['rejected']), (1, 2))
+        self.assertEqual([e['error'] for e in data['errors']],
+                         ['near duplicate of question 21', 'near duplicate of line 2'])
+
+        # rows from the import are indexed too
+        payload = {'question': 'a brand new question', 'answer': 'A', 'difficulty': 1, 'category': 1}
+        self.assertEqual(self.client().post('/questions', json=payload).status_code, 409)
+        imported = Question.query.filter(Question.question == 'A brand new question?').one()
+        self.assertEqual([id for id, _ in find_duplicates('a brand new question')], [imported.id])
+
+        data = self.client().post('/questions/import?force=true', data=body).get_json()
+        self.assertEqual(data['inserted'], 3)
+
+
+class BootstrapTestCase(unittest.TestCase):
+    """Startup: the app factory stays off the database, bootstrap sets it up."""
+
+    def test_create_app_does_not_touch_database(self):
+        # any connection attempt would fail on a path that cannot exist
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:////nonexistent/dir/trivia.db'})
+        self.assertNotIn('flask_migrate', type(app.extensions['migrate']).__module__)
+
+    def test_bootstrap_migrates_and_seeds_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'trivia.db')})
+            with app.app_context():
+                self.assertTrue(bootstrap(seed=True))
+                self.assertFalse(bootstrap(seed=True))
+                self.assertEqual(Category.query.count(), 6)
+                self.assertEqual(Question.query.count(), 19)
+                db.session.remove()
+                db.get_engine(app).dispose()
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    testing.main()
\ No newline at end of file
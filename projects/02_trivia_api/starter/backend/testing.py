@@ -0,0 +1,203 @@
+'''
+Test harness for the trivia backend.
+
+The schema is created and the trivia.psql data loaded once per test
+process. Every test then runs inside a transaction on a single connection
+with the session in a SAVEPOINT that is re-opened after each commit, so
+the endpoints can commit freely and tearDown rolls everything back.
+
+Database selection, in order:
+- TRIVIA_TEST_DATABASE_URL: any SQLAlchemy URL (its tables are dropped and
+  recreated!)
+- TRIVIA_TEST_EPHEMERAL_POSTGRES=1: a throwaway cluster started with
+  initdb/pg_ctl in a temporary directory and removed at exit
+- otherwise an in-memory SQLite database
+
+TRIVIA_TEST_BUDGET (seconds, default 30) is the time budget for the whole
+suite; the timing report printed at the end fails the run when it is
+exceeded.
+'''
+import atexit
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from sqlalchemy import event
+
+from flaskr import create_app
+from flaskr.bootstrap import load_fixtures
+from flaskr.duplicates import question_index
+from flaskr.http_cache import bump_version, response_cache
+from flaskr.leaderboard import leaderboard
+from flaskr.metrics import registry
+from flaskr.serializers import question_fragments
+from models import db
+
+DEFAULT_BUDGET = 30.0
+SLOWEST_REPORTED = 5
+
+_state = {'app': None}
+timings = []
+
+
+def _pg_binary(name):
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob.glob('/usr/lib/postgresql/*/bin/{}'.format(name)))
+    if not candidates:
+        raise RuntimeError('{} not found, install PostgreSQL or unset TRIVIA_TEST_EPHEMERAL_POSTGRES'.format(name))
+    return candidates[-1]
+
+
+def start_ephemeral_postgres():
+    '''
+    Starts a private PostgreSQL cluster (trust auth, fsync off, unix socket
+    only) and returns its URL. The cluster is stopped and deleted at exit.
+    '''
+    datadir = tempfile.mkdtemp(prefix='trivia-pg-')
+    subprocess.check_call([_pg_binary('initdb'), '-D', datadir, '-U', 'trivia', '-A', 'trust', '-E', 'UTF8'],
+                          stdout=subprocess.DEVNULL)
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    options = "-F -p {} -k {} -c listen_addresses=''".format(port, datadir)
+    subprocess.check_call([_pg_binary('pg_ctl'), '-D', datadir, '-o', options, '-l',
+                           os.path.join(datadir, 'server.log'), '-w', 'start'], stdout=subprocess.DEVNULL)
+
+    def stop():
+        subprocess.call([_pg_binary('pg_ctl'), '-D', datadir, '-m', 'immediate', 'stop'],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(datadir, ignore_errors=True)
+    atexit.register(stop)
+    return 'postgresql://trivia@/postgres?host={}&port={}'.format(datadir, port)
+
+
+def database_url():
+    if os.environ.get('TRIVIA_TEST_DATABASE_URL'):
+        return os.environ['TRIVIA_TEST_DATABASE_URL']
+    if os.environ.get('TRIVIA_TEST_EPHEMERAL_POSTGRES'):
+        return start_ephemeral_postgres()
+    return 'sqlite://'
+
+
+def _use_real_savepoints(engine):
+    # pysqlite's own transaction handling breaks SAVEPOINT; let SQLAlchemy
+    # emit BEGIN itself instead
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def emit_begin(connection):
+        connection.execute('BEGIN')
+
+
+def get_app():
+    '''
+    Returns the shared test app, creating the schema and loading the
+    fixtures on first use. The schema comes from the models with
+    create_all rather than the migrations, which is faster on a fresh
+    database.
+    '''
+    if _state['app'] is None:
+        url = database_url()
+        app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'TESTING': True,
+                          'LEADERBOARD_FLUSH_INTERVAL': None})
+        with app.app_context():
+            engine = db.engine
+            if engine.dialect.name == 'sqlite':
+                engine.dispose()
+                _use_real_savepoints(engine)
+            db.drop_all()
+            db.create_all()
+            with engine.begin() as connection:
+                load_fixtures(connection)
+        _state['app'] = app
+    return _state['app']
+
+
+class TransactionalTestCase(unittest.TestCase):
+    '''
+    Base class for trivia tests: self.app, self.client and a database that
+    is rolled back after every test.
+    '''
+
+    def setUp(self):
+        self.app = get_app()
+        self.client = self.app.test_client
+        self._config = dict(self.app.config)
+        self._started = time.perf_counter()
+
+        self._connection = db.get_engine(self.app).connect()
+        self._transaction = self._connection.begin()
+        self._original_session = db.session
+
+        session = db.create_scoped_session(options={'bind': self._connection, 'binds': {}})
+        # each request's app context teardown would otherwise close the
+        # session and drop the savepoint
+        session.remove = lambda: None
+        db.session = session
+        session.begin_nested()
+
+        @event.listens_for(session, 'after_transaction_end')
+        def restart_savepoint(sess, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                sess.expire_all()
+                sess.begin_nested()
+        self._restart_savepoint = restart_savepoint
+
+    def tearDown(self):
+        # roll back the open savepoint without re-opening it; closing the
+        # session would leave it dangling on the connection
+        event.remove(db.session, 'after_transaction_end', self._restart_savepoint)
+        db.session.rollback()
+        type(db.session).remove(db.session)
+        db.session = self._original_session
+        self._transaction.rollback()
+        self._connection.close()
+
+        # in-process caches may hold rolled back state; the committed bump
+        # keeps the next test's writes from reusing a rolled back version
+        with db.get_engine(self.app).begin() as connection:
+            bump_version(connection)
+        response_cache.clear()
+        question_fragments.clear()
+        leaderboard.reset()
+        question_index.reset()
+        registry.reset()
+        self.app.config.clear()
+        self.app.config.update(self._config)
+        timings.append((self.id(), time.perf_counter() - self._started))
+
+
+def timing_report(budget=None):
+    '''
+    Returns (report lines, over budget) for the tests run so far.
+    '''
+    if budget is None:
+        budget = float(os.environ.get('TRIVIA_TEST_BUDGET', DEFAULT_BUDGET))
+    total = sum(seconds for _, seconds in timings)
+    lines = ['{} tests in {:.3f}s (budget {:.1f}s)'.format(len(timings), total, budget)]
+    for test_id, seconds in sorted(timings, key=lambda t: -t[1])[:SLOWEST_REPORTED]:
+        lines.append('  {:8.3f}s  {}'.format(seconds, test_id))
+    if total > budget:
+        lines.append('test time budget exceeded')
+    return lines, total > budget
+
+
+def main():
+    '''
+    unittest.main() followed by the timing report.
+    '''
+    program = unittest.main(exit=False)
+    lines, over_budget = timing_report()
+    print('\n'.join(lines), file=sys.stderr)
+    sys.exit(0 if program.result.wasSuccessful() and not over_budget else 1)
@@ -0,0 +1,85 @@
+'''
+Auth overhead per request with and without the verified-token cache.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_auth
+    python -m benchmarks.bench_auth --tokens 1 50 5000 --requests 20000
+
+Signs RS256 tokens with an in-process TestIssuer (no network), then times a requires_auth-protected no-op view two ways:
+called directly inside one request context (the auth work alone) and
+through the Flask test client (a whole request). --tokens sets how many
+distinct tokens the requests rotate over; with more tokens than the
+cache holds every request misses.
+'''
+import argparse
+import time
+
+from flask import Flask
+
+from src.auth import auth
+from src.auth.providers import TestIssuer
+from src.auth.token_cache import DEFAULT_MAXSIZE, TokenCache
+
+
+def build_app():
+    app = Flask(__name__)
+
+    @app.route('/drinks-detail')
+    @auth.requires_auth('get:drinks-detail')
+    def drinks_detail(payload):
+        return ''
+
+    return app, drinks_detail
+
+
+def per_request_us(fn, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        fn(i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokens', type=int, nargs='+', default=[1, 100, 2 * DEFAULT_MAXSIZE])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAXSIZE)
+    args = parser.parse_args()
+
+    issuer = TestIssuer('https://' + auth.AUTH0_DOMAIN + '/', auth.API_AUDIENCE)
+    auth.key_provider = issuer
+    app, view = build_app()
+    client = app.test_client()
+
+    print('{:>7} {:>9} {:>12} {:>12} {:>9}'.format('tokens', 'cache', 'auth us', 'request us', 'hit %'))
+    for count in args.tokens:
+        tokens = [issuer.mint(['get:drinks-detail'], sub='auth0|barista-{}'.format(i))
+                  for i in range(count)]
+        headers = [{'Authorization': 'Bearer ' + token} for token in tokens]
+        for size in (0, args.cache_size):
+            auth.token_cache = TokenCache(maxsize=size)
+            for header in headers:  # warm up: first verification of every token
+                client.get('/drinks-detail', headers=header)
+            auth.token_cache.hits = auth.token_cache.misses = 0
+
+            def call_view(i):
+                with app.test_request_context('/drinks-detail', headers=headers[i % count]):
+                    pass
+            context_us = per_request_us(call_view, args.requests)
+
+            def call_auth(i):
+                with app.test_request_context('/drinks-detail', headers=headers[i % count]):
+                    view()
+            auth_us = per_request_us(call_auth, args.requests) - context_us
+            cache = auth.token_cache
+            hit_rate = 100.0 * cache.hits / max(1, cache.hits + cache.misses)
+
+            request_us = per_request_us(
+                lambda i: client.get('/drinks-detail', headers=headers[i % count]), args.requests)
+            print('{:>7} {:>9} {:>12.1f} {:>12.1f} {:>9.1f}'.format(
+                count, size or 'off', auth_us, request_us, hit_rate))
+
+
+if __name__ == '__main__':
+    main()
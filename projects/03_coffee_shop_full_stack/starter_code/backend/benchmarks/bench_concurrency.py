@@ -0,0 +1,127 @@
+'''
+Read/write throughput of the drink table with 1 to 16 worker processes.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_concurrency
+    python -m benchmarks.bench_concurrency --workers 1 4 16 --seconds 10 --write-ratio 0.2
+
+Every worker is a separate process (like a gunicorn worker) with its own
+engine, running model calls against one SQLite file for a fixed time:
+reads load a random drink and serialize it, writes change a random
+drink's title through Drink.update(). Each worker count runs twice on a
+fresh database, with SQLITE_PROFILE=plain (SQLite defaults, a
+connection per request, no retries: the old behaviour) and with the
+tuned profile (WAL, busy_timeout, pooled connections, retry on busy).
+Failed operations are the ones that still raised, e.g. "database is
+locked".
+'''
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+DRINKS = 200
+PROFILES = ('plain', 'tuned')
+
+
+def worker(database_url, seconds, write_ratio, start_at):
+    from flask import Flask
+    from sqlalchemy import exc
+    from src.database import models
+    from src.database.models import db, setup_db, Drink
+
+    if models.SQLITE_PROFILE == 'plain':
+        models.WRITE_RETRIES = 1
+    app = Flask(__name__)
+    setup_db(app, database_url)
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    pid = os.getpid()
+    with app.app_context():
+        time.sleep(max(0, start_at - time.time()))
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            write = random.random() < write_ratio
+            try:
+                drink = Drink.query.get(random.randint(1, DRINKS))
+                if write:
+                    drink.title = 'drink {} {}-{}'.format(drink.id, pid, counts['writes'])
+                    drink.update()
+                else:
+                    drink.long()
+                counts['writes' if write else 'reads'] += 1
+            except exc.OperationalError:
+                db.session.rollback()
+                counts['errors'] += 1
+            finally:
+                db.session.remove()  # end of the "request"
+    print(json.dumps(counts))
+
+
+def prepare(path):
+    from flask import Flask
+    from src.database.models import db, setup_db, Drink
+
+    app = Flask(__name__)
+    setup_db(app, 'sqlite:///' + path)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Drink(title='drink {}'.format(i),
+                                 recipe=[{'name': 'milk', 'color': 'white', 'parts': i % 4 + 1}])
+                           for i in range(1, DRINKS + 1))
+        db.session.commit()
+        db.get_engine(app).dispose()
+
+
+def run(profile, workers, args, tmp):
+    path = os.path.join(tmp, '{}-{}.db'.format(profile, workers))
+    env = dict(os.environ, SQLITE_PROFILE=profile)
+    subprocess.check_call([sys.executable, '-m', 'benchmarks.bench_concurrency', '--prepare', path], env=env)
+    start_at = time.time() + 2.0
+    procs = [subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_concurrency',
+                               '--worker', 'sqlite:///' + path, '--seconds', str(args.seconds),
+                               '--write-ratio', str(args.write_ratio), '--start-at', str(start_at)],
+                              env=env, stdout=subprocess.PIPE)
+             for _ in range(workers)]
+    totals = {'reads': 0, 'writes': 0, 'errors': 0}
+    for proc in procs:
+        out, _ = proc.communicate()
+        for key, value in json.loads(out).items():
+            totals[key] += value
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare(args.prepare)
+        return
+    if args.worker:
+        worker(args.worker, args.seconds, args.write_ratio, args.start_at)
+        return
+
+    print('{:>7} {:>7} {:>10} {:>10} {:>8}'.format('profile', 'workers', 'reads/s', 'writes/s', 'errors'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            for profile in args.profiles:
+                totals = run(profile, workers, args, tmp)
+                print('{:>7} {:>7} {:>10.0f} {:>10.0f} {:>8}'.format(
+                    profile, workers, totals['reads'] / args.seconds,
+                    totals['writes'] / args.seconds, totals['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+'''
+Throughput of the authenticated drink endpoints under realistic token mixes.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_endpoints
+    python -m benchmarks.bench_endpoints --requests 5000 --mix shift fresh
+
+Tokens come from an in-process TestIssuer (AUTH_KEY_PROVIDER=issuer), so
+nothing talks to Auth0, and the app runs on a temporary SQLite file.
+Each endpoint is driven through the Flask test client with requests
+spread over the tokens of a mix:
+
+    shift   a shift's worth of long-lived tokens reused all day: baristas
+            (RS256, get:drinks-detail) and managers (ES256, everything)
+    fresh   a new token on every request, so every request verifies a
+            signature (the worst case for the token cache)
+
+Reported per endpoint and mix: requests/sec, mean latency and how many
+responses were not 200.
+'''
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+BARISTA = ['get:drinks-detail']
+MANAGER = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+RECIPE = [{'name': 'espresso', 'color': 'brown', 'parts': 1},
+          {'name': 'milk', 'color': 'white', 'parts': 2}]
+MIXES = ('shift', 'fresh')
+ENDPOINTS = ('GET /drinks-detail', 'POST /drinks', 'PATCH /drinks/<id>', 'DELETE /drinks/<id>')
+
+
+def tokens_for(issuer, mix, endpoint, count):
+    manager_only = not endpoint.startswith('GET')
+    if mix == 'fresh':
+        return [issuer.mint(MANAGER if manager_only or i % 5 == 0 else BARISTA,
+                            sub='auth0|staff-{}'.format(i), algorithm=('RS256', 'ES256')[i % 2])
+                for i in range(count)]
+    managers = [issuer.mint(MANAGER, sub='auth0|manager-{}'.format(i), algorithm='ES256')
+                for i in range(2)]
+    baristas = [issuer.mint(BARISTA, sub='auth0|barista-{}'.format(i)) for i in range(8)]
+    return managers if manager_only else managers + baristas
+
+
+def seed(db, Drink, prefix, count):
+    drinks = [Drink(title='{}-{}'.format(prefix, i), recipe=RECIPE) for i in range(count)]
+    db.session.add_all(drinks)
+    db.session.commit()
+    return [drink.id for drink in drinks]
+
+
+def run(client, requests):
+    statuses = {}
+    start = time.perf_counter()
+    for method, path, headers, body in requests:
+        status = client.open(path, method=method, headers=headers, json=body).status_code
+        statuses[status] = statuses.get(status, 0) + 1
+    return time.perf_counter() - start, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='per endpoint and mix')
+    parser.add_argument('--mix', nargs='+', choices=MIXES, default=list(MIXES))
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['AUTH_KEY_PROVIDER'] = 'issuer'
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    from src.api import app
+    from src.auth import auth
+    from src.database.models import db, Drink
+
+    issuer = auth.key_provider
+    client = app.test_client()
+    seed(db, Drink, 'menu', 50)
+
+    print('{:<22} {:>6} {:>9} {:>9} {:>10}'.format('endpoint', 'mix', 'req/s', 'mean ms', 'not 200'))
+    for mix in args.mix:
+        for endpoint in ENDPOINTS:
+            tokens = tokens_for(issuer, mix, endpoint, args.requests)
+            headers = [{'Authorization': 'Bearer ' + token} for token in tokens]
+            auth.token_cache.clear()
+            method = endpoint.split()[0]
+            if method == 'GET':
+                requests = [('GET', '/drinks-detail', headers[i % len(headers)], None)
+                            for i in range(args.requests)]
+            elif method == 'POST':
+                requests = [('POST', '/drinks', headers[i % len(headers)],
+                             {'title': '{}-new-{}'.format(mix, i), 'recipe': RECIPE})
+                            for i in range(args.requests)]
+            elif method == 'PATCH':
+                ids = seed(db, Drink, '{}-patch'.format(mix), 100)
+                requests = [('PATCH', '/drinks/{}'.format(ids[i % len(ids)]), headers[i % len(headers)],
+                             {'title': '{}-patched-{}'.format(mix, i)})
+                            for i in range(args.requests)]
+            else:
+                ids = seed(db, Drink, '{}-delete'.format(mix), args.requests)
+                requests = [('DELETE', '/drinks/{}'.format(id), headers[i % len(headers)], None)
+                            for i, id in enumerate(ids)]
+            elapsed, statuses = run(client, requests)
+            # back to the 50 menu drinks, so every run lists the same menu
+            Drink.query.filter(~Drink.title.like('menu-%')).delete(synchronize_session=False)
+            db.session.commit()
+            print('{:<22} {:>6} {:>9.0f} {:>9.2f} {:>10}'.format(
+                endpoint, mix, len(requests) / elapsed, elapsed / len(requests) * 1000,
+                sum(count for status, count in statuses.items() if status != 200)))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
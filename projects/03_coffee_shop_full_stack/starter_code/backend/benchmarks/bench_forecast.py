@@ -0,0 +1,144 @@
+'''
+Ingredient usage for millions of orders: a loop over orders against matrix products.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_forecast
+    python -m benchmarks.bench_forecast --orders 1000000 --drinks 50
+
+Generates a menu of random recipes and a month of random orders, skewed
+towards a few popular drinks, then computes the daily ingredient usage:
+
+    loop     a Python loop adding each order's recipe parts, the way the
+             procurement spreadsheet does it; timed on a sample of the
+             orders and extrapolated to all of them
+    numpy    np.bincount of the orders into a days x drinks tally matrix
+             times the drinks x ingredients parts matrix (forecast.py)
+    endpoint GET /ingredients/forecast on a temporary SQLite file holding
+             the hourly tallies of all the orders, daily and hourly, with
+             tokens from an in-process TestIssuer
+
+Reported: seconds and orders/sec for each, and that both computations
+agree.
+'''
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+DAYS = 28
+
+
+def menu(random, drinks, ingredients):
+    recipes = []
+    for _ in range(drinks):
+        names = random.choice(ingredients, random.randint(1, 5), replace=False)
+        recipes.append([{'name': 'ingredient-{}'.format(name), 'color': 'brown',
+                         'parts': int(random.randint(1, 4))} for name in names])
+    return recipes
+
+
+def orders(random, count, drinks):
+    popularity = 1.0 / np.arange(1, drinks + 1)
+    drink = random.choice(drinks, count, p=popularity / popularity.sum())
+    hour = random.randint(0, DAYS * 24, count)
+    return drink, hour
+
+
+def loop_usage(recipes, drink, hour):
+    usage = {}
+    for d, h in zip(drink.tolist(), hour.tolist()):
+        day = usage.setdefault(h // 24, {})
+        for ingredient in recipes[d]:
+            day[ingredient['name']] = day.get(ingredient['name'], 0) + ingredient['parts']
+    return usage
+
+
+def numpy_usage(matrix, rows, drink, hour):
+    drinks = len(matrix.drink_ids)
+    ordered = np.bincount(hour // 24 * drinks + rows[drink],
+                          minlength=DAYS * drinks).reshape(DAYS, drinks)
+    return ordered @ matrix.parts
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=10000000)
+    parser.add_argument('--drinks', type=int, default=200)
+    parser.add_argument('--ingredients', type=int, default=40)
+    parser.add_argument('--sample', type=int, default=200000, help='orders timed in the loop')
+    parser.add_argument('--requests', type=int, default=20, help='per endpoint query')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['AUTH_KEY_PROVIDER'] = 'issuer'
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    from src.api import app
+    from src.auth import auth
+    from src.database.models import db, Drink
+    from src.forecast import UPSERT_TALLY, parse_hour, parts_matrix
+
+    random = np.random.RandomState(0)
+    recipes = menu(random, args.drinks, args.ingredients)
+    with app.app_context():
+        Drink.query.delete()
+        added = [Drink(title='drink-{}'.format(i), recipe=recipe)
+                 for i, recipe in enumerate(recipes)]
+        db.session.add_all(added)
+        db.session.commit()
+        ids = np.array([drink.id for drink in added], dtype=np.int64)
+        matrix = parts_matrix.get()
+    # the matrix row of each generated drink
+    rows = matrix.rows(ids)
+    drink, hour = orders(random, args.orders, args.drinks)
+    print('{} orders of {} drinks over {} days, {} ingredients'.format(
+        args.orders, args.drinks, DAYS, len(matrix.ingredients)))
+
+    sample = min(args.sample, args.orders)
+    loop_seconds, loop = timed(loop_usage, recipes, drink[:sample], hour[:sample])
+    loop_seconds *= args.orders / float(sample)
+    numpy_seconds, usage = timed(numpy_usage, matrix, rows, drink, hour)
+    sampled = numpy_usage(matrix, rows, drink[:sample], hour[:sample])
+    agree = all(abs(sampled[day, matrix.ingredients.index(name)] - parts) < 1e-6
+                for day, used in loop.items() for name, parts in used.items())
+
+    print('{:<26} {:>10} {:>14}'.format('', 'seconds', 'orders/s'))
+    print('{:<26} {:>10.2f} {:>14.0f}'.format('loop (extrapolated)', loop_seconds,
+                                              args.orders / loop_seconds))
+    print('{:<26} {:>10.2f} {:>14.0f}'.format('numpy', numpy_seconds,
+                                              args.orders / numpy_seconds))
+    print('agree on the sample: {}, total parts: {:.0f}'.format(agree, usage.sum()))
+
+    # the same orders as hourly tallies behind the endpoint
+    drinks, first_hour = args.drinks, parse_hour('2026-09-01')
+    tallies = np.bincount(hour * drinks + drink, minlength=DAYS * 24 * drinks)
+    cells = np.nonzero(tallies)[0]
+    tally_rows = [{'hour': first_hour + int(cell // drinks), 'drink_id': int(ids[cell % drinks]),
+                   'count': int(tallies[cell])} for cell in cells]
+    with app.app_context():
+        db.session.execute(UPSERT_TALLY, tally_rows)
+        db.session.commit()
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + auth.key_provider.mint(['get:forecast'])}
+    for query in ('granularity=day&history=28', 'granularity=hour&history=672'):
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            res = client.get('/ingredients/forecast?' + query, headers=headers)
+        elapsed = (time.perf_counter() - start) / args.requests
+        print('{:<26} {:>10.3f} {:>14.0f}  ({} tally rows, status {})'.format(
+            'endpoint ' + query.split('&')[0].split('=')[1], elapsed, args.orders / elapsed,
+            len(tally_rows), res.status_code))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+Sustained POST /orders throughput: queued group commits against one commit per order.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_orders
+    python -m benchmarks.bench_orders --seconds 20 --clients 8 --latency-ms 20
+
+Clients post orders as fast as they can for a while, through the Flask
+test client, on a temporary SQLite file with tokens from an in-process
+TestIssuer:
+
+    queued   the order queue: requests return 202 and the background writer
+             commits groups of orders (order_queue.py)
+    direct   each request writes and commits its own order, as insert()
+             would: the baseline
+
+Reported per mode: requests/sec, orders committed/sec (counting until
+the last queued order is written), 429s, commits, and the delay from
+accepting an order to committing it (mean and 99th percentile).
+'''
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+MODES = ('queued', 'direct')
+
+
+def post_orders(app, headers, drink_ids, until, statuses, lock):
+    client = app.test_client()
+    counts, i = {}, 0
+    while time.monotonic() < until:
+        status = client.post('/orders', headers=headers,
+                             json={'drink_id': drink_ids[i % len(drink_ids)]}).status_code
+        counts[status] = counts.get(status, 0) + 1
+        i += 1
+    with lock:
+        for status, count in counts.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+
+def run(app, headers, drink_ids, clients, seconds):
+    statuses, lock = {}, threading.Lock()
+    start = time.monotonic()
+    threads = [threading.Thread(target=post_orders,
+                                args=(app, headers, drink_ids, start + seconds, statuses, lock))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, statuses
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=4, help='posting threads')
+    parser.add_argument('--latency-ms', type=float, default=50, help='ORDER_MAX_LATENCY_MS')
+    parser.add_argument('--batch-size', type=int, default=500, help='ORDER_BATCH_SIZE')
+    parser.add_argument('--queue-size', type=int, default=10000, help='ORDER_QUEUE_SIZE')
+    parser.add_argument('--mode', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['AUTH_KEY_PROVIDER'] = 'issuer'
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    os.environ['ORDER_MAX_LATENCY_MS'] = str(args.latency_ms)
+    os.environ['ORDER_BATCH_SIZE'] = str(args.batch_size)
+    os.environ['ORDER_QUEUE_SIZE'] = str(args.queue_size)
+    from src.api import app
+    from src.auth import auth
+    from src.database.models import db, Drink, Order
+    from src.order_queue import order_queue, write_orders
+
+    with app.app_context():
+        drinks = [Drink(title='drink-{}'.format(i),
+                        recipe=[{'name': 'espresso', 'color': 'brown', 'parts': 1}])
+                  for i in range(20)]
+        db.session.add_all(drinks)
+        db.session.commit()
+        drink_ids = [drink.id for drink in drinks]
+    headers = {'Authorization': 'Bearer ' + auth.key_provider.mint(['post:orders'])}
+
+    def write_now(drink_id, quantity=1):
+        order = {'id': os.urandom(16).hex(), 'drink_id': drink_id, 'quantity': quantity,
+                 'created_at': time.time()}
+        write_orders([order], time.time())
+        return dict(order, status='accepted')
+
+    print('{:<8} {:>9} {:>13} {:>7} {:>8} {:>9} {:>9}'.format(
+        'mode', 'req/s', 'committed/s', '429s', 'commits', 'mean ms', 'p99 ms'))
+    for mode in args.mode:
+        batches = order_queue.batches
+        submit = order_queue.submit
+        if mode == 'direct':
+            order_queue.submit = write_now
+        start = time.monotonic()
+        elapsed, statuses = run(app, headers, drink_ids, args.clients, args.seconds)
+        order_queue.drain()
+        drained = time.monotonic() - start
+        order_queue.submit = submit
+
+        with app.app_context():
+            delays = [(committed - created) * 1000 for created, committed in
+                      db.session.query(Order.created_at, Order.committed_at)]
+            Order.query.delete()
+            db.session.commit()
+        commits = order_queue.batches - batches if mode == 'queued' else len(delays)
+        print('{:<8} {:>9.0f} {:>13.0f} {:>7} {:>8} {:>9.1f} {:>9.1f}'.format(
+            mode, sum(statuses.values()) / elapsed, len(delays) / drained,
+            statuses.get(429, 0), commits, sum(delays) / max(len(delays), 1),
+            percentile(delays, 0.99)))
+    order_queue.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# src.api binds the database and the key provider at import: point both at
+# throwaway ones before any test module imports it
+_tmp = tempfile.mkdtemp(prefix='coffeeshop-tests-')
+atexit.register(shutil.rmtree, _tmp, True)
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_tmp, 'test.db'))
+os.environ.setdefault('AUTH_KEY_PROVIDER', 'issuer')
@@ -0,0 +1,33 @@
+"""baseline drink table
+
+Revision ID: 5d0c8a7e1f42
+Revises: 
+Create Date: 2026-10-19 14:02:17.530184
+
+Databases created by the old db_drop_and_create_all() already have the
+table, so it is only created when missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c8a7e1f42'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'drink' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('drink',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=80), nullable=True),
+        sa.Column('recipe', sa.String(length=180), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('title')
+        )
+
+
+def downgrade():
+    op.drop_table('drink')
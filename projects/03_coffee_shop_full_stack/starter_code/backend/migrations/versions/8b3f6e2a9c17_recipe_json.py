@@ -0,0 +1,35 @@
+"""drink.recipe as a JSON column
+
+Revision ID: 8b3f6e2a9c17
+Revises: 5d0c8a7e1f42
+Create Date: 2026-10-19 14:09:51.204467
+
+Existing rows already hold JSON text, so they convert as they are.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3f6e2a9c17'
+down_revision = '5d0c8a7e1f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('drink') as batch_op:
+        batch_op.alter_column('recipe',
+                              existing_type=sa.String(length=180),
+                              type_=sa.JSON(),
+                              existing_nullable=False,
+                              postgresql_using='recipe::json')
+
+
+def downgrade():
+    with op.batch_alter_table('drink') as batch_op:
+        batch_op.alter_column('recipe',
+                              existing_type=sa.JSON(),
+                              type_=sa.String(),
+                              existing_nullable=False,
+                              postgresql_using='recipe::text')
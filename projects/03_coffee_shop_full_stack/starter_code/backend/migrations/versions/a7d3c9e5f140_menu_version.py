@@ -0,0 +1,32 @@
+"""menu_version: the menu version shared by the workers
+
+Revision ID: a7d3c9e5f140
+Revises: f2a6d4b9e813
+Create Date: 2026-10-19 22:04:17.318826
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3c9e5f140'
+down_revision = 'f2a6d4b9e813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    menu_version = op.create_table(
+        'menu_version',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('epoch', sa.String(length=16), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'))
+    op.bulk_insert(menu_version, [{'id': 1, 'epoch': os.urandom(4).hex(), 'value': 0}])
+
+
+def downgrade():
+    op.drop_table('menu_version')
@@ -0,0 +1,56 @@
+"""drink_ingredient: the recipes indexed by ingredient
+
+Revision ID: c41e9d7b2a05
+Revises: 8b3f6e2a9c17
+Create Date: 2026-10-19 16:32:08.517301
+
+Filled from the existing recipes; kept up to date by the Drink mapper
+events in models.py from then on.
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e9d7b2a05'
+down_revision = '8b3f6e2a9c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    drink_ingredient = op.create_table(
+        'drink_ingredient',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('drink_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=80), nullable=False),
+        sa.Column('color', sa.String(length=80), nullable=False),
+        sa.Column('parts', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['drink_id'], ['drink.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_drink_ingredient_name', 'drink_ingredient',
+                    ['name', 'color', 'drink_id'])
+    op.create_index('ix_drink_ingredient_drink_id', 'drink_ingredient', ['drink_id'])
+
+    rows = []
+    drinks = op.get_bind().execute(sa.text('SELECT id, recipe FROM drink'))
+    for drink_id, recipe in drinks:
+        if isinstance(recipe, str):
+            recipe = json.loads(recipe)
+        for ingredient in recipe or []:
+            rows.append({
+                'drink_id': drink_id,
+                'name': ' '.join(str(ingredient['name']).split()).lower(),
+                'color': ' '.join(str(ingredient['color']).split()).lower(),
+                'parts': ingredient['parts'],
+            })
+    if rows:
+        op.bulk_insert(drink_ingredient, rows)
+
+
+def downgrade():
+    op.drop_index('ix_drink_ingredient_drink_id', table_name='drink_ingredient')
+    op.drop_index('ix_drink_ingredient_name', table_name='drink_ingredient')
+    op.drop_table('drink_ingredient')
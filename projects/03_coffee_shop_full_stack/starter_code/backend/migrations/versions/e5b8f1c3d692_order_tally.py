@@ -0,0 +1,29 @@
+"""order_tally: drinks ordered per hour
+
+Revision ID: e5b8f1c3d692
+Revises: c41e9d7b2a05
+Create Date: 2026-10-19 18:04:37.092815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8f1c3d692'
+down_revision = 'c41e9d7b2a05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_tally',
+        sa.Column('hour', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('drink_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('hour', 'drink_id'))
+
+
+def downgrade():
+    op.drop_table('order_tally')
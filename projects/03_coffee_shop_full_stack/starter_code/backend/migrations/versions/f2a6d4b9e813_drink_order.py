@@ -0,0 +1,31 @@
+"""drink_order: orders written by the order queue
+
+Revision ID: f2a6d4b9e813
+Revises: e5b8f1c3d692
+Create Date: 2026-10-19 20:11:52.640193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6d4b9e813'
+down_revision = 'e5b8f1c3d692'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'drink_order',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('drink_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('committed_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('drink_order')
@@ -1,22 +1,43 @@
 import os
 from flask import Flask, request, jsonify, abort
 from sqlalchemy import exc
-import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import setup_db, Drink
+from .database.bootstrap import setup_migrations, bootstrap, seed_drinks
 from .auth.auth import AuthError, requires_auth
+from .menu_cache import menu_cache
+from .pagination import wants_page, drink_page
+from .drink_batch import MAX_BATCH_SIZE, BatchError, item_error, upsert_drinks
+from .drink_search import search_drinks
+from .forecast import record_tallies, ingredient_forecast
+from .order_queue import QueueFull, order_queue, place_order, order_status
 
 app = Flask(__name__)
 setup_db(app)
+setup_migrations(app)
 CORS(app)
+order_queue.init_app(app)
 
 '''
-@TODO uncomment the following line to initialize the datbase
-!! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
-!! NOTE THIS MUST BE UNCOMMENTED ON FIRST RUN
+brings the database up to date on startup: runs pending migrations,
+keeping existing records (see bootstrap.py)
+set BOOTSTRAP_DATABASE=0 to skip it, e.g. when `flask db upgrade` runs
+as a separate deploy step; SEED_DATABASE=1 also adds the sample drinks
+to an empty database, as `flask seed-drinks` does
 '''
-db_drop_and_create_all()
+if os.environ.get("BOOTSTRAP_DATABASE", "1") != "0":
+    with app.app_context():
+        bootstrap(seed=os.environ.get("SEED_DATABASE", "0") == "1")
+
+
+@app.cli.command("seed-drinks")
+def seed_drinks_command():
+    """Adds the sample drinks to a database without drinks."""
+    if seed_drinks():
+        print("added the sample drinks")
+    else:
+        print("the database already has drinks")
 
 # ROUTES
 '''
@@ -27,14 +48,34 @@ db_drop_and_create_all()
     returns status code 200 and json {"success": True, "drinks": drinks}
     where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+    served from the menu cache, with an ETag (304 when unchanged)
+    limit, cursor, fields and title_prefix return one page instead
+    (see pagination.py)
 '''
 @app.route("/drinks", methods=["GET"])
 def get_drinks():
-    results = {
+    if wants_page():
+        return jsonify(drink_page("short"))
+    return menu_cache.response("short")
+
+
+'''
+    GET /drinks/search
+        it should be a public endpoint
+        ingredient= (drinks using it) and exclude= (drinks without it),
+        each may be repeated, as a name or name:color
+        it should contain only the drink.short() data representation
+    returns status code 200 and json {"success": True, "drinks": drinks}
+    where drinks is the list of matching drinks
+        or status code 400 without an ingredient or exclude
+    (see drink_search.py)
+'''
+@app.route("/drinks/search", methods=["GET"])
+def get_drinks_search():
+    return jsonify({
         "success": True,
-        "drinks": [drink.short() for drink in Drink.query.all()]
-    }
-    return jsonify(results)
+        "drinks": search_drinks()
+        })
 
 
 '''
@@ -45,15 +86,16 @@ def get_drinks():
     returns status code 200 and json {"success": True, "drinks": drinks}
     where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+    served from the menu cache, with an ETag (304 when unchanged)
+    limit, cursor, fields and title_prefix return one page instead
+    (see pagination.py)
 '''
 @app.route("/drinks-detail", methods=["GET"])
 @requires_auth("get:drinks-detail")
 def get_drinks_detail(jwt):
-    results = {
-        "success": True,
-        "drinks": [drink.long() for drink in Drink.query.all()]
-    }
-    return jsonify(results)
+    if wants_page():
+        return jsonify(drink_page("long"))
+    return menu_cache.response("long", "private, no-cache")
 
 
 '''
@@ -70,11 +112,13 @@ def get_drinks_detail(jwt):
 @requires_auth("post:drinks")
 def post_drink(jwt):
     """Adds a drink. Requires authentication and permission"""
-    body = request.get_json()
-    if not body:
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not body:
         abort(400)
+    if item_error(body) is not None:
+        abort(422)
 
-    drink = Drink(title=body["title"], recipe=json.dumps(body["recipe"]))
+    drink = Drink(title=body["title"], recipe=body["recipe"])
     drink.insert()
     results = {
         "success": True,
@@ -102,15 +146,19 @@ def patch_drinks(jwt, drink_id):   # jwt must be the 1st
     if not drink:
         abort(404)
 
-    body = request.get_json()
+    body = request.get_json(silent=True)
 
-    if not body or ("title" not in body and "recipe" not in body):
+    if not isinstance(body, dict) or ("title" not in body and "recipe" not in body):
         abort(400)
+    # the drink as it will be, checked like a new one
+    if item_error({"title": body.get("title", drink.title),
+                   "recipe": body.get("recipe", drink.recipe)}) is not None:
+        abort(422)
 
     if "title" in body:
         drink.title = body["title"]
     if "recipe" in body:
-        drink.recipe = json.dumps(body["recipe"])
+        drink.recipe = body["recipe"]
     drink.update()
 
     results = {
@@ -145,6 +193,137 @@ def delete_drinks(jwt, drink_id):
         })
 
 
+'''
+    POST /drinks/batch
+        it should require the 'post:drinks' permission
+        body: a json array of up to MAX_BATCH_SIZE drinks
+        creates the drinks with a new title and replaces the recipe of
+        the existing ones, in one transaction
+    PATCH /drinks/batch
+        it should require the 'patch:drinks' permission
+        the same, but every title must already exist
+    returns status code 200 and json {"success": True, "results": results}
+    where results has {"status": "created"|"updated", "drink": drink.long()}
+    per drink, in order
+        or status code 422 and the per-drink errors, with nothing written
+    (see drink_batch.py)
+'''
+@app.route("/drinks/batch", methods=["POST"])
+@requires_auth("post:drinks")
+def post_drinks_batch(jwt):
+    return write_batch(create=True)
+
+
+@app.route("/drinks/batch", methods=["PATCH"])
+@requires_auth("patch:drinks")
+def patch_drinks_batch(jwt):
+    return write_batch(create=False)
+
+
+def write_batch(create):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items or len(items) > MAX_BATCH_SIZE:
+        abort(400)
+
+    try:
+        results = upsert_drinks(items, create=create)
+    except BatchError as e:
+        return (jsonify({
+                        "success": False,
+                        "error": 422,
+                        "message": "unprocessable",
+                        "results": e.results
+                        }), 422
+                )
+    except exc.IntegrityError:
+        # a title created by a concurrent request
+        abort(409)
+    return jsonify({
+        "success": True,
+        "results": results
+        })
+
+
+'''
+    POST /orders/tally
+        it should require the 'post:orders' permission
+        body: a json array of {"drink_id", "hour", "count"}, the number of
+        drinks ordered in an hour (ISO 8601, UTC without an offset)
+    returns status code 200 and json {"success": True, "orders": count}
+        or status code 400 for a malformed tally, 422 for an unknown drink
+    GET /ingredients/forecast
+        it should require the 'get:forecast' permission
+        granularity= hour or day, history= and horizon= periods
+    returns status code 200 and json {"success": True, "forecast": forecast}
+    with the ingredient usage of the history and the next periods
+    (see forecast.py)
+'''
+@app.route("/orders/tally", methods=["POST"])
+@requires_auth("post:orders")
+def post_order_tally(jwt):
+    return jsonify({
+        "success": True,
+        "orders": record_tallies(request.get_json(silent=True))
+        })
+
+
+@app.route("/ingredients/forecast", methods=["GET"])
+@requires_auth("get:forecast")
+def get_ingredient_forecast(jwt):
+    forecast = ingredient_forecast(request.args.get("granularity", "day"),
+                                   request.args.get("history"),
+                                   request.args.get("horizon"))
+    return jsonify({
+        "success": True,
+        "forecast": forecast
+        })
+
+
+'''
+    POST /orders
+        it should require the 'post:orders' permission
+        body: {"drink_id": id, "quantity": 1 to 100, default 1}
+        the order is queued and written by a background writer within
+        ORDER_MAX_LATENCY_MS (see order_queue.py)
+    returns status code 202 and json {"success": True, "order": order}
+    where order has its id and "status": "queued"
+        or status code 400 for a malformed order, 422 for an unknown
+        drink, 429 when the queue is full
+    GET /orders/<id>
+        it should require the 'post:orders' permission
+    returns status code 200 and json {"success": True, "order": order}
+    where order["status"] is "queued", "accepted" or "failed"
+        or status code 404 for an unknown order
+'''
+@app.route("/orders", methods=["POST"])
+@requires_auth("post:orders")
+def post_order(jwt):
+    try:
+        order = place_order(request.get_json(silent=True))
+    except KeyError:
+        abort(422)
+    except QueueFull:
+        abort(429)
+    if order is None:
+        abort(400)
+    return jsonify({
+        "success": True,
+        "order": order
+        }), 202
+
+
+@app.route("/orders/<order_id>", methods=["GET"])
+@requires_auth("post:orders")
+def get_order(jwt, order_id):
+    order = order_status(order_id)
+    if order is None:
+        abort(404)
+    return jsonify({
+        "success": True,
+        "order": order
+        })
+
+
 # Error Handling
 '''
 Example error handling for unprocessable entity
@@ -217,6 +396,27 @@ def unauthorized(error):
             )
 
 
+@app.errorhandler(409)
+def conflict(error):
+    return (jsonify({
+                    "success": False,
+                    "error": 409,
+                    "message": "conflict"
+                    }), 409,
+            )
+
+
+@app.errorhandler(429)
+def too_many_requests(error):
+    response = jsonify({
+                    "success": False,
+                    "error": 429,
+                    "message": "too many requests"
+                    })
+    response.headers["Retry-After"] = "1"
+    return response, 429
+
+
 @app.errorhandler(500)
 def Internal_Server_Error(error):
     return (jsonify({
@@ -225,3 +425,13 @@ def Internal_Server_Error(error):
                     "message": "Internal Server Error"
                     }), 500,
             )
+
+
+@app.errorhandler(503)
+def service_unavailable(error):
+    return (jsonify({
+                    "success": False,
+                    "error": 503,
+                    "message": "Service unavailable"
+                    }), 503,
+            )
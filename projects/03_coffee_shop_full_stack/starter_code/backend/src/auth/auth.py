@@ -1,12 +1,25 @@
-import json
+import os
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
 
-AUTH0_DOMAIN = 'udacity-coffeeshop-cc.us.auth0.com'
-ALGORITHMS = ['RS256']
-API_AUDIENCE = 'coffeeshop'
+from .jwks import JWKSUnavailableError
+from .providers import make_key_provider
+from .token_cache import TokenCache, token_digest
+
+AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN',
+                              'udacity-coffeeshop-cc.us.auth0.com')
+API_AUDIENCE = os.environ.get('API_AUDIENCE', 'coffeeshop')
+# jwks (Auth0, default), file (AUTH_JWKS_FILE) or issuer (see providers.py)
+AUTH_KEY_PROVIDER = os.environ.get('AUTH_KEY_PROVIDER', 'jwks')
+ALGORITHMS = os.environ.get(
+    'AUTH_ALGORITHMS',
+    'RS256' if AUTH_KEY_PROVIDER == 'jwks' else 'RS256,ES256').split(',')
+
+# signing keys looked up by kid (see providers.py)
+key_provider = make_key_provider(AUTH_KEY_PROVIDER, AUTH0_DOMAIN, API_AUDIENCE)
+# payloads of verified tokens (see token_cache.py)
+token_cache = TokenCache()
 
 # AuthError Exception
 '''
@@ -74,12 +87,15 @@ def get_token_auth_header():
     it should raise an AuthError if the requested permission string is not
     in the payload permissions array
     return true otherwise
+
+    permissions can be passed precomputed (a frozenset, see token_cache.py)
 '''
 
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, permissions=None):
     if permission:
-        permissions = payload.get("permissions")
+        if permissions is None:
+            permissions = payload.get("permissions")
         if not permissions or permission not in permissions:
             raise AuthError({
                             "code": "permission_denied",
@@ -103,30 +119,32 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
+    try:
+        key = key_provider.get_key(unverified_header['kid'])
+    except JWKSUnavailableError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
+    if key is not None:
         try:
             payload = jwt.decode(
                 token,
-                rsa_key,
+                key,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
@@ -157,6 +175,34 @@ def verify_decode_jwt(token):
             }, 401)
 
 
+'''
+verify_cached(token)
+    verify_decode_jwt(token) through token_cache
+    returns a VerifiedToken (payload and permissions frozenset)
+'''
+
+
+def verify_cached(token):
+    digest = token_digest(token)
+    verified = token_cache.get(digest)
+    if verified is None:
+        verified = token_cache.put(digest, verify_decode_jwt(token))
+    if token_cache.is_revoked(digest, verified.payload):
+        raise AuthError({
+            'code': 'token_revoked',
+            'description': 'Token revoked.'
+        }, 401)
+    return verified
+
+
+def revoke_token(token):
+    token_cache.revoke(token)
+
+
+def revoke_subject(sub):
+    token_cache.revoke_subject(sub)
+
+
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
@@ -168,6 +214,10 @@ def verify_decode_jwt(token):
     requested permission
     return the decorator which passes the decoded payload to the decorated
     method
+
+    verified tokens are cached until they expire, so a token sent again
+    skips the signature check; revoke_token() and revoke_subject() refuse
+    tokens before they expire
 '''
 
 
@@ -177,11 +227,12 @@ def requires_auth(permission=""):
         def wrapper(*args, **kwargs):
             try:
                 token = get_token_auth_header()
-                payload = verify_decode_jwt(token)
-                check_permissions(permission, payload)
+                verified = verify_cached(token)
+                check_permissions(permission, verified.payload,
+                                  verified.permissions)
             except AuthError as e:
                 abort(e.status_code)
-            return f(payload, *args, **kwargs)
+            return f(verified.payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
     
\ No newline at end of file
@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from jose import jwk
+
+'''
+JWKS key store
+
+Keeps the signing keys of a JSON Web Key Set parsed into ready-to-use
+key objects, indexed by kid, so verifying a token needs no network
+round trip and no key parsing.
+    - keys older than ttl seconds are refreshed by a background thread
+      while the current ones keep being served
+    - an unknown kid triggers an immediate refetch (the provider may have
+      rotated its keys), at most once every min_refetch_interval seconds
+    - when the provider is down the last good keys are served, however old
+'''
+
+DEFAULT_TTL = 600
+DEFAULT_MIN_REFETCH_INTERVAL = 30
+DEFAULT_TIMEOUT = 5
+DEFAULT_ALGORITHMS = {'RSA': 'RS256', 'EC': 'ES256'}
+
+
+'''
+JWKSUnavailableError
+    raised when no key set has ever been fetched successfully
+'''
+
+
+class JWKSUnavailableError(Exception):
+    pass
+
+
+'''
+parse_jwks(jwks)
+    turns a JWKS document into {kid: key object}
+    keys without a kid, encryption keys and keys jose cannot load are
+    skipped
+'''
+
+
+def parse_jwks(jwks):
+    keys = {}
+    for key in jwks.get('keys', []):
+        if 'kid' not in key or key.get('use', 'sig') != 'sig':
+            continue
+        algorithm = key.get('alg') or DEFAULT_ALGORITHMS.get(key.get('kty'))
+        try:
+            keys[key['kid']] = jwk.construct(key, algorithm)
+        except Exception:
+            continue
+    return keys
+
+
+def fetch_url(url, timeout=DEFAULT_TIMEOUT):
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    except HTTPError as err:
+        err.close()
+        raise
+
+
+class JWKSKeyStore(object):
+    def __init__(self, url, ttl=DEFAULT_TTL,
+                 min_refetch_interval=DEFAULT_MIN_REFETCH_INTERVAL,
+                 timeout=DEFAULT_TIMEOUT, fetch=fetch_url,
+                 clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self._fetch = fetch
+        self._clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self.fetches = 0
+        self.last_error = None
+
+    '''
+    refresh()
+        fetches the key set now
+        on failure the current keys are kept and False is returned
+    '''
+    def refresh(self):
+        with self._fetch_lock:
+            return self._fetch_keys()
+
+    def _fetch_keys(self):
+        # callers hold _fetch_lock
+        with self._lock:
+            self._last_attempt = self._clock()
+            self.fetches += 1
+        try:
+            keys = parse_jwks(self._fetch(self.url, timeout=self.timeout))
+        except Exception as err:
+            self.last_error = err
+            return False
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = self._clock()
+            self.last_error = None
+        return True
+
+    def _claim_fetch(self, now):
+        # rate limit for fetches that are not due to the ttl
+        with self._lock:
+            if self._last_attempt is not None and \
+                    now - self._last_attempt < self.min_refetch_interval:
+                return False
+            self._last_attempt = now
+            return True
+
+    def _refresh_in_background(self):
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=run, name='jwks-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def _first_fetch(self):
+        # concurrent first requests wait for one fetch; while the provider
+        # is down they fail fast between rate-limited attempts
+        with self._fetch_lock:
+            if self._fetched_at is None and self._claim_fetch(self._clock()):
+                self._fetch_keys()
+        if self._fetched_at is None:
+            raise JWKSUnavailableError('could not fetch {}: {}'.format(
+                self.url, self.last_error))
+
+    '''
+    get_key(kid)
+        returns the key object for kid, or None when the provider does not
+        know it
+        raises JWKSUnavailableError when no key set could ever be fetched
+    '''
+    def get_key(self, kid):
+        if self._fetched_at is None:
+            self._first_fetch()
+
+        now = self._clock()
+        with self._lock:
+            key = self._keys.get(kid)
+            age = now - self._fetched_at
+        if key is not None:
+            if age >= self.ttl and self._claim_fetch(now):
+                self._refresh_in_background()
+            return key
+
+        if self._claim_fetch(now):
+            self.refresh()
+            with self._lock:
+                return self._keys.get(kid)
+        return None
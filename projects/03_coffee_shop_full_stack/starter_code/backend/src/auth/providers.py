@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+
+from .jwks import JWKSKeyStore, parse_jwks
+
+'''
+Key providers
+
+verify_decode_jwt looks signing keys up by kid in a key provider, any
+object with get_key(kid) returning a jose key object or None:
+    JWKSKeyStore (jwks.py)  the identity provider's remote JWKS, cached
+    LocalJWKSFile           a JWKS document on disk, for air-gapped hosts
+    TestIssuer              an in-process issuer signing its own tokens,
+                            for tests and load tests
+
+make_key_provider() picks one from the AUTH_* environment variables
+(see the README).
+'''
+
+PROVIDERS = ('jwks', 'file', 'issuer')
+
+
+'''
+LocalJWKSFile(path)
+    serves the keys of a JWKS file, reloaded when the file changes
+    (checked at most every check_interval seconds)
+'''
+
+
+class LocalJWKSFile(object):
+    def __init__(self, path, check_interval=1.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._keys = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._load()
+        self._checked_at = clock()
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with open(self.path, encoding='utf-8') as jwks:
+                self._keys = parse_jwks(json.load(jwks))
+            self._mtime = mtime
+
+    def get_key(self, kid):
+        now = self._clock()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                try:
+                    self._load()
+                except (OSError, ValueError):
+                    pass  # keep the keys of the last good file
+        return self._keys.get(kid)
+
+
+'''
+TestIssuer(issuer, audience)
+    mints RS256 and ES256 tokens with the permissions it is asked for and
+    serves the matching public keys
+    with keys_file the private keys are kept in that file (created on
+    first use), so other processes can mint tokens the server accepts
+    !!NOTE anyone with the keys file can mint any permission; never point
+    a production server at an issuer
+'''
+
+
+class TestIssuer(object):
+    ALGORITHMS = ('RS256', 'ES256')
+    __test__ = False  # not a test case
+
+    def __init__(self, issuer, audience, keys_file=None):
+        self.issuer = issuer
+        self.audience = audience
+        if keys_file and os.path.exists(keys_file):
+            with open(keys_file, encoding='utf-8') as keys:
+                private = json.load(keys)['keys']
+        else:
+            private = [self._generate(algorithm) for algorithm in self.ALGORITHMS]
+            if keys_file:
+                with open(keys_file, 'w', encoding='utf-8') as keys:
+                    json.dump({'keys': private}, keys, indent=2)
+        self._private = dict((key['alg'], key) for key in private)
+        self._keys = parse_jwks(self.jwks())
+
+    @staticmethod
+    def _generate(algorithm):
+        if algorithm == 'ES256':
+            private = ec.generate_private_key(ec.SECP256R1())
+        else:
+            private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = private.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+        key = jwk.construct(pem, algorithm).to_dict()
+        key.update({'kid': 'test-{}-{}'.format(algorithm.lower(), uuid.uuid4().hex[:8]),
+                    'use': 'sig'})
+        return dict((name, value.decode() if isinstance(value, bytes) else value)
+                    for name, value in key.items())
+
+    '''
+    jwks()
+        the public keys as a JWKS document
+    '''
+    def jwks(self):
+        keys = []
+        for private in self._private.values():
+            public = jwk.construct(private, private['alg']).public_key().to_dict()
+            public = dict((name, value.decode() if isinstance(value, bytes) else value)
+                          for name, value in public.items())
+            public.update({'kid': private['kid'], 'use': 'sig'})
+            keys.append(public)
+        return {'keys': keys}
+
+    def get_key(self, kid):
+        return self._keys.get(kid)
+
+    '''
+    mint(permissions, sub, algorithm, expires_in, **claims)
+        a signed access token shaped like the identity provider's
+    '''
+    def mint(self, permissions=(), sub='test|user', algorithm='RS256',
+             expires_in=3600, **claims):
+        private = self._private[algorithm]
+        now = int(time.time())
+        payload = {'iss': self.issuer,
+                   'aud': self.audience,
+                   'sub': sub,
+                   'iat': now,
+                   'exp': now + expires_in,
+                   'permissions': list(permissions)}
+        payload.update(claims)
+        return jwt.encode(payload, private, algorithm=algorithm,
+                          headers={'kid': private['kid']})
+
+
+'''
+make_key_provider(kind, domain, audience, environ)
+    kind 'jwks'   the remote JWKS, AUTH_JWKS_URL or the domain's
+                  /.well-known/jwks.json
+         'file'   LocalJWKSFile(AUTH_JWKS_FILE)
+         'issuer' TestIssuer, keys in AUTH_ISSUER_KEYS when set
+'''
+
+
+def make_key_provider(kind, domain, audience, environ=os.environ):
+    if kind == 'jwks':
+        return JWKSKeyStore(environ.get(
+            'AUTH_JWKS_URL', f'https://{domain}/.well-known/jwks.json'))
+    if kind == 'file':
+        return LocalJWKSFile(environ['AUTH_JWKS_FILE'])
+    if kind == 'issuer':
+        return TestIssuer('https://' + domain + '/', audience,
+                          keys_file=environ.get('AUTH_ISSUER_KEYS'))
+    raise ValueError('AUTH_KEY_PROVIDER must be one of {}'.format(', '.join(PROVIDERS)))
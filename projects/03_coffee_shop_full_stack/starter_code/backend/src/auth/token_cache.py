@@ -0,0 +1,167 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+'''
+Verified-token cache
+
+Remembers the payload of every token requires_auth has verified, so a
+client sending the same bearer token again skips the signature check.
+    - entries are keyed by the SHA-256 digest of the token, never the
+      token itself
+    - an entry expires at the token's exp claim; tokens without exp are
+      not cached
+    - at most maxsize entries are kept, the least recently used go first
+    - each entry carries its permissions as a frozenset, so checking a
+      permission is a set lookup
+    - revoked tokens (one token, or every token of a subject issued before
+      the revocation) are refused until they expire, cached or not
+    - revocations are forgotten once the tokens they refuse have expired:
+      a token's at its exp claim, a subject's after max_lifetime (the
+      longest token lifetime accepted, AUTH_MAX_TOKEN_LIFETIME seconds);
+      both are pruned at most every PRUNE_INTERVAL seconds by the checks
+      themselves, so their memory stays bounded
+
+The cache is per process: a revocation only applies to the process it
+was made in.
+'''
+
+DEFAULT_MAXSIZE = 1024
+# tokens issued with a longer lifetime outlive a subject revocation
+MAX_TOKEN_LIFETIME = int(os.environ.get('AUTH_MAX_TOKEN_LIFETIME', 86400))
+PRUNE_INTERVAL = 60
+
+
+def token_digest(token):
+    if isinstance(token, str):
+        token = token.encode('utf-8')
+    return hashlib.sha256(token).digest()
+
+
+'''
+VerifiedToken
+    a verified payload with its permissions as a frozenset
+'''
+
+
+class VerifiedToken(object):
+    __slots__ = ('payload', 'permissions', 'expires_at')
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.permissions = frozenset(payload.get('permissions') or ())
+        self.expires_at = payload.get('exp')
+
+
+class TokenCache(object):
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, clock=time.time,
+                 max_lifetime=MAX_TOKEN_LIFETIME):
+        self.maxsize = maxsize
+        self.max_lifetime = max_lifetime
+        self._clock = clock
+        self._pruned_at = clock()
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._revoked_subjects = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    '''
+    get(digest)
+        returns the VerifiedToken cached for digest, or None
+    '''
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= self._clock():
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry
+
+    '''
+    put(digest, payload)
+        caches a verified payload and returns its VerifiedToken
+    '''
+    def put(self, digest, payload):
+        entry = VerifiedToken(payload)
+        if self.maxsize <= 0 or not isinstance(entry.expires_at, (int, float)):
+            return entry
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    '''
+    revoke(token, expires_at=None)
+        refuses token from now on; it is forgotten at expires_at (its exp
+        claim when cached), or after max_lifetime when unknown
+    '''
+    def revoke(self, token, expires_at=None):
+        digest = token_digest(token)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.pop(digest, None)
+            if expires_at is None:
+                expires_at = entry.expires_at if entry else now + self.max_lifetime
+            self._revoked[digest] = expires_at
+            self._prune(now)
+
+    '''
+    revoke_subject(sub)
+        refuses every token of sub issued (iat) up to now
+    '''
+    def revoke_subject(self, sub):
+        now = self._clock()
+        with self._lock:
+            self._revoked_subjects[sub] = now
+            for digest, entry in list(self._entries.items()):
+                if entry.payload.get('sub') == sub:
+                    del self._entries[digest]
+            self._prune(now)
+
+    '''
+    is_revoked(digest, payload)
+        True when the token or its subject was revoked
+    '''
+    def is_revoked(self, digest, payload):
+        now = self._clock()
+        if now - self._pruned_at >= PRUNE_INTERVAL:
+            with self._lock:
+                self._prune(now)
+        if digest in self._revoked:
+            return True
+        revoked_at = self._revoked_subjects.get(payload.get('sub'))
+        if revoked_at is None or revoked_at + self.max_lifetime <= now:
+            return False
+        return payload.get('iat', 0) <= revoked_at
+
+    def _prune(self, now):
+        # callers hold _lock
+        for digest, expires_at in list(self._revoked.items()):
+            if expires_at <= now:
+                del self._revoked[digest]
+        for sub, revoked_at in list(self._revoked_subjects.items()):
+            if revoked_at + self.max_lifetime <= now:
+                del self._revoked_subjects[sub]
+        self._pruned_at = now
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+            self._revoked_subjects.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from .models import db, Drink
+
+try:
+    import fcntl
+except ImportError:  # Windows: boots are not serialized
+    fcntl = None
+
+'''
+Startup bootstrap
+
+Replaces db_drop_and_create_all() at import: the schema comes from the
+versioned migrations in backend/migrations (Flask-Migrate / alembic, as
+in the other projects), so restarting a worker never loses data. Like
+db_drop_and_create_all(), booting adds no drinks: the sample drinks are
+only added on request (seed_drinks(), `flask seed-drinks`, or
+SEED_DATABASE=1 at boot), and only to an empty database.
+    - a database at the latest revision costs one small query and no
+      lock, however many drinks it holds
+    - otherwise workers booting at the same time take turns under a lock
+      (a file lock for SQLite, an advisory lock for Postgres) and the
+      first one migrates (and seeds) while the others find nothing to do
+'''
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MIGRATIONS_DIR = os.path.join(BACKEND_DIR, 'migrations')
+BOOT_LOCK_KEY = 0x636f6666  # 'coff'
+SEED_DRINKS = [
+    {'title': 'water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]},
+]
+
+
+'''
+setup_migrations(app)
+    registers Flask-Migrate on a flask application (`flask db ...`)
+'''
+
+
+def setup_migrations(app, directory=MIGRATIONS_DIR):
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=directory)
+
+
+def schema_revision(connection):
+    from alembic.runtime.migration import MigrationContext
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+def head_revision(directory=MIGRATIONS_DIR):
+    from alembic.script import ScriptDirectory
+    return ScriptDirectory(directory).get_current_head()
+
+
+def _lock_path(url):
+    if url.drivername.startswith('sqlite') and url.database and url.database != ':memory:':
+        return url.database + '.lock'
+    digest = hashlib.sha1(str(url).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), 'coffeeshop-{}.lock'.format(digest))
+
+
+'''
+boot_lock(engine)
+    held by one booting process at a time, per database
+'''
+
+
+@contextmanager
+def boot_lock(engine):
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), key=BOOT_LOCK_KEY)
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), key=BOOT_LOCK_KEY)
+        return
+    if fcntl is None:
+        yield
+        return
+    with open(_lock_path(engine.url), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _is_empty():
+    return db.session.query(Drink.id).first() is None
+
+
+def _is_ready(head, seed):
+    with db.engine.connect() as connection:
+        if schema_revision(connection) != head:
+            return False
+    return not seed or not _is_empty()
+
+
+def _seed():
+    if not _is_empty():
+        return False
+    for drink in SEED_DRINKS:
+        db.session.add(Drink(title=drink['title'], recipe=drink['recipe']))
+    db.session.commit()
+    return True
+
+
+'''
+bootstrap(seed=False)
+    brings the schema to the latest migration and, with seed, adds
+    SEED_DRINKS to an empty database; safe to run on every boot
+    needs an app context with setup_migrations() done
+    returns True when the seed drinks were added
+'''
+
+
+def bootstrap(seed=False):
+    from flask_migrate import upgrade
+
+    head = head_revision()
+    try:
+        if _is_ready(head, seed):
+            return False
+        with boot_lock(db.engine):
+            with db.engine.connect() as connection:
+                current = schema_revision(connection)
+            if current != head:
+                upgrade(directory=MIGRATIONS_DIR)
+            return seed and _seed()
+    finally:
+        db.session.remove()
+
+
+'''
+seed_drinks()
+    adds SEED_DRINKS when the database has no drinks, under the boot lock
+    returns True when they were added
+'''
+
+
+def seed_drinks():
+    try:
+        with boot_lock(db.engine):
+            return _seed()
+    finally:
+        db.session.remove()
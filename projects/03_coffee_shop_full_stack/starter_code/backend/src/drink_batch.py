@@ -0,0 +1,141 @@
+import numbers
+
+from .database.models import db, commit_with_retry, Drink
+
+'''
+Drink batches
+
+POST /drinks/batch and PATCH /drinks/batch take a JSON array of drinks,
+[{"title": string, "recipe": [{"name", "color", "parts"}, ...]}, ...],
+keyed on the unique title:
+    - POST creates the drinks whose title is new and replaces the recipe
+      of the ones that exist (upsert)
+    - PATCH only replaces recipes; a title that does not exist is an error
+
+Every item is validated before anything is written. The batch is all or
+nothing: either every item is written in one transaction (one commit, so
+one menu cache invalidation) or, when any item is invalid, none is. The
+existing drinks are looked up with one query and the written drinks are
+read back with one more, so a batch costs a fixed number of statements
+besides the inserts and updates themselves.
+'''
+
+MAX_BATCH_SIZE = 500
+TITLE_LENGTH = Drink.title.type.length
+
+
+'''
+BatchError
+    raised by upsert_drinks when an item cannot be written; results holds
+    one entry per item, in order
+'''
+
+
+class BatchError(Exception):
+    def __init__(self, results):
+        super(BatchError, self).__init__('invalid batch')
+        self.results = results
+
+
+def _recipe_error(recipe):
+    if not isinstance(recipe, list) or not recipe:
+        return 'recipe must be a non-empty list'
+    for ingredient in recipe:
+        if not isinstance(ingredient, dict):
+            return 'recipe items must be objects'
+        for key in ('name', 'color'):
+            value = ingredient.get(key)
+            if not isinstance(value, str) or not value:
+                return 'recipe {} must be a non-empty string'.format(key)
+        parts = ingredient.get('parts')
+        if isinstance(parts, bool) or not isinstance(parts, numbers.Real) or parts <= 0:
+            return 'recipe parts must be a positive number'
+    return None
+
+
+'''
+item_error(item)
+    why a batch item is not a valid drink, or None
+'''
+
+
+def item_error(item):
+    if not isinstance(item, dict):
+        return 'drink must be an object'
+    title = item.get('title')
+    if not isinstance(title, str) or not title.strip():
+        return 'title must be a non-empty string'
+    if len(title) > TITLE_LENGTH:
+        return 'title must be at most {} characters'.format(TITLE_LENGTH)
+    return _recipe_error(item.get('recipe'))
+
+
+def _validate(items, existing, create):
+    results, seen, valid = [], set(), True
+    for item in items:
+        error = item_error(item)
+        if error is None and item['title'] in seen:
+            error = 'duplicate title in batch'
+        if error is None and not create and item['title'] not in existing:
+            results.append({'status': 'not found', 'title': item['title']})
+            valid = False
+            continue
+        if error is not None:
+            results.append({'status': 'invalid', 'error': error})
+            valid = False
+            continue
+        seen.add(item['title'])
+        results.append({'status': 'skipped', 'title': item['title']})
+    return results if not valid else None
+
+
+def _existing(titles):
+    if not titles:
+        return {}
+    drinks = Drink.query.filter(Drink.title.in_(titles)).all()
+    return dict((drink.title, drink) for drink in drinks)
+
+
+def _titles(items):
+    return list(set(item['title'] for item in items
+                    if isinstance(item, dict) and isinstance(item.get('title'), str)))
+
+
+'''
+upsert_drinks(items, create=True)
+    writes a validated batch in one transaction; with create, drinks
+    whose title is new are inserted, otherwise they are an error
+    returns one {"status": "created"|"updated", "drink": drink.long()}
+    per item, in order
+    raises BatchError (nothing written) when any item is invalid
+'''
+
+
+def upsert_drinks(items, create=True):
+    titles = _titles(items)
+    found = [_existing(titles)]
+    errors = _validate(items, found[0], create)
+    if errors is not None:
+        db.session.rollback()
+        raise BatchError(errors)
+
+    statuses = []
+
+    def stage():
+        # the first attempt uses the drinks found while validating; a
+        # retried commit rolled those back, so it looks them up afresh
+        existing = found.pop() if found else _existing(titles)
+        del statuses[:]
+        for item in items:
+            drink = existing.get(item['title'])
+            if drink is None:
+                db.session.add(Drink(title=item['title'], recipe=item['recipe']))
+                statuses.append('created')
+            else:
+                drink.recipe = item['recipe']
+                statuses.append('updated')
+    commit_with_retry(stage)
+
+    written = _existing(titles)
+    return [{'status': status, 'drink': written[item['title']].long()}
+            for status, item in zip(statuses, items)]
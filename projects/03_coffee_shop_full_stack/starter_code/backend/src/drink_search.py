@@ -0,0 +1,68 @@
+from flask import request, abort
+from sqlalchemy import and_, exists
+
+from .database.models import db, ingredient_key, Drink, DrinkIngredient
+
+'''
+Drink search
+
+GET /drinks/search finds drinks by ingredient through the drink_ingredient
+index (see DrinkIngredient in models.py), never parsing a recipe:
+    ingredient  a drink must use it; may be repeated (all of them)
+    exclude     a drink must not use it; may be repeated (none of them)
+An ingredient is a name, or name:color for that name in that color only,
+e.g. ingredient=milk:white. Names and colors are matched after
+ingredient_key normalization.
+
+With an ingredient the query starts from the index entries of the first
+one and checks every other condition with an index probe per candidate,
+so it costs in proportion to the drinks using that ingredient, not to
+the whole menu. With excludes only, every drink is a candidate.
+'''
+
+
+def _uses(name, color=None):
+    conditions = [DrinkIngredient.drink_id == Drink.id, DrinkIngredient.name == name]
+    if color is not None:
+        conditions.append(DrinkIngredient.color == color)
+    return exists().where(and_(*conditions))
+
+
+def _ingredients(argument):
+    ingredients = []
+    for value in request.args.getlist(argument):
+        name, _, color = value.partition(':')
+        if name.strip():
+            ingredients.append((ingredient_key(name),
+                                ingredient_key(color) if color.strip() else None))
+    return ingredients
+
+
+'''
+search_drinks()
+    the drinks matching the request arguments, in short form, by id
+    aborts with 400 when there is neither an ingredient nor an exclude
+'''
+
+
+def search_drinks():
+    ingredients = _ingredients('ingredient')
+    excludes = _ingredients('exclude')
+    if not ingredients and not excludes:
+        abort(400)
+
+    query = db.session.query(Drink.id, Drink.title, Drink.recipe)
+    if ingredients:
+        name, color = ingredients[0]
+        first = db.session.query(DrinkIngredient.drink_id).filter(
+            DrinkIngredient.name == name)
+        if color is not None:
+            first = first.filter(DrinkIngredient.color == color)
+        query = query.filter(Drink.id.in_(first.distinct()))
+    for name, color in ingredients[1:]:
+        query = query.filter(_uses(name, color))
+    for name, color in excludes:
+        query = query.filter(~_uses(name, color))
+
+    return [{'id': drink_id, 'title': title, 'recipe': Drink.short_recipe(recipe)}
+            for drink_id, title, recipe in query.order_by(Drink.id)]
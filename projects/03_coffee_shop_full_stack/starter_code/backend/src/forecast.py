@@ -0,0 +1,273 @@
+import datetime
+import itertools
+import threading
+
+import numpy as np
+from flask import abort
+from sqlalchemy import func, select, text
+
+from .database.models import db, commit_with_retry, Drink, DrinkIngredient, OrderTally
+from .menu_cache import menu_version
+
+'''
+Ingredient forecast
+
+Turns order tallies (drinks ordered per hour, see OrderTally) into
+ingredient usage with matrix products instead of a loop over orders:
+    - the parts matrix P has a row per drink and a column per ingredient
+      name, holding the parts of that ingredient in the drink's recipe;
+      it is built from the drink_ingredient index and kept per worker,
+      keyed on the shared menu version (menu_cache.py), so a drink
+      written through any worker makes every worker rebuild it
+    - the tallies of the requested history become a periods x drinks
+      matrix T (one np.bincount), and the ingredient usage per period is
+      T @ P, however many orders the tallies stand for
+    - the forecast for the next periods is the mean usage of the same
+      slot in the history: the same hour of the day for 'hour', the same
+      weekday for 'day'
+'''
+
+PERIOD_HOURS = {'hour': 1, 'day': 24}
+SEASON_PERIODS = {'hour': 24, 'day': 7}
+DEFAULT_HISTORY = {'hour': 14 * 24, 'day': 28}
+DEFAULT_HORIZON = {'hour': 24, 'day': 7}
+MAX_PERIODS = 366 * 24
+MAX_TALLIES = 10000
+
+UPSERT_TALLY = text(
+    'INSERT INTO order_tally (hour, drink_id, count) VALUES (:hour, :drink_id, :count) '
+    'ON CONFLICT (hour, drink_id) DO UPDATE SET count = order_tally.count + excluded.count')
+
+
+'''
+PartsMatrix
+    drink_ids: sorted drink ids, one per row
+    ingredients: ingredient names, one per column
+    parts: len(drink_ids) x len(ingredients) float array
+'''
+
+
+class PartsMatrix(object):
+    def __init__(self, drink_ids, ingredients, parts):
+        self.drink_ids = drink_ids
+        self.ingredients = ingredients
+        self.parts = parts
+
+    '''
+    load()
+        the parts matrix of every drink, from two queries
+    '''
+    @classmethod
+    def load(cls):
+        drink_ids = np.array(sorted(drink_id for drink_id, in db.session.query(Drink.id)),
+                             dtype=np.int64)
+        rows = db.session.query(DrinkIngredient.drink_id, DrinkIngredient.name,
+                                func.sum(DrinkIngredient.parts)).group_by(
+            DrinkIngredient.drink_id, DrinkIngredient.name).all()
+        ingredients = sorted(set(name for _, name, _ in rows))
+        columns = dict((name, column) for column, name in enumerate(ingredients))
+        parts = np.zeros((len(drink_ids), len(ingredients)))
+        if rows:
+            ids = np.array([drink_id for drink_id, _, _ in rows], dtype=np.int64)
+            parts[np.searchsorted(drink_ids, ids),
+                  [columns[name] for _, name, _ in rows]] = [total for _, _, total in rows]
+        return cls(drink_ids, ingredients, parts)
+
+    '''
+    rows(drink_ids)
+        the row of each drink id, -1 for ids not in the matrix
+    '''
+    def rows(self, drink_ids):
+        if not len(self.drink_ids):
+            return np.full(len(drink_ids), -1, dtype=np.int64)
+        rows = np.searchsorted(self.drink_ids, drink_ids)
+        rows[rows == len(self.drink_ids)] = 0
+        return np.where(self.drink_ids[rows] == drink_ids, rows, -1)
+
+
+'''
+PartsMatrixCache
+    the parts matrix of the current menu version; get() costs the version
+    lookup while no drink changes
+'''
+
+
+class PartsMatrixCache(object):
+    def __init__(self):
+        self._matrix = None  # (menu version, PartsMatrix)
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self):
+        version = menu_version()
+        with self._lock:
+            if self._matrix is None or self._matrix[0] != version:
+                self._matrix = (version, PartsMatrix.load())
+                self.builds += 1
+            return self._matrix[1]
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+
+
+parts_matrix = PartsMatrixCache()
+
+
+def parse_hour(value):
+    try:
+        moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() // 3600)
+
+
+def format_hour(hour):
+    moment = datetime.datetime.fromtimestamp(hour * 3600, datetime.timezone.utc)
+    return moment.isoformat()
+
+
+'''
+record_tallies(tallies)
+    adds a list of {"drink_id": int, "hour": ISO 8601 time, "count": int}
+    to the order tallies in one transaction; the hour is truncated, times
+    without an offset are UTC
+    aborts with 400 for a malformed tally, 422 for an unknown drink
+    returns the number of orders recorded
+'''
+
+
+def record_tallies(tallies):
+    if not isinstance(tallies, list) or not tallies or len(tallies) > MAX_TALLIES:
+        abort(400)
+    counts = {}
+    for tally in tallies:
+        if not isinstance(tally, dict):
+            abort(400)
+        drink_id, count = tally.get('drink_id'), tally.get('count')
+        hour = parse_hour(tally.get('hour'))
+        if (hour is None or type(drink_id) is not int or type(count) is not int
+                or count < 1):
+            abort(400)
+        counts[hour, drink_id] = counts.get((hour, drink_id), 0) + count
+
+    drink_ids = set(drink_id for _, drink_id in counts)
+    known = db.session.query(Drink.id).filter(Drink.id.in_(drink_ids)).count()
+    if known != len(drink_ids):
+        abort(422)
+
+    rows = [{'hour': hour, 'drink_id': drink_id, 'count': count}
+            for (hour, drink_id), count in counts.items()]
+    commit_with_retry(lambda: db.session.execute(UPSERT_TALLY, rows))
+    return sum(counts.values())
+
+
+'''
+load_tallies(first_hour)
+    the tallies from first_hour on as an (n, 3) int array of hour,
+    drink_id, count; read with a core select straight into the array,
+    skipping ORM rows and per-row Python objects
+'''
+
+
+def load_tallies(first_hour):
+    table = OrderTally.__table__
+    rows = db.session.execute(select([table.c.hour, table.c.drink_id, table.c.count])
+                              .where(table.c.hour >= first_hour)).fetchall()
+    return np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64,
+                       count=3 * len(rows)).reshape(-1, 3)
+
+
+'''
+usage_matrix(tallies, matrix, first_period, periods, period_hours)
+    T @ P: the parts of every ingredient used per period, for tallies
+    given as an (n, 3) array of hour, drink_id, count; tallies outside
+    the periods or of drinks not in the matrix are left out
+'''
+
+
+def usage_matrix(tallies, matrix, first_period, periods, period_hours):
+    period = tallies[:, 0] // period_hours - first_period
+    rows = matrix.rows(tallies[:, 1])
+    kept = (rows >= 0) & (period >= 0) & (period < periods)
+    drinks = len(matrix.drink_ids)
+    ordered = np.bincount(period[kept] * drinks + rows[kept], weights=tallies[kept, 2],
+                          minlength=periods * drinks).reshape(periods, drinks)
+    return ordered @ matrix.parts
+
+
+'''
+seasonal_forecast(usage, first_period, horizon, season)
+    for each of the `horizon` periods after the usage, the mean usage of
+    the periods in the same slot of the season
+'''
+
+
+def seasonal_forecast(usage, first_period, horizon, season):
+    periods = len(usage)
+    slots = (first_period + np.arange(periods)) % season
+    members = (slots == np.arange(season)[:, None]).astype(usage.dtype)
+    seen = members.sum(axis=1)[:, None]
+    means = np.divide(members @ usage, seen, out=np.zeros((season, usage.shape[1])),
+                      where=seen > 0)
+    return means[(first_period + periods + np.arange(horizon)) % season]
+
+
+def _count(value, default):
+    if value is None:
+        return default
+    try:
+        count = int(value)
+    except ValueError:
+        abort(400)
+    if not 1 <= count <= MAX_PERIODS:
+        abort(400)
+    return count
+
+
+'''
+ingredient_forecast(granularity='day', history=None, horizon=None)
+    the ingredient usage of the last `history` periods ('hour' or 'day')
+    up to the latest tally, and the forecast for the `horizon` periods
+    after it:
+    {"granularity", "ingredients": [names],
+     "history": {"periods": [start times], "usage": [[parts per ingredient]]},
+     "forecast": {"periods": [...], "usage": [[...]]}}
+'''
+
+
+def ingredient_forecast(granularity='day', history=None, horizon=None):
+    if granularity not in PERIOD_HOURS:
+        abort(400)
+    period_hours = PERIOD_HOURS[granularity]
+    history = _count(history, DEFAULT_HISTORY[granularity])
+    horizon = _count(horizon, DEFAULT_HORIZON[granularity])
+
+    matrix = parts_matrix.get()
+    result = {
+        'granularity': granularity,
+        'ingredients': matrix.ingredients,
+        'history': {'periods': [], 'usage': []},
+        'forecast': {'periods': [], 'usage': []},
+    }
+    latest = db.session.query(func.max(OrderTally.hour)).scalar()
+    if latest is None:
+        return result
+
+    first_period = latest // period_hours - history + 1
+    tallies = load_tallies(first_period * period_hours)
+    usage = usage_matrix(tallies, matrix, first_period, history, period_hours)
+    forecast = seasonal_forecast(usage, first_period, horizon, SEASON_PERIODS[granularity])
+
+    result['history'] = {
+        'periods': [format_hour((first_period + k) * period_hours) for k in range(history)],
+        'usage': np.round(usage, 3).tolist(),
+    }
+    result['forecast'] = {
+        'periods': [format_hour((first_period + history + k) * period_hours)
+                    for k in range(horizon)],
+        'usage': np.round(forecast, 3).tolist(),
+    }
+    return result
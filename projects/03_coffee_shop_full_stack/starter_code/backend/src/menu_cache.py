@@ -0,0 +1,163 @@
+import itertools
+import json
+import os
+import threading
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .database.models import db, Drink, MenuVersion
+
+'''
+Menu cache
+
+Each worker keeps the menu JSON-encoded in both forms, so GET /drinks and
+GET /drinks-detail cost one primary-key lookup of the menu version and a
+dict lookup, instead of loading and serializing every drink.
+
+The menu version is the single row of the menu_version table. Every flush
+that writes a drink, and every bulk Drink update or delete, increments it
+inside the same transaction, so:
+    - a write through any gunicorn worker is seen by all of them on their
+      next request; a rolled back write leaves the version alone
+    - the ETag is the form and the version, valid across workers and
+      restarts; a client revalidating an unchanged menu gets a 304
+    - a worker that finds its copy older than the version rebuilds it
+      once, concurrent requests of that worker waiting for that rebuild
+The row also holds a random epoch written with it, so a recreated
+database never reuses the ETags of the old one.
+'''
+
+MENU_FORMS = ('short', 'long')
+MENU_VERSION_ID = 1
+
+
+'''
+menu_version()
+    the current menu version, "<epoch>.<counter>"; "0" before the first
+    drink write of a database created without the migrations
+'''
+
+
+def menu_version():
+    row = db.session.query(MenuVersion.epoch, MenuVersion.value).filter(
+        MenuVersion.id == MENU_VERSION_ID).first()
+    return '{}.{}'.format(*row) if row is not None else '0'
+
+
+'''
+bump_menu_version(connection)
+    increments the menu version in the transaction of connection
+'''
+
+
+def bump_menu_version(connection):
+    table = MenuVersion.__table__
+    result = connection.execute(table.update().where(table.c.id == MENU_VERSION_ID)
+                                .values(value=table.c.value + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=MENU_VERSION_ID,
+                                                 epoch=os.urandom(4).hex(), value=1))
+
+
+'''
+load_menu()
+    every drink in both forms, {'short': [...], 'long': [...]}
+'''
+
+
+def load_menu():
+    drinks = Drink.query.order_by(Drink.id).all()
+    return {
+        'short': [drink.short() for drink in drinks],
+        'long': [drink.long() for drink in drinks],
+    }
+
+
+def menu_etag(form, version):
+    return '{}-{}'.format(form, version)
+
+
+'''
+MenuCache(build, version)
+    build() returns both forms of the menu, version() the menu version
+    they belong to
+'''
+
+
+class MenuCache(object):
+    def __init__(self, build=load_menu, version=menu_version):
+        self._build = build
+        self._version = version
+        self._menu = None  # (version, {form: encoded body})
+        self._build_lock = threading.Lock()
+        self.builds = 0
+
+    '''
+    get(form, version=None)
+        (encoded body, etag) of the menu in form at version (read when not
+        given), building it first if this worker has an older one
+    '''
+    def get(self, form, version=None):
+        if version is None:
+            version = self._version()
+        menu = self._menu
+        if menu is None or menu[0] != version:
+            with self._build_lock:
+                menu = self._menu
+                if menu is None or menu[0] != version:
+                    drinks = self._build()
+                    menu = (version, dict(
+                        (name, json.dumps({'success': True, 'drinks': drinks[name]},
+                                          separators=(',', ':')).encode('utf-8'))
+                        for name in MENU_FORMS))
+                    self._menu = menu
+                    self.builds += 1
+        return menu[1][form], menu_etag(form, menu[0])
+
+    '''
+    response(form, cache_control)
+        the menu as a conditional response: 304 when the request's
+        If-None-Match holds the ETag of the current version
+    '''
+    def response(self, form, cache_control='no-cache'):
+        response_class = current_app.response_class
+        version = self._version()
+        if request.if_none_match.contains(menu_etag(form, version)):
+            response = response_class(status=304)
+            response.set_etag(menu_etag(form, version))
+        else:
+            body, etag = self.get(form, version)
+            response = response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def clear(self):
+        with self._build_lock:
+            self._menu = None
+
+
+menu_cache = MenuCache()
+
+
+'''
+the version is bumped by the flush that writes a drink, and by bulk Drink
+updates and deletes, on the connection of their transaction
+'''
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Drink):
+            bump_menu_version(session.connection())
+            return
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _bump_on_bulk(context):
+    if context.mapper.class_ is Drink:
+        bump_menu_version(context.session.connection())
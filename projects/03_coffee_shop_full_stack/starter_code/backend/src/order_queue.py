@@ -0,0 +1,318 @@
+import atexit
+import contextlib
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import exc
+
+from .database.models import db, commit_with_retry, Drink, Order
+from .forecast import UPSERT_TALLY
+
+'''
+Order queue
+
+POST /orders does not write to the database. The order gets its id, goes
+into a bounded in-process queue and the request returns 202 at once; a
+background writer thread per worker commits the queued orders in groups:
+    - a group is closed when it holds ORDER_BATCH_SIZE orders or when its
+      oldest order has waited ORDER_MAX_LATENCY_MS; orders that are
+      already queued by then join it up to the batch size, so under load
+      the groups grow and the commits per second stay flat
+    - one transaction per group inserts the orders and adds them to the
+      hourly order tallies of the ingredient forecast (forecast.py)
+    - when ORDER_QUEUE_SIZE orders are waiting, new ones are refused with
+      429 instead of queueing without bound
+    - a group whose write fails with a transient database error (an
+      OperationalError: busy, locked, connection lost) is written again,
+      up to GROUP_WRITE_ATTEMPTS times with a growing delay, leaving out
+      the orders an attempt committed before failing; any other error,
+      or the last attempt failing, fails the whole group
+    - GET /orders/<id> answers 'queued' from memory until the order is
+      committed, then 'accepted' from the database ('failed' when its
+      group could not be written)
+
+Queued orders live in the worker's memory: a worker that crashes loses
+the orders it had not committed yet, at most ORDER_MAX_LATENCY_MS worth
+(plus the commit in flight). Stopping the worker normally writes them.
+'''
+
+ORDER_QUEUE_SIZE = int(os.environ.get('ORDER_QUEUE_SIZE', 10000))
+ORDER_BATCH_SIZE = int(os.environ.get('ORDER_BATCH_SIZE', 500))
+ORDER_MAX_LATENCY = float(os.environ.get('ORDER_MAX_LATENCY_MS', 50)) / 1000
+GROUP_WRITE_ATTEMPTS = 4
+GROUP_RETRY_DELAY = 0.1
+FAILED_ORDERS_KEPT = 10000
+MAX_QUANTITY = 100
+
+
+class QueueFull(Exception):
+    pass
+
+
+'''
+write_orders(orders, committed_at)
+    inserts a group of queued orders and adds them to the order tallies,
+    in one transaction
+'''
+
+
+def write_orders(orders, committed_at):
+    rows = [{'id': order['id'], 'drink_id': order['drink_id'], 'quantity': order['quantity'],
+             'created_at': order['created_at'], 'committed_at': committed_at}
+            for order in orders]
+    counts = {}
+    for order in orders:
+        key = (int(order['created_at'] // 3600), order['drink_id'])
+        counts[key] = counts.get(key, 0) + order['quantity']
+    tallies = [{'hour': hour, 'drink_id': drink_id, 'count': count}
+               for (hour, drink_id), count in counts.items()]
+
+    def stage():
+        db.session.execute(Order.__table__.insert(), rows)
+        db.session.execute(UPSERT_TALLY, tallies)
+    try:
+        commit_with_retry(stage)
+    finally:
+        db.session.remove()
+
+
+'''
+stored_order_ids(ids)
+    the ones of ids already in drink_order
+'''
+
+
+def stored_order_ids(ids):
+    try:
+        return set(order_id for order_id, in
+                   db.session.query(Order.id).filter(Order.id.in_(ids)))
+    finally:
+        db.session.remove()
+
+
+'''
+OrderQueue(write, maxsize, batch_size, max_latency, stored)
+    the bounded queue and its writer thread; write(orders, committed_at)
+    commits a group of orders and stored(ids) tells which of them are
+    already committed, both in an app context after init_app(app)
+    the thread is started by the first submit() in each process
+'''
+
+
+class OrderQueue(object):
+    def __init__(self, write=write_orders, maxsize=ORDER_QUEUE_SIZE,
+                 batch_size=ORDER_BATCH_SIZE, max_latency=ORDER_MAX_LATENCY,
+                 stored=stored_order_ids):
+        self._write = write
+        self._stored = stored
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.app = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._pending = {}  # id: order, queued and not written yet
+        self._failed = OrderedDict()
+        self.batches = 0
+        self.written = 0
+        self.rejected = 0
+        self.retries = 0
+        self.last_error = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def _start(self):
+        # callers hold _lock; a forked worker inherits neither the writer
+        # thread nor what its parent had queued, so it starts afresh
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.maxsize)
+        self._pending = {}
+        self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                         name='order-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    '''
+    submit(drink_id, quantity)
+        queues an order and returns it, {"id", "drink_id", "quantity",
+        "status": "queued", "created_at"}
+        raises QueueFull when maxsize orders are waiting
+    '''
+    def submit(self, drink_id, quantity=1):
+        order = {
+            'id': uuid.uuid4().hex,
+            'drink_id': drink_id,
+            'quantity': quantity,
+            'status': 'queued',
+            'created_at': time.time(),
+            'queued_at': time.monotonic(),
+        }
+        with self._lock:
+            self._start()
+            try:
+                self._queue.put_nowait(order)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull()
+            self._pending[order['id']] = order
+        return self._public(order)
+
+    '''
+    status(order_id)
+        the order while it is queued or after its group failed, else None
+    '''
+    def status(self, order_id):
+        with self._lock:
+            order = self._pending.get(order_id) or self._failed.get(order_id)
+        return self._public(order) if order is not None else None
+
+    '''
+    drain()
+        waits until every order queued so far was written (or failed)
+    '''
+    def drain(self):
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    '''
+    close(timeout=10)
+        writes what is queued and stops the writer thread
+    '''
+    def close(self, timeout=10):
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                return
+            thread, self._thread, self._pid = self._thread, None, None
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _public(self, order):
+        return dict((key, value) for key, value in order.items() if key != 'queued_at')
+
+    def _run(self, orders):
+        while True:
+            first = orders.get()
+            if first is None:
+                orders.task_done()
+                return
+            batch, stop = [first], False
+            deadline = first['queued_at'] + self.max_latency
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    order = orders.get(timeout=timeout) if timeout > 0 else orders.get_nowait()
+                except queue.Empty:
+                    break
+                if order is None:
+                    orders.task_done()
+                    stop = True
+                    break
+                batch.append(order)
+            self._flush(batch)
+            for _ in batch:
+                orders.task_done()
+            if stop:
+                return
+
+    def _flush(self, batch):
+        failed = False
+        unwritten = batch
+        for attempt in range(GROUP_WRITE_ATTEMPTS):
+            context = self.app.app_context() if self.app is not None else contextlib.nullcontext()
+            try:
+                with context:
+                    if attempt:
+                        # the failed attempt may have committed before its
+                        # error (a connection lost after COMMIT): never
+                        # insert those orders twice
+                        stored = self._stored([order['id'] for order in unwritten])
+                        unwritten = [order for order in unwritten if order['id'] not in stored]
+                    if unwritten:
+                        self._write(unwritten, time.time())
+                break
+            except exc.OperationalError as err:
+                self.last_error = err
+                if attempt + 1 == GROUP_WRITE_ATTEMPTS:
+                    failed = True
+                    break
+                self.retries += 1
+                time.sleep(GROUP_RETRY_DELAY * 2 ** attempt)
+            except Exception as err:
+                self.last_error = err
+                failed = True
+                break
+        with self._lock:
+            for order in batch:
+                self._pending.pop(order['id'], None)
+                if failed:
+                    self._failed[order['id']] = dict(order, status='failed')
+            while len(self._failed) > FAILED_ORDERS_KEPT:
+                self._failed.popitem(last=False)
+            self.batches += 1
+            if not failed:
+                self.written += len(batch)
+
+
+order_queue = OrderQueue()
+
+
+def _order(body):
+    if not isinstance(body, dict):
+        return None
+    drink_id, quantity = body.get('drink_id'), body.get('quantity', 1)
+    if type(drink_id) is not int or type(quantity) is not int:
+        return None
+    if not 1 <= quantity <= MAX_QUANTITY:
+        return None
+    return drink_id, quantity
+
+
+'''
+place_order(body)
+    validates {"drink_id": int, "quantity": int (default 1)} and queues it
+    returns the queued order, None for a malformed body
+    raises KeyError for an unknown drink, QueueFull when the queue is full
+'''
+
+
+def place_order(body):
+    order = _order(body)
+    if order is None:
+        return None
+    drink_id, quantity = order
+    # one primary-key lookup, so drinks written through other workers count
+    if db.session.query(Drink.id).filter(Drink.id == drink_id).first() is None:
+        raise KeyError(drink_id)
+    return order_queue.submit(drink_id, quantity)
+
+
+'''
+order_status(order_id)
+    the queued, failed or accepted order, or None
+'''
+
+
+def order_status(order_id):
+    order = order_queue.status(order_id)
+    if order is not None and order['status'] == 'queued':
+        return order
+    # the database first: an order of a failed group may still have been
+    # committed
+    stored = Order.query.get(order_id)
+    return stored.format() if stored is not None else order
@@ -0,0 +1,104 @@
+import base64
+import binascii
+
+from flask import request, abort
+from sqlalchemy import func
+
+from .database.models import db, Drink
+
+'''
+Drink pages
+
+GET /drinks and GET /drinks-detail return the whole menu when called
+without parameters (answered from the menu cache). Any of these
+parameters switches to a page read straight from the database:
+    limit         drinks per page, default DEFAULT_PAGE_SIZE, at most
+                  MAX_PAGE_SIZE
+    cursor        next_cursor of the previous page
+    fields        comma separated subset of id,title,recipe
+    title_prefix  only drinks whose title starts with it (case-sensitive)
+
+Pages are keyed on the drink id (WHERE id > last id ORDER BY id LIMIT n),
+so every page costs the same however deep it is. A prefix is matched with
+LIKE 'prefix%' (its %, _ and escape characters escaped), which means the
+same under any collation, plus an exact comparison of the title's first
+characters, since SQLite's LIKE ignores ASCII case. Only the columns of
+the requested fields are selected.
+'''
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+PAGE_PARAMETERS = ('limit', 'cursor', 'fields', 'title_prefix')
+FIELDS = ('id', 'title', 'recipe')
+
+
+def wants_page():
+    return any(name in request.args for name in PAGE_PARAMETERS)
+
+
+def encode_cursor(drink_id):
+    return base64.urlsafe_b64encode(str(drink_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400)
+
+
+def parse_fields(value):
+    if value is None:
+        return FIELDS
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if not fields or any(field not in FIELDS for field in fields):
+        abort(400)
+    return fields
+
+
+def parse_limit(value):
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        abort(400)
+    if limit < 1:
+        abort(400)
+    return min(limit, MAX_PAGE_SIZE)
+
+
+'''
+drink_page(form)
+    the page described by the request arguments, in form 'short' or
+    'long': {"success": True, "drinks": [...], "next_cursor": str or None}
+'''
+
+
+def drink_page(form):
+    limit = parse_limit(request.args.get('limit'))
+    fields = parse_fields(request.args.get('fields'))
+    columns = [Drink.id] + [getattr(Drink, field) for field in fields if field != 'id']
+    query = db.session.query(*columns)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(Drink.id > decode_cursor(cursor))
+    prefix = request.args.get('title_prefix')
+    if prefix:
+        query = query.filter(Drink.title.startswith(prefix, autoescape=True),
+                             func.substr(Drink.title, 1, len(prefix)) == prefix)
+    rows = query.order_by(Drink.id).limit(limit + 1).all()
+
+    drinks = []
+    for row in rows[:limit]:
+        drink = dict((field, getattr(row, field)) for field in fields)
+        if 'recipe' in drink and form == 'short':
+            drink['recipe'] = Drink.short_recipe(drink['recipe'])
+        drinks.append(drink)
+    return {
+        'success': True,
+        'drinks': drinks,
+        'next_cursor': encode_cursor(rows[limit - 1].id) if len(rows) > limit else None,
+    }
@@ -0,0 +1,264 @@
+import unittest
+from unittest import mock
+
+from src.api import app
+from src.auth import auth
+from src.database.models import db, Drink, DrinkIngredient, Order, OrderTally
+from src.forecast import PartsMatrixCache, parse_hour
+from src.menu_cache import menu_cache, menu_version
+from src.order_queue import QueueFull, order_queue
+
+BARISTA = ['get:drinks-detail']
+MANAGER = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks',
+           'post:orders', 'get:forecast']
+
+
+def recipe(name, color='brown', parts=1):
+    return [{'name': name, 'color': color, 'parts': parts}]
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """This class represents the coffee shop API test case"""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        Drink.query.delete()
+        db.session.add_all(Drink(title=title, recipe=recipe(title.split()[-1]))
+                           for title in ['iced latte', 'iced mocha', 'latte', 'mocha',
+                                         'flat white', 'iced tea'])
+        db.session.commit()
+        self.ids = dict((drink.title, drink.id) for drink in Drink.query)
+        issuer = auth.key_provider
+        self.barista = {'Authorization': 'Bearer ' + issuer.mint(BARISTA, sub='barista')}
+        self.manager = {'Authorization': 'Bearer ' + issuer.mint(MANAGER, sub='manager')}
+
+    def tearDown(self):
+        Drink.query.delete()
+        OrderTally.query.delete()
+        Order.query.delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+        auth.token_cache.clear()
+        menu_cache.clear()
+
+    def test_full_menu(self):
+        res = self.client.get('/drinks')
+        data = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['drinks']), 6)
+        self.assertEqual(data['drinks'][0]['recipe'], [{'color': 'brown', 'parts': 1}])
+        self.assertNotIn('next_cursor', data)
+
+        res = self.client.get('/drinks-detail', headers=self.barista)
+        self.assertEqual(res.get_json()['drinks'][0]['recipe'], recipe('latte'))
+        self.assertEqual(self.client.get('/drinks-detail').status_code, 401)
+
+    def test_malformed_drinks_are_rejected(self):
+        for body in [{'title': 'cortado', 'recipe': {'name': 'espresso'}},
+                     {'title': 'cortado', 'recipe': 'espresso'},
+                     {'title': 'cortado', 'recipe': [{'color': 'brown', 'parts': 1}]},
+                     {'recipe': recipe('espresso')}]:
+            res = self.client.post('/drinks', json=body, headers=self.manager)
+            self.assertEqual(res.status_code, 422)
+        self.assertEqual(self.client.post('/drinks', json=[recipe('espresso')],
+                                          headers=self.manager).status_code, 400)
+
+        url = '/drinks/{}'.format(self.ids['latte'])
+        self.assertEqual(self.client.patch(url, json={'recipe': 'espresso'},
+                                           headers=self.manager).status_code, 422)
+        self.assertEqual(self.client.patch(url, json={'title': ''},
+                                           headers=self.manager).status_code, 422)
+        self.assertEqual(self.client.patch(url, json={'price': 3},
+                                           headers=self.manager).status_code, 400)
+        res = self.client.patch(url, json={'recipe': recipe('oat milk', 'white')},
+                                headers=self.manager)
+        self.assertEqual(res.get_json()['drinks'], [{'id': self.ids['latte'], 'title': 'latte',
+                                                     'recipe': recipe('oat milk', 'white')}])
+        self.assertEqual(Drink.query.count(), 6)
+
+    def test_cursor_pagination(self):
+        titles, cursor = [], None
+        for _ in range(3):
+            url = '/drinks?limit=4' + ('&cursor=' + cursor if cursor else '')
+            data = self.client.get(url).get_json()
+            titles += [drink['title'] for drink in data['drinks']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(titles, ['iced latte', 'iced mocha', 'latte', 'mocha',
+                                  'flat white', 'iced tea'])
+        self.assertEqual(self.client.get('/drinks?cursor=%%%').status_code, 400)
+        self.assertEqual(self.client.get('/drinks?limit=0').status_code, 400)
+
+    def test_fields_and_title_prefix(self):
+        data = self.client.get('/drinks?title_prefix=iced&fields=title').get_json()
+        self.assertEqual(data['drinks'], [{'title': 'iced latte'}, {'title': 'iced mocha'},
+                                          {'title': 'iced tea'}])
+        self.assertIsNone(data['next_cursor'])
+
+        res = self.client.get('/drinks-detail?title_prefix=mo&fields=id,recipe',
+                              headers=self.barista)
+        self.assertEqual(res.get_json()['drinks'],
+                         [{'id': self.ids['mocha'], 'recipe': recipe('mocha')}])
+        self.assertEqual(self.client.get('/drinks?fields=price').status_code, 400)
+
+        Drink(title='50% off_latte', recipe=recipe('latte')).insert()
+        Drink(title='500 off latte', recipe=recipe('latte')).insert()
+        for prefix, titles in [('50%25', ['50% off_latte']), ('50% off_', ['50% off_latte']),
+                               ('_', []), ('ICED', []), ('Iced', [])]:
+            data = self.client.get('/drinks?fields=title&title_prefix=' + prefix).get_json()
+            self.assertEqual([drink['title'] for drink in data['drinks']], titles)
+
+    def test_batch_upsert(self):
+        batch = [{'title': 'latte', 'recipe': recipe('oat milk', 'white', 3)},
+                 {'title': 'cortado', 'recipe': recipe('espresso')}]
+        epoch, version = menu_version().split('.')
+        res = self.client.post('/drinks/batch', json=batch, headers=self.manager)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(menu_version(), '{}.{}'.format(epoch, int(version) + 1))
+        results = res.get_json()['results']
+        self.assertEqual([result['status'] for result in results], ['updated', 'created'])
+        self.assertEqual(results[0]['drink'], {'id': self.ids['latte'], 'title': 'latte',
+                                               'recipe': recipe('oat milk', 'white', 3)})
+        titles = [drink['title'] for drink in self.client.get('/drinks').get_json()['drinks']]
+        self.assertEqual(titles[-1], 'cortado')
+
+        batch = [{'title': 'mocha', 'recipe': recipe('cocoa')}]
+        res = self.client.patch('/drinks/batch', json=batch, headers=self.manager)
+        self.assertEqual(res.get_json()['results'][0]['status'], 'updated')
+        self.assertEqual(self.client.post('/drinks/batch', json=batch,
+                                          headers=self.barista).status_code, 401)
+        self.assertEqual(self.client.post('/drinks/batch', json={'title': 'mocha'},
+                                          headers=self.manager).status_code, 400)
+
+    def test_invalid_batch_writes_nothing(self):
+        batch = [{'title': 'ristretto', 'recipe': recipe('espresso')},
+                 {'title': 'ristretto', 'recipe': recipe('espresso')},
+                 {'title': 'lungo', 'recipe': [{'name': 'espresso', 'color': 'brown'}]}]
+        res = self.client.post('/drinks/batch', json=batch, headers=self.manager)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual([result['status'] for result in res.get_json()['results']],
+                         ['skipped', 'invalid', 'invalid'])
+
+        batch = [{'title': 'latte', 'recipe': recipe('cream')},
+                 {'title': 'ristretto', 'recipe': recipe('espresso')}]
+        res = self.client.patch('/drinks/batch', json=batch, headers=self.manager)
+        self.assertEqual([result['status'] for result in res.get_json()['results']],
+                         ['skipped', 'not found'])
+        self.assertEqual(Drink.query.count(), 6)
+        self.assertEqual(Drink.query.get(self.ids['latte']).recipe, recipe('latte'))
+
+    def search(self, query):
+        res = self.client.get('/drinks/search?' + query)
+        self.assertEqual(res.status_code, 200)
+        return [drink['title'] for drink in res.get_json()['drinks']]
+
+    def test_search_by_ingredient(self):
+        Drink(title='cappuccino', recipe=recipe('espresso') + recipe('Oat  Milk', 'white')).insert()
+        drink = Drink.query.get(self.ids['iced latte'])
+        drink.recipe = recipe('espresso') + recipe('milk', 'white') + recipe('ice', 'clear')
+        drink.update()
+
+        self.assertEqual(self.search('ingredient=espresso'), ['iced latte', 'cappuccino'])
+        self.assertEqual(self.search('ingredient=oat+milk'), ['cappuccino'])
+        self.assertEqual(self.search('ingredient=espresso&exclude=ice'), ['cappuccino'])
+        self.assertEqual(self.search('ingredient=espresso&ingredient=milk:White'),
+                         ['iced latte'])
+        self.assertEqual(self.search('ingredient=milk:brown'), [])
+        self.assertEqual(self.search('ingredient=espresso&exclude=ice:blue'),
+                         ['iced latte', 'cappuccino'])
+        self.assertEqual(len(self.search('exclude=espresso')), 5)
+        self.assertEqual(self.client.get('/drinks/search').status_code, 400)
+
+        Drink.query.filter(Drink.title == 'cappuccino').one().delete()
+        Drink.query.filter(Drink.title == 'iced latte').delete()
+        db.session.commit()
+        self.assertEqual(self.search('ingredient=espresso'), [])
+        self.assertEqual(DrinkIngredient.query.count(), 5)
+
+    def test_ingredient_forecast(self):
+        res = self.client.get('/ingredients/forecast', headers=self.manager)
+        self.assertEqual(res.get_json()['forecast']['history']['usage'], [])
+
+        latte, mocha = self.ids['latte'], self.ids['mocha']
+        tallies = [{'drink_id': latte, 'hour': '2026-10-19T08:15', 'count': 3},
+                   {'drink_id': latte, 'hour': '2026-10-19T08:45', 'count': 1},
+                   {'drink_id': mocha, 'hour': '2026-10-20T09:00Z', 'count': 2}]
+        res = self.client.post('/orders/tally', json=tallies, headers=self.manager)
+        self.assertEqual(res.get_json()['orders'], 6)
+        self.client.post('/orders/tally', json=tallies[:1], headers=self.manager)
+        self.assertEqual(OrderTally.query.get((parse_hour('2026-10-19T08:00'), latte)).count, 7)
+
+        # another worker's parts matrix, built before the drink changes
+        other = PartsMatrixCache()
+        self.assertNotIn('cocoa', other.get().ingredients)
+        batch = [{'title': 'mocha', 'recipe': recipe('espresso') + recipe('cocoa', 'brown', 2)}]
+        self.client.patch('/drinks/batch', json=batch, headers=self.manager)
+        self.assertIn('cocoa', other.get().ingredients)
+        res = self.client.get('/ingredients/forecast?history=2&horizon=7', headers=self.manager)
+        forecast = res.get_json()['forecast']
+        self.assertEqual(forecast['ingredients'], ['cocoa', 'espresso', 'latte', 'mocha', 'tea',
+                                                   'white'])
+        self.assertEqual(forecast['history']['periods'], ['2026-10-19T00:00:00+00:00',
+                                                          '2026-10-20T00:00:00+00:00'])
+        self.assertEqual(forecast['history']['usage'], [[0, 0, 7, 0, 0, 0],
+                                                        [4, 2, 0, 0, 0, 0]])
+        self.assertEqual(len(forecast['forecast']['usage']), 7)
+        self.assertEqual(forecast['forecast']['usage'][5], [0, 0, 7, 0, 0, 0])
+
+        res = self.client.get('/ingredients/forecast?granularity=hour&history=2',
+                              headers=self.manager)
+        self.assertEqual(res.get_json()['forecast']['history']['usage'][1][:2], [4, 2])
+        self.assertEqual(self.client.post('/orders/tally', json=[{'drink_id': 999, 'count': 1,
+                                                                  'hour': '2026-10-19T08'}],
+                                          headers=self.manager).status_code, 422)
+        self.assertEqual(self.client.post('/orders/tally', json=[{'drink_id': latte}],
+                                          headers=self.manager).status_code, 400)
+        self.assertEqual(self.client.get('/ingredients/forecast',
+                                         headers=self.barista).status_code, 401)
+
+    def test_orders(self):
+        res = self.client.post('/orders', json={'drink_id': self.ids['latte'], 'quantity': 2},
+                               headers=self.manager)
+        self.assertEqual(res.status_code, 202)
+        order = res.get_json()['order']
+        self.assertIn(order['status'], ('queued', 'accepted'))
+
+        order_queue.drain()
+        res = self.client.get('/orders/' + order['id'], headers=self.manager)
+        self.assertEqual(res.get_json()['order']['status'], 'accepted')
+        self.assertEqual(res.get_json()['order']['quantity'], 2)
+        self.assertEqual(OrderTally.query.one().count, 2)
+        # a group reported failed whose commit went through is accepted
+        with mock.patch.object(order_queue, 'status', return_value=dict(order, status='failed')):
+            res = self.client.get('/orders/' + order['id'], headers=self.manager)
+        self.assertEqual(res.get_json()['order']['status'], 'accepted')
+
+        self.assertEqual(self.client.get('/orders/nope', headers=self.manager).status_code, 404)
+        self.assertEqual(self.client.post('/orders', json={'drink_id': 999},
+                                          headers=self.manager).status_code, 422)
+        # a drink deleted without going through the models is not orderable
+        db.session.execute(Drink.__table__.delete().where(Drink.id == self.ids['mocha']))
+        db.session.commit()
+        self.assertEqual(self.client.post('/orders', json={'drink_id': self.ids['mocha']},
+                                          headers=self.manager).status_code, 422)
+        self.assertEqual(self.client.post('/orders', json={'drink_id': self.ids['latte'],
+                                                           'quantity': 0},
+                                          headers=self.manager).status_code, 400)
+        self.assertEqual(self.client.post('/orders', json={'drink_id': self.ids['latte']},
+                                          headers=self.barista).status_code, 401)
+
+    def test_full_order_queue(self):
+        with mock.patch('src.api.place_order', side_effect=QueueFull):
+            res = self.client.post('/orders', json={'drink_id': self.ids['latte']},
+                                   headers=self.manager)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
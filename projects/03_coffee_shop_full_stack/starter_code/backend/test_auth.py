@@ -0,0 +1,341 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, jsonify
+from jose import jwk, jwt
+
+from src.auth import auth
+from src.auth.jwks import JWKSKeyStore, JWKSUnavailableError
+from src.auth.providers import LocalJWKSFile, TestIssuer, make_key_provider
+from src.auth.token_cache import TokenCache
+
+
+def generate_key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(serialization.Encoding.PEM,
+                                serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption()).decode()
+    public = jwk.construct(pem, 'RS256').public_key().to_dict()
+    public.update({'kid': kid, 'use': 'sig', 'alg': 'RS256'})
+    return pem, public
+
+
+class StandInJWKS(object):
+    '''
+    Local stand-in for the provider's /.well-known/jwks.json, counting the
+    requests it receives and failing with a 500 while `down` is set.
+    '''
+
+    def __init__(self):
+        self.keys = []
+        self.hits = 0
+        self.down = False
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.hits += 1
+                if stand_in.down:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps({'keys': stand_in.keys}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test case"""
+
+    def setUp(self):
+        self.provider = StandInJWKS()
+        self.clock = FakeClock()
+        self.store = JWKSKeyStore(self.provider.url, ttl=600, min_refetch_interval=30,
+                                  clock=self.clock)
+        self.default_store = auth.key_provider
+        auth.key_provider = self.store
+        self.pem, public = generate_key('key-1')
+        self.provider.keys = [public]
+
+    def tearDown(self):
+        auth.key_provider = self.default_store
+        self.provider.close()
+
+    def token(self, pem=None, kid='key-1', **claims):
+        payload = {'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+                   'aud': auth.API_AUDIENCE,
+                   'sub': 'auth0|barista',
+                   'exp': int(time.time()) + 3600,
+                   'permissions': ['get:drinks-detail']}
+        payload.update(claims)
+        return jwt.encode(payload, pem or self.pem, algorithm='RS256', headers={'kid': kid})
+
+    def test_keys_are_fetched_once(self):
+        for _ in range(20):
+            payload = auth.verify_decode_jwt(self.token())
+        self.assertEqual(payload['sub'], 'auth0|barista')
+        self.assertEqual(self.provider.hits, 1)
+
+    def test_invalid_tokens_are_rejected(self):
+        with self.assertRaises(auth.AuthError) as error:
+            auth.verify_decode_jwt(self.token(exp=int(time.time()) - 10))
+        self.assertEqual(error.exception.error['code'], 'token_expired')
+        with self.assertRaises(auth.AuthError) as error:
+            auth.verify_decode_jwt(self.token(aud='someone-else'))
+        self.assertEqual(error.exception.error['code'], 'invalid_claims')
+        forged, _ = generate_key('key-1')
+        with self.assertRaises(auth.AuthError) as error:
+            auth.verify_decode_jwt(self.token(pem=forged))
+        self.assertEqual(error.exception.status_code, 401)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        auth.verify_decode_jwt(self.token())
+        self.clock.now += 31
+        for _ in range(10):
+            with self.assertRaises(auth.AuthError) as error:
+                auth.verify_decode_jwt(self.token(kid='unknown'))
+            self.assertEqual(error.exception.status_code, 401)
+        self.assertEqual(self.provider.hits, 2)
+
+        self.clock.now += 31
+        with self.assertRaises(auth.AuthError):
+            auth.verify_decode_jwt(self.token(kid='unknown'))
+        self.assertEqual(self.provider.hits, 3)
+
+    def test_rotated_key_is_picked_up(self):
+        auth.verify_decode_jwt(self.token())
+        rotated_pem, rotated = generate_key('key-2')
+        self.provider.keys.append(rotated)
+        self.clock.now += 31
+        payload = auth.verify_decode_jwt(self.token(pem=rotated_pem, kid='key-2'))
+        self.assertEqual(payload['sub'], 'auth0|barista')
+        self.assertEqual(self.provider.hits, 2)
+
+    def test_stale_keys_are_served_while_provider_is_down(self):
+        auth.verify_decode_jwt(self.token())
+        self.provider.down = True
+        self.clock.now += 3600
+        for _ in range(5):
+            auth.verify_decode_jwt(self.token())
+            self.store.refresh()
+        self.assertIsNotNone(self.store.last_error)
+        self.assertEqual(auth.verify_decode_jwt(self.token())['sub'], 'auth0|barista')
+
+    def test_ttl_refresh_runs_in_the_background(self):
+        auth.verify_decode_jwt(self.token())
+        rotated_pem, rotated = generate_key('key-2')
+        self.provider.keys = [rotated]
+        self.clock.now += 601
+        # the expired set is still served while the refresh runs
+        auth.verify_decode_jwt(self.token())
+        deadline = time.time() + 5
+        while self.store.get_key('key-2') is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(auth.verify_decode_jwt(self.token(pem=rotated_pem, kid='key-2'))['sub'],
+                         'auth0|barista')
+        self.assertEqual(self.provider.hits, 2)
+
+    def test_provider_down_before_first_fetch(self):
+        self.provider.down = True
+        with self.assertRaises(JWKSUnavailableError):
+            self.store.get_key('key-1')
+        with self.assertRaises(auth.AuthError) as error:
+            auth.verify_decode_jwt(self.token())
+        self.assertEqual(error.exception.status_code, 503)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified-token cache test case"""
+
+    def setUp(self):
+        self.pem, public = generate_key('key-1')
+        self.clock = FakeClock()
+        self.clock.now = time.time()
+        self.default_store, self.default_cache = auth.key_provider, auth.token_cache
+        self.default_verify = auth.verify_decode_jwt
+        auth.key_provider = JWKSKeyStore('local', fetch=lambda url, timeout: {'keys': [public]})
+        auth.token_cache = TokenCache(maxsize=2, clock=self.clock)
+        self.verified = 0
+
+        def counting_verify(token):
+            self.verified += 1
+            return self.default_verify(token)
+        auth.verify_decode_jwt = counting_verify
+
+        app = Flask(__name__)
+
+        @app.route('/drinks-detail')
+        @auth.requires_auth('get:drinks-detail')
+        def drinks_detail(payload):
+            return jsonify({'sub': payload['sub']})
+
+        @app.errorhandler(401)
+        def unauthorized(error):
+            return jsonify({'error': 401}), 401
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        auth.key_provider, auth.token_cache = self.default_store, self.default_cache
+        auth.verify_decode_jwt = self.default_verify
+
+    def token(self, sub='auth0|barista', permissions=('get:drinks-detail',), **claims):
+        payload = {'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+                   'aud': auth.API_AUDIENCE,
+                   'sub': sub,
+                   'iat': int(time.time()) - 60,
+                   'exp': int(time.time()) + 3600,
+                   'permissions': list(permissions)}
+        payload.update(claims)
+        return jwt.encode(payload, self.pem, algorithm='RS256', headers={'kid': 'key-1'})
+
+    def get(self, token):
+        return self.client.get('/drinks-detail', headers={'Authorization': 'Bearer ' + token})
+
+    def test_token_is_verified_once(self):
+        token = self.token()
+        for _ in range(10):
+            res = self.get(token)
+            self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['sub'], 'auth0|barista')
+        self.assertEqual(self.verified, 1)
+        self.assertEqual(auth.token_cache.hits, 9)
+
+        token = self.token(permissions=['post:drinks'])
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(self.verified, 2)
+
+    def test_entries_expire_at_exp_and_are_bounded(self):
+        first = self.token(sub='first')
+        self.get(first)
+        self.clock.now += 3601
+        self.get(first)
+        self.assertEqual(self.verified, 2)
+
+        self.get(self.token(sub='second', exp=int(self.clock.now) + 3600))
+        self.get(self.token(sub='third', exp=int(self.clock.now) + 3600))
+        self.assertEqual(len(auth.token_cache), 2)
+        self.get(first)
+        self.assertEqual(self.verified, 5)
+
+    def test_revoked_tokens_are_refused(self):
+        revoked, other = self.token(), self.token(sub='auth0|manager')
+        self.assertEqual(self.get(revoked).status_code, 200)
+        self.assertEqual(self.get(other).status_code, 200)
+        auth.revoke_token(revoked)
+        self.assertEqual(self.get(revoked).status_code, 401)
+        self.assertEqual(self.get(other).status_code, 200)
+
+        auth.revoke_subject('auth0|manager')
+        self.assertEqual(self.get(other).status_code, 401)
+        fresh = self.token(sub='auth0|manager', iat=int(self.clock.now) + 1)
+        self.assertEqual(self.get(fresh).status_code, 200)
+
+    def test_revocations_are_forgotten_after_expiry(self):
+        cache = auth.token_cache
+        for i in range(10):
+            cache.revoke('token-{}'.format(i), expires_at=self.clock.now + 60)
+            cache.revoke_subject('subject-{}'.format(i))
+        self.assertTrue(cache.is_revoked(b'', {'sub': 'subject-0', 'iat': 0}))
+
+        self.clock.now += cache.max_lifetime
+        self.assertFalse(cache.is_revoked(b'', {'sub': 'subject-0', 'iat': 0}))
+        self.assertEqual((cache._revoked, cache._revoked_subjects), ({}, {}))
+
+
+class KeyProviderTestCase(unittest.TestCase):
+    """This class represents the key provider test case"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.issuer = TestIssuer('https://' + auth.AUTH0_DOMAIN + '/', auth.API_AUDIENCE)
+        self.default_provider, self.default_algorithms = auth.key_provider, auth.ALGORITHMS
+        auth.ALGORITHMS = ['RS256', 'ES256']
+
+    def tearDown(self):
+        auth.key_provider, auth.ALGORITHMS = self.default_provider, self.default_algorithms
+        self.tmp.cleanup()
+
+    def test_issuer_mints_rs256_and_es256_tokens(self):
+        auth.key_provider = self.issuer
+        for algorithm in ('RS256', 'ES256'):
+            token = self.issuer.mint(['post:drinks'], sub='auth0|manager', algorithm=algorithm)
+            self.assertEqual(jwt.get_unverified_header(token)['alg'], algorithm)
+            payload = auth.verify_decode_jwt(token)
+            self.assertEqual(payload['permissions'], ['post:drinks'])
+
+        auth.ALGORITHMS = ['RS256']
+        with self.assertRaises(auth.AuthError):
+            auth.verify_decode_jwt(self.issuer.mint(algorithm='ES256'))
+
+    def test_issuer_keys_file_is_shared(self):
+        path = os.path.join(self.tmp.name, 'issuer.json')
+        server = make_key_provider('issuer', auth.AUTH0_DOMAIN, auth.API_AUDIENCE,
+                                   {'AUTH_ISSUER_KEYS': path})
+        client = TestIssuer(server.issuer, server.audience, keys_file=path)
+        auth.key_provider = server
+        self.assertEqual(auth.verify_decode_jwt(client.mint(sub='load-test'))['sub'], 'load-test')
+
+    def test_local_jwks_file_is_reloaded(self):
+        path = os.path.join(self.tmp.name, 'jwks.json')
+        with open(path, 'w') as jwks:
+            json.dump(self.issuer.jwks(), jwks)
+        clock = FakeClock()
+        auth.key_provider = LocalJWKSFile(path, clock=clock)
+        self.assertEqual(auth.verify_decode_jwt(self.issuer.mint(algorithm='ES256'))['sub'],
+                         'test|user')
+
+        rotated = TestIssuer(self.issuer.issuer, self.issuer.audience)
+        with open(path, 'w') as jwks:
+            json.dump(rotated.jwks(), jwks)
+        os.utime(path, ns=(0, 1))
+        with self.assertRaises(auth.AuthError):
+            auth.verify_decode_jwt(rotated.mint())
+        clock.now += 1
+        self.assertEqual(auth.verify_decode_jwt(rotated.mint())['sub'], 'test|user')
+
+        with open(path, 'w') as jwks:
+            jwks.write('{broken')
+        clock.now += 1
+        self.assertEqual(auth.verify_decode_jwt(rotated.mint())['sub'], 'test|user')
+
+    def test_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            make_key_provider('ldap', auth.AUTH0_DOMAIN, auth.API_AUDIENCE, {})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
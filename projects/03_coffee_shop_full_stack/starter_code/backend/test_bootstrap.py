@@ -0,0 +1,98 @@
+import fcntl
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# boots the app the way a worker does (importing src.api) and prints the menu
+BOOT = '''
+import json
+from src.api import app
+from src.database.models import Drink
+with app.app_context():
+    print(json.dumps([drink.long() for drink in Drink.query.order_by(Drink.id)]))
+'''
+
+
+class BootstrapTestCase(unittest.TestCase):
+    """This class represents the startup bootstrap test case"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'coffee.db')
+        self.env = dict(os.environ, DATABASE_URL='sqlite:///' + self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def start(self):
+        return subprocess.Popen([sys.executable, '-c', BOOT], cwd=BACKEND_DIR, env=self.env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def boot(self):
+        worker = self.start()
+        out, err = worker.communicate(timeout=60)
+        self.assertEqual(worker.returncode, 0, err.decode())
+        return json.loads(out)
+
+    def execute(self, sql, *params):
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute(sql, params).fetchall()
+
+    def test_data_survives_restarts(self):
+        self.assertEqual(self.boot(), [])
+        self.execute('INSERT INTO drink (title, recipe) VALUES (?, ?)', 'matcha shake',
+                     json.dumps([{'name': 'matcha', 'color': 'green', 'parts': 1}]))
+
+        for _ in range(2):
+            drinks = self.boot()
+        self.assertEqual(drinks, [{'id': 1, 'title': 'matcha shake',
+                                   'recipe': [{'name': 'matcha', 'color': 'green', 'parts': 1}]}])
+
+    def test_seeding_is_explicit(self):
+        self.env['SEED_DATABASE'] = '1'
+        self.assertEqual([drink['title'] for drink in self.boot()], ['water'])
+        self.execute("DELETE FROM drink WHERE title = 'water'")
+        # the last drink deleted stays deleted once the flag is off
+        del self.env['SEED_DATABASE']
+        self.assertEqual(self.boot(), [])
+
+        seed = subprocess.run([sys.executable, '-m', 'flask', 'seed-drinks'], cwd=BACKEND_DIR,
+                              env=dict(self.env, FLASK_APP='src.api'), capture_output=True)
+        self.assertEqual(seed.returncode, 0, seed.stderr.decode())
+        self.assertEqual(self.execute('SELECT title FROM drink'), [('water',)])
+
+    def test_concurrent_boots(self):
+        self.env['SEED_DATABASE'] = '1'
+        workers = [self.start() for _ in range(6)]
+        for worker in workers:
+            out, err = worker.communicate(timeout=60)
+            self.assertEqual(worker.returncode, 0, err.decode())
+        self.assertEqual(self.execute('SELECT title FROM drink'), [('water',)])
+        self.assertEqual(self.execute('SELECT version_num FROM alembic_version'), [('a7d3c9e5f140',)])
+
+    def test_legacy_database_is_migrated(self):
+        # the schema db_drop_and_create_all() used to create
+        self.execute('CREATE TABLE drink (id INTEGER NOT NULL, title VARCHAR(80), '
+                     'recipe VARCHAR(180) NOT NULL, PRIMARY KEY (id), UNIQUE (title))')
+        self.execute('INSERT INTO drink (title, recipe) VALUES (?, ?)', 'latte',
+                     json.dumps([{'name': 'milk', 'color': 'white', 'parts': 3}]))
+        self.assertEqual(self.boot(), [{'id': 1, 'title': 'latte',
+                                        'recipe': [{'name': 'milk', 'color': 'white', 'parts': 3}]}])
+
+    def test_ready_database_boots_without_the_lock(self):
+        self.env['SEED_DATABASE'] = '1'
+        self.boot()
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.assertEqual([drink['title'] for drink in self.boot()], ['water'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from src.forecast import PartsMatrix, usage_matrix, seasonal_forecast, parse_hour, format_hour
+
+
+class ForecastTestCase(unittest.TestCase):
+    """This class represents the ingredient forecast test case"""
+
+    def setUp(self):
+        # drinks 3, 7 and 9 over espresso, milk and water
+        self.matrix = PartsMatrix(np.array([3, 7, 9]), ['espresso', 'milk', 'water'],
+                                  np.array([[1., 3., 0.], [2., 0., 0.], [0., 0., 1.]]))
+
+    def test_usage_matches_a_loop_over_orders(self):
+        random = np.random.RandomState(7)
+        orders = np.column_stack([random.randint(96, 168, 5000),
+                                  random.choice([3, 7, 9, 11], 5000),
+                                  np.ones(5000, dtype=np.int64)])
+        # days 4 and 5; the orders of day 6 and of drink 11 are left out
+        usage = usage_matrix(orders, self.matrix, 4, 2, 24)
+
+        expected = np.zeros((2, 3))
+        parts = dict(zip([3, 7, 9], self.matrix.parts))
+        for hour, drink_id, count in orders:
+            if drink_id in parts and hour // 24 < 6:
+                expected[hour // 24 - 4] += count * parts[drink_id]
+        np.testing.assert_allclose(usage, expected)
+
+    def test_seasonal_forecast(self):
+        # a season of 2 periods: the forecast repeats the mean of each slot
+        usage = np.array([[1., 0.], [4., 2.], [3., 0.], [6., 2.]])
+        forecast = seasonal_forecast(usage, 10, 3, 2)
+        np.testing.assert_allclose(forecast, [[2., 0.], [5., 2.], [2., 0.]])
+
+    def test_hours(self):
+        self.assertEqual(parse_hour('1970-01-02T01:59:59Z'), 25)
+        self.assertEqual(parse_hour('1970-01-02T03:30+02:00'), 25)
+        self.assertIsNone(parse_hour('yesterday'))
+        self.assertEqual(format_hour(25), '1970-01-02T01:00:00+00:00')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+from src.database.models import db, setup_db, Drink
+from src.menu_cache import MenuCache, menu_cache, menu_version
+
+RECIPE = [{'name': 'water', 'color': 'blue', 'parts': 1}]
+
+
+class MenuCacheTestCase(unittest.TestCase):
+    """This class represents the menu cache test case"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        setup_db(self.app)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        Drink(title='water', recipe=RECIPE).insert()
+
+        @self.app.route('/drinks')
+        def drinks():
+            return menu_cache.response('short')
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        menu_cache.clear()
+
+    def test_menu_is_built_once_per_version(self):
+        builds = menu_cache.builds
+        res = self.client.get('/drinks')
+        self.assertEqual(json.loads(res.data)['drinks'],
+                         [{'id': 1, 'title': 'water', 'recipe': [{'color': 'blue', 'parts': 1}]}])
+        self.client.get('/drinks')
+        self.assertEqual(menu_cache.builds, builds + 1)
+
+        Drink(title='tea', recipe=RECIPE).insert()
+        self.assertEqual(len(json.loads(self.client.get('/drinks').data)['drinks']), 2)
+        drink = Drink.query.get(1)
+        drink.title = 'sparkling water'
+        drink.update()
+        self.assertEqual(json.loads(self.client.get('/drinks').data)['drinks'][0]['title'],
+                         'sparkling water')
+        Drink.query.get(2).delete()
+        self.assertEqual(len(json.loads(self.client.get('/drinks').data)['drinks']), 1)
+        self.assertEqual(menu_cache.builds, builds + 4)
+
+    def test_unchanged_menu_is_not_modified(self):
+        res = self.client.get('/drinks')
+        etag = res.headers['ETag']
+        res = self.client.get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        Drink(title='tea', recipe=RECIPE).insert()
+        res = self.client.get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_version_is_shared_and_transactional(self):
+        # another worker's cache, built before the write
+        other = MenuCache()
+        etag = other.get('short')[1]
+        version = menu_version()
+        db.session.add(Drink(title='tea', recipe=RECIPE))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(menu_version(), version)
+
+        Drink(title='tea', recipe=RECIPE).insert()
+        self.assertNotEqual(menu_version(), version)
+        body, new_etag = other.get('short')
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(len(json.loads(body)['drinks']), 2)
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def slow_build():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'short': [], 'long': []}
+
+        versions = ['1']
+        cache = MenuCache(slow_build, lambda: versions[-1])
+        threads = [threading.Thread(target=cache.get, args=('short',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        versions.append('2')
+        self.assertEqual(cache.get('long')[0], b'{"success":true,"drinks":[]}')
+        self.assertEqual(len(calls), 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
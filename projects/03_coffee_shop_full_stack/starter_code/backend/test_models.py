@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from flask import Flask
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from src.database import models
+from src.database.models import db, setup_db, Drink
+
+RECIPE = [{'name': 'water', 'color': 'blue', 'parts': 1}]
+
+
+class EngineProfileTestCase(unittest.TestCase):
+    """This class represents the SQLite engine profile test case"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'coffee.db')
+        self.app = Flask(__name__)
+        setup_db(self.app, 'sqlite:///' + self.path)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.default_pragmas = models.SQLITE_PRAGMAS
+
+    def tearDown(self):
+        models.SQLITE_PRAGMAS = self.default_pragmas
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        self.ctx.pop()
+        self.tmp.cleanup()
+
+    def hold_write_lock(self, seconds):
+        # another process-like writer holding the database for a while
+        locked = threading.Event()
+
+        def writer():
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute('BEGIN IMMEDIATE')
+            locked.set()
+            time.sleep(seconds)
+            connection.execute('COMMIT')
+            connection.close()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        locked.wait()
+        return thread
+
+    def test_pragmas_and_pool(self):
+        engine = db.get_engine(self.app)
+        self.assertIsInstance(engine.pool, QueuePool)
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(connection.execute('PRAGMA busy_timeout').scalar(), 5000)
+            self.assertEqual(connection.execute('PRAGMA synchronous').scalar(), 1)
+
+    def test_busy_writes_are_retried(self):
+        db.get_engine(self.app).dispose()
+        models.SQLITE_PRAGMAS = [('busy_timeout', 50)] + self.default_pragmas[1:]
+
+        writer = self.hold_write_lock(0.3)
+        drink = Drink(title='water', recipe=RECIPE)
+        drink.insert()
+        writer.join()
+        self.assertEqual(Drink.query.one().long(), {'id': 1, 'title': 'water', 'recipe': RECIPE})
+
+        writer = self.hold_write_lock(0.3)
+        drink.title = 'sparkling water'
+        drink.update()
+        writer.join()
+        db.session.remove()
+        self.assertEqual(Drink.query.one().title, 'sparkling water')
+
+        writer = self.hold_write_lock(0.3)
+        Drink.query.one().delete()
+        writer.join()
+        self.assertEqual(Drink.query.count(), 0)
+
+    def test_failed_writes_are_rolled_back(self):
+        Drink(title='water', recipe=RECIPE).insert()
+        with self.assertRaises(exc.IntegrityError):
+            Drink(title='water', recipe=RECIPE).insert()
+        with self.assertRaises(TypeError):
+            Drink(title='tea', recipe=[RECIPE[0]['name']]).insert()
+        Drink(title='juice', recipe=RECIPE).insert()
+        self.assertEqual([drink.title for drink in Drink.query.order_by(Drink.id)],
+                         ['water', 'juice'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
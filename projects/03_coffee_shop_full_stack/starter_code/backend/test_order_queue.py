@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from sqlalchemy import exc
+
+from src.order_queue import OrderQueue, QueueFull
+
+
+class OrderQueueTestCase(unittest.TestCase):
+    """This class represents the order queue test case"""
+
+    def setUp(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, orders, committed_at):
+        self.release.wait()
+        self.batches.append([order['id'] for order in orders])
+
+    def test_orders_are_committed_in_groups(self):
+        orders = OrderQueue(self.write, maxsize=100, batch_size=10, max_latency=0.2)
+        ids = [orders.submit(1)['id'] for _ in range(25)]
+        self.assertEqual(orders.status(ids[0])['status'], 'queued')
+        orders.drain()
+        self.assertEqual([len(batch) for batch in self.batches], [10, 10, 5])
+        self.assertEqual(sum(self.batches, []), ids)
+        self.assertIsNone(orders.status(ids[0]))
+        orders.close()
+
+    def test_latency_budget(self):
+        orders = OrderQueue(self.write, maxsize=100, batch_size=100, max_latency=0.05)
+        start = time.monotonic()
+        orders.submit(1)
+        orders.drain()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(len(self.batches), 1)
+        orders.close()
+
+    def test_full_queue_refuses_orders(self):
+        self.release.clear()
+        orders = OrderQueue(self.write, maxsize=3, batch_size=1, max_latency=0)
+        orders.submit(1)
+        time.sleep(0.05)  # the writer holds the first order
+        for _ in range(3):
+            orders.submit(1)
+        with self.assertRaises(QueueFull):
+            orders.submit(1)
+        self.assertEqual(orders.rejected, 1)
+        self.release.set()
+        orders.drain()
+        self.assertEqual(orders.written, 4)
+        orders.close()
+
+    def test_failed_group(self):
+        def fail(orders, committed_at):
+            raise RuntimeError('database is gone')
+
+        orders = OrderQueue(fail, maxsize=10, batch_size=10, max_latency=0)
+        order = orders.submit(2, 3)
+        orders.drain()
+        self.assertEqual(orders.status(order['id'])['status'], 'failed')
+        self.assertIsInstance(orders.last_error, RuntimeError)
+        self.assertEqual(orders.retries, 0)
+        orders.close()
+
+        locked = exc.OperationalError('INSERT', {}, Exception('database is locked'))
+        attempts = []
+
+        def locked_once(orders, committed_at):
+            attempts.append(committed_at)
+            if len(attempts) == 1:
+                raise locked
+            self.write(orders, committed_at)
+
+        orders = OrderQueue(locked_once, maxsize=10, batch_size=10, max_latency=0,
+                            stored=lambda ids: set())
+        order = orders.submit(2, 3)
+        orders.drain()
+        self.assertEqual(len(attempts), 2)
+        self.assertIsNone(orders.status(order['id']))
+        self.assertEqual(self.batches, [[order['id']]])
+        self.assertEqual((orders.written, orders.retries), (1, 1))
+        orders.close()
+
+        # the first attempt committed one order before losing the connection
+        committed = set()
+
+        def lost_after_commit(orders, committed_at):
+            attempts.append(committed_at)
+            if not committed:
+                committed.add(orders[0]['id'])
+                raise exc.OperationalError('COMMIT', {}, Exception('server closed the connection'))
+            self.write(orders, committed_at)
+
+        self.batches = []
+        orders = OrderQueue(lost_after_commit, maxsize=10, batch_size=10, max_latency=0.2,
+                            stored=lambda ids: committed & set(ids))
+        ids = [orders.submit(2)['id'] for _ in range(3)]
+        orders.drain()
+        self.assertEqual(self.batches, [ids[1:]])
+        self.assertEqual([orders.status(order_id) for order_id in ids], [None] * 3)
+        orders.close()
+
+        def always_locked(orders, committed_at):
+            raise locked
+
+        with mock.patch('src.order_queue.GROUP_RETRY_DELAY', 0):
+            orders = OrderQueue(always_locked, maxsize=10, batch_size=10, max_latency=0,
+                                stored=lambda ids: set())
+            order = orders.submit(2, 3)
+            orders.drain()
+        self.assertEqual(orders.status(order['id'])['status'], 'failed')
+        self.assertEqual(orders.retries, 3)
+        orders.close()
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()